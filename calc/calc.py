@@ -1,18 +1,67 @@
+import os
+import re
+import functools
 import tkinter as tk
-from tkinter import ttk, messagebox
-import sympy as sp
+from tkinter import ttk, messagebox, filedialog
 import pyperclip
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-# --- 1. 計算で使うシンボルの定義 ---
-x, y, z, t = sp.symbols('x y z t')
-k, m, n = sp.symbols('k m n', integer=True)
-a, b, c = sp.symbols('a b c', real=True)
-theta, phi, omega = sp.symbols('theta phi omega')
-hbar = sp.Symbol('hbar')
-epsilon = sp.Symbol('epsilon')
+
+from startup import BackgroundImport, bench_enabled, bench_window, bench_finish
+
+# sympy / numpy / matplotlib は読み込みに数秒かかるので、
+# ウィンドウを出した後に別スレッドの import_heavy() で読み込む。使う関数の先頭で heavy.wait() すること
+sp = np = plt = FigureCanvasTkAgg = NavigationToolbar2Tk = None
+SymbolicWorker = StagedRun = EXACT_STAGES = plotengine = numlinalg = sweep = None
+sym_cache = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 記号計算の結果を次回の起動でも使えるように保存する (None なら保存しない)
+CACHE_FILE = os.path.join(SCRIPT_DIR, "cache", "symbolic.pickle")
+# 積分・極限・対角化は別プロセスで計算し、1段階あたりこの秒数で次の方法に切り替える
+DEFAULT_TIMEOUT = 10
+POLL_MS = 100
+# 入力グリッドの最大サイズ (これより大きい行列は CSV・クリップボードから取り込む)
+GRID_MAX = 5
+# 行列の計算方法。自動: 記号が無く小数を含むか大きい行列は numpy、それ以外は厳密 / 数値: 記号に値を代入して numpy
+MATRIX_MODES = ("自動", "厳密", "数値")
+
+def import_heavy():
+    """sympy などの読み込みと、計算で使うシンボルの定義 (バックグラウンドスレッドで実行。Tk には触らない)"""
+    global sp, np, plt, FigureCanvasTkAgg, NavigationToolbar2Tk, SymbolicWorker, StagedRun, EXACT_STAGES, plotengine, numlinalg, sweep
+    global sym_cache
+    global x, y, z, t, k, m, n, a, b, c, theta, phi, omega, hbar, epsilon
+    import sympy as sp
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    from symcache import SymCache
+    from symworker import SymbolicWorker, StagedRun, EXACT_STAGES
+    import plotengine
+    import numlinalg
+    import sweep
+
+    # --- 1. 計算で使うシンボルの定義 ---
+    x, y, z, t = sp.symbols('x y z t')
+    k, m, n = sp.symbols('k m n', integer=True)
+    a, b, c = sp.symbols('a b c', real=True)
+    theta, phi, omega = sp.symbols('theta phi omega')
+    hbar = sp.Symbol('hbar')
+    epsilon = sp.Symbol('epsilon')
+
+    # 前回までの計算結果 (同じ式・同じ操作ならすぐに返す)
+    sym_cache = SymCache(path=CACHE_FILE)
+    sym_cache.load()
+
+heavy = BackgroundImport(import_heavy)
+
+@functools.lru_cache(maxsize=256)
+def sympify_text(txt, matrix=False):
+    """入力欄の文字列を式にする (同じ文字列は解析し直さない)"""
+    # i を sp.I (虚数単位) として追加
+    if matrix:
+        local_dict = {'x':x, 'y':y, 't':t, 'epsilon':epsilon, 'omega':omega, 'hbar':hbar, 'i':sp.I}
+    else:
+        local_dict = {'x':x, 'y':y, 't':t, 'theta':theta, 'omega':omega, 'hbar':hbar, 'pi':sp.pi, 'i':sp.I}
+    return sp.sympify(txt, locals=local_dict)
 
 class ScienceCalcApp:
     def __init__(self, root):
@@ -20,6 +69,13 @@ class ScienceCalcApp:
         self.root.title("Tsukuba Science Calculator (GUI Ver.)")
         self.root.geometry("920x600") # キーパッドを横に配置するため横長に変更
 
+        # 別プロセスでの記号計算 (最初に使う時に起動する)
+        self.worker = None
+        self.running = None # 実行中の (StagedRun, 結果欄, キャッシュのキー, 完了時の処理)
+        self.shown_status = None # 実行中の計算が最後に結果欄に出した途中経過
+        self.poll_id = None
+        self.timeout_var = tk.StringVar(value=str(DEFAULT_TIMEOUT))
+
         # スタイル設定
         style = ttk.Style()
         style.theme_use('clam')
@@ -55,6 +111,11 @@ class ScienceCalcApp:
         # --- 右側: キーパッド設定 ---
         self.setup_shared_keypad(right_frame)
 
+        # 起動計測モードではウィンドウ表示と sympy の読み込み完了を記録して終了する
+        bench_window(self.root)
+        if bench_enabled():
+            heavy.when_ready(self.root, lambda: bench_finish(self.root))
+
     # =========================================
     #  タブ1: 解析学 UI
     # =========================================
@@ -80,7 +141,8 @@ class ScienceCalcApp:
             ("極限 (x→0)", self.calc_limit),
             ("簡約化", self.calc_simplify),
             ("展開", self.calc_expand),
-            ("グラフ描画", self.calc_plot)
+            ("グラフ描画", self.calc_plot),
+            ("パラメータ掃引", self.calc_sweep)
         ]
         
         # 3列で配置
@@ -105,13 +167,26 @@ class ScienceCalcApp:
         
         ttk.Label(size_frame, text="行(Row):").pack(side='left')
         self.rows_var = tk.IntVar(value=2)
-        ttk.Spinbox(size_frame, from_=1, to=5, textvariable=self.rows_var, width=3).pack(side='left', padx=5)
+        ttk.Spinbox(size_frame, from_=1, to=GRID_MAX, textvariable=self.rows_var, width=3).pack(side='left', padx=5)
         
         ttk.Label(size_frame, text="列(Col):").pack(side='left', padx=(10,0))
         self.cols_var = tk.IntVar(value=2)
-        ttk.Spinbox(size_frame, from_=1, to=5, textvariable=self.cols_var, width=3).pack(side='left', padx=5)
+        ttk.Spinbox(size_frame, from_=1, to=GRID_MAX, textvariable=self.cols_var, width=3).pack(side='left', padx=5)
         
         ttk.Button(size_frame, text="グリッド作成", command=self.create_matrix_grid).pack(side='left', padx=20)
+        ttk.Button(size_frame, text="CSV読込", command=self.import_matrix_csv).pack(side='left')
+        ttk.Button(size_frame, text="貼り付け", command=self.paste_matrix).pack(side='left', padx=5)
+
+        # --- 計算方法 (数値モードでは記号に値を代入する) ---
+        mode_frame = ttk.Frame(frame)
+        mode_frame.pack(fill='x', padx=20)
+        ttk.Label(mode_frame, text="計算方法:").pack(side='left')
+        self.mat_mode_var = tk.StringVar(value=MATRIX_MODES[0])
+        ttk.Combobox(mode_frame, values=MATRIX_MODES, textvariable=self.mat_mode_var,
+                     state='readonly', width=6).pack(side='left', padx=5)
+        ttk.Label(mode_frame, text="記号の値:").pack(side='left', padx=(10, 0))
+        self.subs_entry = ttk.Entry(mode_frame, font=("Consolas", 11))
+        self.subs_entry.pack(side='left', fill='x', expand=True, padx=5)
 
         # --- マトリクス入力グリッド ---
         self.grid_frame = ttk.LabelFrame(frame, text="行列入力 (キーパッド使用可)", padding=10)
@@ -150,6 +225,7 @@ class ScienceCalcApp:
         rows = self.rows_var.get()
         cols = self.cols_var.get()
         self.matrix_entries = []
+        self.imported_matrix = None # CSV・クリップボードから取り込んだ大きな行列
 
         for r in range(rows):
             row_entries = []
@@ -159,6 +235,43 @@ class ScienceCalcApp:
                 row_entries.append(entry)
             self.matrix_entries.append(row_entries)
 
+    def import_matrix_csv(self):
+        path = filedialog.askopenfilename(title="行列の読み込み",
+                                          filetypes=[("CSV / TSV", "*.csv *.tsv *.txt"), ("All files", "*.*")])
+        if not path: return
+        try:
+            with open(path, encoding='utf-8-sig') as f:
+                self.load_matrix_text(f.read())
+        except Exception as e:
+            messagebox.showerror("Error", f"読み込みエラー: {e}")
+
+    def paste_matrix(self):
+        try: self.load_matrix_text(pyperclip.paste())
+        except Exception as e: messagebox.showerror("Error", f"貼り付けエラー: {e}")
+
+    def load_matrix_text(self, text):
+        """CSV / TSV / 空白区切りの行列を取り込む (グリッドに収まらなければグリッドを使わずに保持する)"""
+        heavy.wait()
+        rows = numlinalg.parse_table(text)
+        self.rows_var.set(min(len(rows), GRID_MAX))
+        self.cols_var.set(min(len(rows[0]), GRID_MAX))
+        self.create_matrix_grid()
+        if len(rows) <= GRID_MAX and len(rows[0]) <= GRID_MAX:
+            for entry_row, row in zip(self.matrix_entries, rows):
+                for entry, cell in zip(entry_row, row):
+                    entry.insert(0, cell)
+            return
+
+        # 数値だけなら numpy の配列のまま持つ (sympy の行列にすると大きな行列で遅い)
+        matrix = numlinalg.table_to_array(rows)
+        if matrix is None:
+            matrix = sp.Matrix([[sympify_text(cell or "0", matrix=True) for cell in row] for row in rows])
+        for widget in self.grid_frame.winfo_children():
+            widget.destroy()
+        self.matrix_entries = []
+        self.imported_matrix = matrix
+        ttk.Label(self.grid_frame, text=f"取り込んだ行列: {len(rows)}×{len(rows[0])} (グリッド作成で解除)").grid(row=0, column=0)
+
     # =========================================
     #  共通: 入力キーパッド (右側に配置)
     # =========================================
@@ -239,76 +352,172 @@ class ScienceCalcApp:
         ttk.Button(latex_frame, text="Copy", width=6,
                    command=lambda: self.copy_to_clipboard(latex_var.get())).pack(side='right')
 
+        # 重い計算の中止と、1段階あたりの制限時間 (過ぎたら次の方法に切り替える)
+        run_frame = ttk.Frame(res_frame)
+        run_frame.pack(fill='x')
+        cancel_btn = ttk.Button(run_frame, text="中止", width=6, command=self.cancel_symbolic, state='disabled')
+        cancel_btn.pack(side='left')
+        ttk.Label(run_frame, text="制限時間 (秒/段階):").pack(side='left', padx=(10, 0))
+        ttk.Spinbox(run_frame, from_=1, to=600, width=5, textvariable=self.timeout_var).pack(side='left', padx=5)
+
         setattr(self, f"{prefix}_res_var", res_var)
         setattr(self, f"{prefix}_latex_var", latex_var)
+        setattr(self, f"{prefix}_cancel_btn", cancel_btn)
+
+    # =========================================
+    #  共通: 別プロセスでの記号計算
+    # =========================================
+    def run_symbolic(self, prefix, cache_op, cache_arg, op, args, on_done):
+        """op を段階ごとに別プロセスで計算し、途中経過を結果欄に出す (結果は on_done に渡す)
+
+        同じ式・同じ操作の結果が覚えてあればすぐに返す。新しい計算を始めると前の計算は止める。
+        覚えておくのは厳密な段階の結果だけで、数値計算の段階で求まった時はそのことを結果欄に書き足す。
+        """
+        key = sym_cache.make_key(cache_op, cache_arg)
+        result = sym_cache.get(key)
+        if result is not None:
+            on_done(result)
+            return
+        self.cancel_symbolic()
+        try:
+            timeout = max(1.0, float(self.timeout_var.get()))
+        except ValueError:
+            timeout = DEFAULT_TIMEOUT
+        if self.worker is None:
+            self.worker = SymbolicWorker()
+        self.running = (StagedRun(self.worker, op, args, timeout), prefix, key, on_done)
+        self.shown_status = None
+        getattr(self, f"{prefix}_cancel_btn").config(state='normal')
+        self.poll_symbolic()
+
+    def poll_symbolic(self):
+        self.poll_id = None
+        run, prefix, key, on_done = self.running
+        res_var = getattr(self, f"{prefix}_res_var")
+        if self.shown_status is not None and res_var.get() != self.shown_status:
+            # 計算中に同じ結果欄へ別の結果が出た (微分などをした): 古い計算の結果で上書きしない
+            self.cancel_symbolic(show=False)
+            return
+        try:
+            result = run.poll()
+        except Exception as e:
+            result = ('error', str(e), None)
+        if result is None:
+            self.shown_status = run.status()
+            res_var.set(self.shown_status)
+            self.poll_id = self.root.after(POLL_MS, self.poll_symbolic)
+            return
+
+        self.running = None
+        self.shown_status = None
+        getattr(self, f"{prefix}_cancel_btn").config(state='disabled')
+        kind, value, stage = result
+        if kind != 'ok':
+            res_var.set(f"Error: {value}")
+            return
+        if stage in EXACT_STAGES:
+            sym_cache.put(key, value)
+        try: on_done(value)
+        except Exception as e:
+            res_var.set(f"Error: {e}")
+            return
+        if stage not in EXACT_STAGES:
+            res_var.set(f"{res_var.get()}  ({stage} による数値解)")
+
+    def cancel_symbolic(self, show=True):
+        """実行中の計算をプロセスごと止める"""
+        if self.running is None: return
+        run, prefix, _, _ = self.running
+        self.running = None
+        self.shown_status = None
+        run.cancel()
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        getattr(self, f"{prefix}_cancel_btn").config(state='disabled')
+        if show:
+            getattr(self, f"{prefix}_res_var").set(f"中止しました ({run.elapsed():.1f} 秒)")
 
     # =========================================
     #  ロジック: 解析学
     # =========================================
     def get_expr(self):
+        heavy.wait()
         txt = self.expr_entry.get()
         if not txt:
             return sp.Integer(0)
         txt = txt.replace('^', '**')
-        # i を sp.I (虚数単位) として追加
-        local_dict = {'x':x, 'y':y, 't':t, 'theta':theta, 'omega':omega, 'hbar':hbar, 'pi':sp.pi, 'i':sp.I}
-        return sp.sympify(txt, locals=local_dict)
+        return sympify_text(txt)
+
+    def cached(self, op, func, *args):
+        """入力欄の式 (args が無ければ) に func を適用する。同じ式・同じ操作の結果は覚えておく"""
+        if not args:
+            args = (self.get_expr(),)
+        return sym_cache.compute(op, args, lambda: func(*args))
 
     def update_ana_result(self, result):
         self.ana_res_var.set(str(result))
         self.ana_latex_var.set(sp.latex(result))
 
     def calc_diff(self):
-        try: self.update_ana_result(sp.diff(self.get_expr(), x))
+        try: self.update_ana_result(self.cached('diff', lambda expr: sp.diff(expr, x)))
         except Exception as e: self.ana_res_var.set(f"Error: {e}")
 
     def calc_integrate(self):
-        try: self.update_ana_result(sp.integrate(self.get_expr(), x))
+        try:
+            expr = self.get_expr()
+            self.run_symbolic("ana", 'integrate', expr, 'integrate', (expr, x, ()), self.update_ana_result)
         except Exception as e: self.ana_res_var.set(f"Error: {e}")
     
     def calc_definite_integrate(self):
-        try: self.update_ana_result(sp.integrate(self.get_expr(), (x, 0, sp.oo)))
+        try:
+            expr = self.get_expr()
+            self.run_symbolic("ana", 'definite_integrate', expr, 'integrate', (expr, x, (0, sp.oo)),
+                              self.update_ana_result)
         except Exception as e: self.ana_res_var.set(f"Error: {e}")
 
     def calc_limit(self):
-        try: self.update_ana_result(sp.limit(self.get_expr(), x, 0))
+        try:
+            expr = self.get_expr()
+            self.run_symbolic("ana", 'limit', expr, 'limit', (expr, x, 0), self.update_ana_result)
         except Exception as e: self.ana_res_var.set(f"Error: {e}")
         
     def calc_simplify(self):
-        try: self.update_ana_result(sp.simplify(self.get_expr()))
+        try: self.update_ana_result(self.cached('simplify', lambda expr: sp.simplify(expr)))
         except Exception as e: self.ana_res_var.set(f"Error: {e}")
 
     def calc_expand(self):
-        try: self.update_ana_result(sp.expand(self.get_expr()))
+        try: self.update_ana_result(self.cached('expand', lambda expr: sp.expand(expr)))
         except Exception as e: self.ana_res_var.set(f"Error: {e}")
 
     def calc_plot(self):
-        """グラフ描画機能"""
+        """グラフ描画機能 (パン・ズームすると表示範囲に合わせて評価し直す)"""
         try:
             expr = self.get_expr()
             
             try:
-                f = sp.lambdify(x, expr, "numpy")
+                f = plotengine.compile_function(expr, x)
             except Exception:
                 messagebox.showerror("Error", "プロットできるのは変数xを含む式のみです。")
                 return
 
-            plot_window = tk.Toplevel(self.root)
-            plot_window.title("Graph Plot")
-            plot_window.geometry("600x450")
-
-            x_val = np.linspace(-10, 10, 400)
+            # 評価した点は曲線ごとに覚えておき、新しく見えた区間・粗い所だけを評価する
+            curve = plotengine.AdaptiveCurve(f)
             try:
-                y_val = f(x_val)
-                if np.isscalar(y_val):
-                    y_val = np.full_like(x_val, y_val)
+                x_val, y_val, ylim = curve.sample(-10, 10)
             except Exception as e:
                 messagebox.showerror("Error", f"計算エラー: 実数範囲で定義されていない可能性があります。\n{e}")
-                plot_window.destroy()
                 return
 
-            fig, ax = plt.subplots(figsize=(6, 4))
-            ax.plot(x_val, y_val, label=f"y = {sp.latex(expr)}")
+            plot_window = tk.Toplevel(self.root)
+            plot_window.title("Graph Plot")
+            plot_window.geometry("600x450")
+
+            fig = plt.Figure(figsize=(6, 4))
+            ax = fig.add_subplot()
+            line, = ax.plot(x_val, y_val, label=f"y = {sp.latex(expr)}")
+            ax.set_xlim(-10, 10)
+            ax.set_ylim(ylim)
             ax.axhline(0, color='black', linewidth=0.5)
             ax.axvline(0, color='black', linewidth=0.5)
             ax.grid(True, linestyle=':', alpha=0.6)
@@ -318,74 +527,257 @@ class ScienceCalcApp:
             ax.set_title(f"Plot: {str(expr)}")
 
             canvas = FigureCanvasTkAgg(fig, master=plot_window)
-            canvas.draw()
+            toolbar = NavigationToolbar2Tk(canvas, plot_window)
+            toolbar.update()
             canvas.get_tk_widget().pack(fill='both', expand=True)
 
+            pending = []
+            def resample():
+                pending.clear()
+                lo, hi = ax.get_xlim()
+                try:
+                    xs, ys, _ = curve.sample(lo, hi, width_px=max(ax.bbox.width, 1),
+                                             height_px=max(ax.bbox.height, 1), ylim=ax.get_ylim())
+                except Exception:
+                    return # 途中の範囲で評価できなくても、前の線を残す
+                line.set_data(xs, ys)
+                canvas.draw_idle()
+            def on_xlim_changed(ax):
+                # ドラッグ中の連続したイベントは1回の評価にまとめる
+                if not pending:
+                    pending.append(plot_window.after_idle(resample))
+            ax.callbacks.connect('xlim_changed', on_xlim_changed)
+            ax.callbacks.connect('ylim_changed', on_xlim_changed)
+            canvas.draw()
+
         except Exception as e:
             messagebox.showerror("Error", f"描画エラー: {e}")
 
+    def calc_sweep(self):
+        """パラメータ掃引: 式の記号を1つか2つ選んで格子上で評価し、グラフ (1次元) かヒートマップ (2次元) にする"""
+        try:
+            expr = self.get_expr()
+        except Exception as e:
+            messagebox.showerror("Error", f"入力エラー: {e}")
+            return
+        symbols = sorted(expr.free_symbols, key=str)
+        if not symbols:
+            messagebox.showerror("Error", "掃引できる記号がありません (omega, theta などを含む式を入力してください)")
+            return
+        names = [str(s) for s in symbols]
+        NONE = "(なし)"
+
+        sweep_window = tk.Toplevel(self.root)
+        sweep_window.title(f"Parameter Sweep: {expr}")
+        sweep_window.geometry("720x620")
+
+        # --- 軸の設定 (記号・開始・終了・点数) ---
+        form = ttk.Frame(sweep_window, padding=5)
+        form.pack(fill='x')
+        axis_vars = []
+        defaults = [("横軸", names, names[0]),
+                    ("縦軸", [NONE] + names, names[1] if len(names) > 1 else NONE)]
+        for row, (label, choices, default) in enumerate(defaults):
+            ttk.Label(form, text=label).grid(row=row, column=0, sticky='w')
+            sym_var = tk.StringVar(value=default)
+            ttk.Combobox(form, values=choices, textvariable=sym_var, state='readonly', width=8).grid(row=row, column=1, padx=5)
+            range_vars = []
+            for col, (text, value) in enumerate([("開始", "0"), ("終了", "10"), ("点数", "1000")]):
+                ttk.Label(form, text=text).grid(row=row, column=2 + 2 * col, padx=(5, 0))
+                var = tk.StringVar(value=value)
+                ttk.Entry(form, textvariable=var, width=8).grid(row=row, column=3 + 2 * col, padx=3, pady=2)
+                range_vars.append(var)
+            axis_vars.append((sym_var, *range_vars))
+        ttk.Label(form, text="その他の記号の値:").grid(row=2, column=0, columnspan=2, sticky='w')
+        fixed_entry = ttk.Entry(form, font=("Consolas", 11))
+        fixed_entry.grid(row=2, column=2, columnspan=6, sticky='ew', padx=3, pady=2)
+        form.columnconfigure(7, weight=1)
+
+        button_frame = ttk.Frame(sweep_window, padding=(5, 0))
+        button_frame.pack(fill='x')
+        status_var = tk.StringVar()
+
+        fig = plt.Figure(figsize=(6, 4.5))
+        canvas = FigureCanvasTkAgg(fig, master=sweep_window)
+        toolbar = NavigationToolbar2Tk(canvas, sweep_window)
+        toolbar.update()
+        canvas.get_tk_widget().pack(fill='both', expand=True)
+
+        last = {}
+        def run():
+            try:
+                axes = []
+                for sym_var, lo_var, hi_var, points_var in axis_vars:
+                    if sym_var.get() == NONE: continue
+                    lo = float(sympify_text(lo_var.get().replace('^', '**')))
+                    hi = float(sympify_text(hi_var.get().replace('^', '**')))
+                    axes.append((symbols[names.index(sym_var.get())], sweep.axis_values(lo, hi, points_var.get())))
+                rest = set(symbols) - {sym for sym, _ in axes}
+                result = sweep.run_sweep(expr, axes, self.numeric_values(fixed_entry.get(), rest))
+            except Exception as e:
+                status_var.set(f"Error: {e}")
+                return
+            last['result'] = result
+            save_btn.config(state='normal')
+            size = "×".join(str(len(values)) for _, values in result.axes)
+            status_var.set(f"{size} 点: {result.elapsed * 1000:.0f} ms")
+
+            fig.clear()
+            ax = fig.add_subplot()
+            if len(result.axes) == 1:
+                (sym, xs), = result.axes
+                ax.plot(xs, result.values)
+                ax.set_xlabel(f"${sp.latex(sym)}$")
+                ax.set_ylabel("value")
+                ax.grid(True, linestyle=':', alpha=0.6)
+            else:
+                (xsym, xs), (ysym, ys) = result.axes
+                image = ax.imshow(result.values, origin='lower', aspect='auto', interpolation='nearest',
+                                  extent=(xs[0], xs[-1], ys[0], ys[-1]))
+                fig.colorbar(image, ax=ax)
+                ax.set_xlabel(f"${sp.latex(xsym)}$")
+                ax.set_ylabel(f"${sp.latex(ysym)}$")
+            ax.set_title(f"Sweep: {str(expr)}")
+            canvas.draw_idle()
+
+        def save():
+            path = filedialog.asksaveasfilename(parent=sweep_window, title="CSV保存", defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv"), ("All files", "*.*")])
+            if not path: return
+            try: last['result'].save_csv(path)
+            except Exception as e: messagebox.showerror("Error", f"保存エラー: {e}", parent=sweep_window)
+
+        ttk.Button(button_frame, text="実行", command=run).pack(side='left')
+        save_btn = ttk.Button(button_frame, text="CSV保存", command=save, state='disabled')
+        save_btn.pack(side='left', padx=5)
+        ttk.Label(button_frame, textvariable=status_var).pack(side='left', padx=10)
+        run()
+
     # =========================================
     #  ロジック: 線形代数
     # =========================================
     def get_matrix(self):
+        heavy.wait()
+        if self.imported_matrix is not None:
+            return self.imported_matrix
         rows = len(self.matrix_entries)
         cols = len(self.matrix_entries[0])
         matrix_data = []
-        
-        # i を sp.I (虚数単位) として追加
-        local_dict = {'x':x, 'y':y, 't':t, 'epsilon':epsilon, 'omega':omega, 'hbar':hbar, 'i':sp.I}
 
         for r in range(rows):
             row_data = []
             for c in range(cols):
                 val_txt = self.matrix_entries[r][c].get()
                 if not val_txt: val_txt = "0"
-                row_data.append(sp.sympify(val_txt, locals=local_dict))
+                row_data.append(sympify_text(val_txt, matrix=True))
             matrix_data.append(row_data)
             
         return sp.Matrix(matrix_data)
 
+    def numeric_values(self, text, symbols):
+        """「記号の値」欄の文字列 (omega=2, hbar=1 など) から symbols に代入する値を読む"""
+        names = {str(s): s for s in symbols}
+        values = {}
+        for item in re.split(r'[,;]', text):
+            if not item.strip(): continue
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise ValueError(f"記号の値は 名前=値 の形で書いてください: {item.strip()}")
+            if name.strip() in names:
+                values[names[name.strip()]] = sympify_text(value.strip(), matrix=True)
+        return values
+
+    def resolve_matrix(self):
+        """計算方法に従って (sympy の行列, None) か (None, numpy の配列) を返す"""
+        M = self.get_matrix()
+        mode = self.mat_mode_var.get()
+        if isinstance(M, np.ndarray):
+            return (sp.Matrix(M), None) if mode == "厳密" else (None, M)
+        if mode == "厳密" or (mode == "自動" and not numlinalg.prefers_numeric(M)):
+            return M, None
+        if M.free_symbols:
+            M = M.subs(self.numeric_values(self.subs_entry.get(), M.free_symbols))
+            if M.free_symbols:
+                raise ValueError("値が決まっていない記号: " + ", ".join(sorted(map(str, M.free_symbols))))
+        return None, numlinalg.to_array(M)
+
     def update_mat_result(self, result):
         self.mat_res_var.set(str(result))
         self.mat_latex_var.set(sp.latex(result))
 
+    def update_mat_array(self, A):
+        """数値計算の結果 (大きな行列は先頭と末尾だけ表示する)"""
+        self.mat_res_var.set(numlinalg.format_matrix(A))
+        self.mat_latex_var.set(numlinalg.latex_matrix(A))
+
     def calc_eigen(self):
         try:
-            M = self.get_matrix()
-            eigenvals = M.eigenvals()
-            res_str = ", ".join([f"λ={sp.simplify(k)} (x{v})" for k, v in eigenvals.items()])
+            M, A = self.resolve_matrix()
+            if A is not None:
+                w = numlinalg.eigvals(A)
+                self.mat_res_var.set(f"λ={numlinalg.format_vector(w)}")
+                self.mat_latex_var.set(numlinalg.latex_vector(w))
+                return
+            eigenvals = self.cached('eigenvals', lambda M: {sp.simplify(k): v for k, v in M.eigenvals().items()}, M)
+            res_str = ", ".join([f"λ={k} (x{v})" for k, v in eigenvals.items()])
             self.mat_res_var.set(res_str)
             
             lat = []
             for val, count in eigenvals.items():
-                lat.append(sp.latex(sp.simplify(val)))
+                lat.append(sp.latex(val))
             self.mat_latex_var.set(", ".join(lat))
         except Exception as e: self.mat_res_var.set(f"Error: {e}")
 
     def calc_det(self):
-        try: self.update_mat_result(self.get_matrix().det())
+        try:
+            M, A = self.resolve_matrix()
+            if A is not None:
+                # slogdet なら大きな行列でも桁あふれしない
+                res_str, latex = numlinalg.format_det(*numlinalg.slogdet(A))
+                self.mat_res_var.set(res_str)
+                self.mat_latex_var.set(latex)
+                return
+            self.update_mat_result(self.cached('det', lambda M: M.det(), M))
         except Exception as e: self.mat_res_var.set(f"Error: {e}")
 
     def calc_inv(self):
-        try: self.update_mat_result(self.get_matrix().inv())
+        try:
+            M, A = self.resolve_matrix()
+            if A is not None:
+                self.update_mat_array(numlinalg.inv(A))
+                return
+            self.update_mat_result(self.cached('inv', lambda M: M.inv(), M))
         except Exception as e: self.mat_res_var.set(f"Error: {e}")
 
     def calc_diagonalize(self):
-        try:
-            M = self.get_matrix()
-            P, D = M.diagonalize()
+        def show(result):
+            P, D = result
             self.mat_res_var.set(f"P={str(P)}, D={str(D)}")
             self.mat_latex_var.set(sp.latex(P) + r", \quad " + sp.latex(D))
+        try:
+            M, A = self.resolve_matrix()
+            if A is not None:
+                P, w = numlinalg.diagonalize(A)
+                self.mat_res_var.set(f"P={numlinalg.format_matrix(P)}, D=diag({numlinalg.format_vector(w)})")
+                self.mat_latex_var.set(numlinalg.latex_matrix(P) + r", \quad " + numlinalg.latex_matrix(np.diag(w)))
+                return
+            self.run_symbolic("mat", 'diagonalize', M, 'diagonalize', (M,), show)
         except Exception as e: self.mat_res_var.set(f"Error: {e}")
 
     def calc_transpose(self):
-        try: self.update_mat_result(self.get_matrix().T)
+        try:
+            M, A = self.resolve_matrix()
+            if A is not None: self.update_mat_array(A.T)
+            else: self.update_mat_result(M.T)
         except Exception as e: self.mat_res_var.set(f"Error: {e}")
         
     def calc_square(self):
         try:
-            M = self.get_matrix()
-            self.update_mat_result(M * M)
+            M, A = self.resolve_matrix()
+            if A is not None:
+                self.update_mat_array(A @ A)
+                return
+            self.update_mat_result(self.cached('square', lambda M: M * M, M))
         except Exception as e: self.mat_res_var.set(f"Error: {e}")
 
     def copy_to_clipboard(self, text):
@@ -394,6 +786,11 @@ class ScienceCalcApp:
             messagebox.showinfo("Copied", "LaTeXコードをコピーしました")
 
 if __name__ == "__main__":
+    heavy.start()
     root = tk.Tk()
     app = ScienceCalcApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    if app.worker is not None:
+        app.worker.close()
+    if sym_cache is not None:
+        sym_cache.save()
\ No newline at end of file
@@ -0,0 +1,196 @@
+import math
+
+import numpy as np
+import sympy as sp
+
+# 自動モードで厳密計算を使う最大のサイズ (固有値が根号で書けるのは4次まで)
+EXACT_MAX_SIZE = 4
+# 結果を表示する時、行・列がこれより多ければ先頭と末尾の EDGE 個だけ出す
+SUMMARY_THRESHOLD = 8
+EDGE = 3
+
+
+# --- 入力 ---
+
+def parse_table(text):
+    """CSV / TSV / 空白区切りの文字列を行ごとのセル (文字列) のリストにする"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        raise ValueError("行列が空です")
+    first = lines[0]
+    delimiter = next((d for d in ('\t', ',', ';') if d in first), None)
+    rows = [[cell.strip() for cell in line.split(delimiter)] for line in lines]
+    if delimiter is not None:
+        # 行末の区切り文字 (表計算ソフトの書き出しで付くことがある) は無視する
+        rows = [row[:-1] if len(row) > 1 and not row[-1] else row for row in rows]
+    if len({len(row) for row in rows}) != 1:
+        raise ValueError("行ごとの列数が揃っていません")
+    return rows
+
+
+def table_to_array(rows):
+    """全てのセルが実数なら float の配列を、そうでなければ None を返す"""
+    try:
+        return np.array(rows, dtype=float)
+    except ValueError:
+        return None
+
+
+def to_array(M):
+    """記号を含まない sympy の行列を numpy の配列にする (虚部が無ければ実数)"""
+    A = np.array(M.evalf(), dtype=complex)
+    if not np.any(A.imag):
+        return A.real.copy()
+    return A
+
+
+def prefers_numeric(M):
+    """自動モードで数値計算に切り替えるか: 記号が無く、小数を含むか大きい行列"""
+    if M.free_symbols:
+        return False
+    if max(M.shape) > EXACT_MAX_SIZE:
+        return True
+    return any(entry.has(sp.Float) for entry in M)
+
+
+def _real_if_close(v):
+    if np.iscomplexobj(v) and np.all(np.abs(v.imag) <= 1e-12 * max(1.0, np.abs(v).max(initial=0.0))):
+        return v.real
+    return v
+
+
+# --- 計算 (LAPACK) ---
+
+def _square(A):
+    if A.ndim != 2 or A.shape[0] != A.shape[1]:
+        raise ValueError("正方行列ではありません")
+    return A
+
+
+def eigvals(A):
+    """固有値 (昇順)。エルミート行列なら eigvalsh で実数として求める"""
+    A = _square(A)
+    if np.array_equal(A, A.conj().T):
+        return np.linalg.eigvalsh(A)
+    w = _real_if_close(np.linalg.eigvals(A))
+    return np.sort_complex(w) if np.iscomplexobj(w) else np.sort(w)
+
+
+def slogdet(A):
+    """行列式を (符号, log|det|) で返す (大きな行列でも桁あふれしない)"""
+    return np.linalg.slogdet(_square(A))
+
+
+def inv(A):
+    A = _square(A)
+    try:
+        return np.linalg.solve(A, np.eye(A.shape[0], dtype=A.dtype))
+    except np.linalg.LinAlgError:
+        raise ValueError("逆行列がありません (特異行列)") from None
+
+
+def diagonalize(A):
+    """A = P D P^-1 となる (P, 固有値) を返す。固有ベクトルが足りなければ ValueError"""
+    A = _square(A)
+    if np.array_equal(A, A.conj().T):
+        w, V = np.linalg.eigh(A)
+        return V, w
+    w, V = np.linalg.eig(A)
+    if np.linalg.matrix_rank(V) < len(w):
+        raise ValueError("対角化できません (固有ベクトルが足りません)")
+    # 実行列で固有値も実数なら実数で返す
+    if not np.iscomplexobj(A) and np.all(np.abs(w.imag) <= 1e-12 * max(1.0, np.abs(w).max())):
+        w, V = w.real, V.real
+    return V, w
+
+
+# --- 表示 ---
+
+def _format_imag(im):
+    if abs(im) == 1:
+        return "I" if im > 0 else "-I"
+    return f"{im:.10g}*I"
+
+
+def format_number(v):
+    v = complex(v)
+    if v.imag == 0:
+        return f"{v.real:.10g}"
+    if v.real == 0:
+        return _format_imag(v.imag)
+    imag = _format_imag(v.imag)
+    return f"{v.real:.10g}" + (imag if imag.startswith("-") else "+" + imag)
+
+
+def _latex_real(r):
+    text = f"{r:.10g}"
+    if "e" in text:
+        # 1e+30 -> 1 \times 10^{30}
+        mantissa, exponent = text.split("e")
+        text = rf"{mantissa} \times 10^{{{int(exponent)}}}"
+    return text
+
+
+def latex_number(v):
+    v = complex(v)
+    if v.imag == 0:
+        return _latex_real(v.real)
+    imag = "i" if abs(v.imag) == 1 else _latex_real(abs(v.imag)) + " i"
+    if v.real == 0:
+        return ("-" if v.imag < 0 else "") + imag
+    return _latex_real(v.real) + (" - " if v.imag < 0 else " + ") + imag
+
+
+def _summarized(n):
+    """表示する添字 (None は省略記号の位置)"""
+    if n <= SUMMARY_THRESHOLD:
+        return list(range(n))
+    return list(range(EDGE)) + [None] + list(range(n - EDGE, n))
+
+
+def format_vector(v):
+    return "[" + ", ".join("..." if i is None else format_number(v[i]) for i in _summarized(len(v))) + "]"
+
+
+def latex_vector(v):
+    return ", ".join(r"\ldots" if i is None else latex_number(v[i]) for i in _summarized(len(v)))
+
+
+def format_matrix(A):
+    rows = []
+    for r in _summarized(A.shape[0]):
+        if r is None:
+            rows.append("...")
+        else:
+            rows.append(format_vector(A[r]))
+    return "Matrix([" + ", ".join(rows) + "])"
+
+
+def latex_matrix(A):
+    cols = _summarized(A.shape[1])
+    lines = []
+    for r in _summarized(A.shape[0]):
+        if r is None:
+            cells = [r"\ddots" if c is None else r"\vdots" for c in cols]
+        else:
+            cells = [r"\cdots" if c is None else latex_number(A[r, c]) for c in cols]
+        lines.append(" & ".join(cells))
+    return r"\left[\begin{matrix}" + r"\\".join(lines) + r"\end{matrix}\right]"
+
+
+def format_det(sign, logabs):
+    """slogdet の結果を表示用の (文字列, LaTeX) にする。float に収まらない値 (桁あふれ・アンダーフロー) は 10 の指数で書く"""
+    if sign == 0:
+        return "0", "0"
+    if abs(logabs) < 700:
+        value = complex(sign) * math.exp(logabs)
+        return format_number(value), latex_number(value)
+    exponent10 = logabs / math.log(10)
+    power = math.floor(exponent10)
+    if 10 ** (exponent10 - power) >= 9.9999999995:
+        power += 1  # 丸めると 10 になる仮数は 1 に繰り上げる
+    mantissa = complex(sign) * 10 ** (exponent10 - power)
+    if mantissa.imag:
+        return f"({format_number(mantissa)})*10**{power}", rf"\left({latex_number(mantissa)}\right) \times 10^{{{power}}}"
+    return f"{mantissa.real:.10g}e{power:+d}", rf"{latex_number(mantissa.real)} \times 10^{{{power}}}"
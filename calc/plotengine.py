@@ -0,0 +1,209 @@
+import importlib.util
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import sympy as sp
+
+# numexpr があれば lambdify の評価に使う (無ければ numpy)
+HAS_NUMEXPR = importlib.util.find_spec("numexpr") is not None
+
+# 最初に等間隔で取る点数と、1回の描画で増やす点の上限
+INITIAL_POINTS = 256
+MAX_POINTS = 40_000
+# 等間隔で評価する時に表示範囲の外へはみ出す幅 (点の間隔の何倍か)
+COVER_MARGIN = 2
+# 中点を足して細かくする回数の上限 (1回で区間の幅は半分になる)
+MAX_ROUNDS = 14
+# 直線からのずれがこのピクセル数を超える区間を細かくする
+TOLERANCE_PX = 0.5
+# 細かくしきっても隣の点との差がこの割合 (表示の高さに対して) を超えたら不連続とみなして線を切る
+JUMP_FRACTION = 0.5
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+COMPILED_MAX = 64
+
+
+def compile_function(expr, var):
+    """式を数値関数にする (式ごとに覚えておく)
+
+    var は記号か記号のタプル。返す関数は var と同じ数の配列 (ブロードキャストできる形) を
+    受け取り、実数の配列を返す。
+    """
+    variables = tuple(var) if isinstance(var, (tuple, list)) else (var,)
+    key = (sp.srepr(expr), tuple(sp.srepr(v) for v in variables))
+    with _compiled_lock:
+        func = _compiled.get(key)
+        if func is not None:
+            _compiled.move_to_end(key)
+            return func
+
+    raw = None
+    if HAS_NUMEXPR:
+        try:
+            raw = sp.lambdify(variables, expr, 'numexpr')
+            raw(*[np.linspace(0.5, 1.5, 4)] * len(variables))  # numexpr が対応していない関数なら numpy に戻す
+        except Exception:
+            raw = None
+    if raw is None:
+        raw = sp.lambdify(variables, expr, 'numpy')
+
+    def func(*arrays):
+        shape = np.broadcast_shapes(*(np.shape(a) for a in arrays))
+        with np.errstate(all='ignore'):
+            ys = np.asarray(raw(*arrays))
+        if ys.shape != shape:
+            ys = np.broadcast_to(ys, shape)  # 定数の式・一部の変数によらない式
+        if np.iscomplexobj(ys):
+            # 虚部が残る点は実数の範囲で定義されていないので描かない
+            ys = np.where(np.abs(ys.imag) <= 1e-12 * np.maximum(1.0, np.abs(ys.real)), ys.real, np.nan)
+        return ys.astype(float)
+
+    with _compiled_lock:
+        _compiled[key] = func
+        while len(_compiled) > COMPILED_MAX:
+            _compiled.popitem(last=False)
+    return func
+
+
+def robust_ylim(y, clip=True):
+    """y の表示範囲 (上下に 10% の余白を付ける)
+
+    clip=True なら両端 2% を除き、漸近線の巨大な値に引っ張られないようにする。
+    clip=False なら有限の値全体が入る範囲。
+    """
+    finite = y[np.isfinite(y)]
+    if finite.size == 0:
+        return -1.0, 1.0
+    if clip:
+        lo, hi = np.percentile(finite, [2, 98])
+    else:
+        lo, hi = finite.min(), finite.max()
+    if hi <= lo:
+        lo, hi = lo - 1.0, hi + 1.0
+    pad = (hi - lo) * 0.1
+    return float(lo - pad), float(hi + pad)
+
+
+class AdaptiveCurve:
+    """関数 f を表示範囲に合わせて適応的にサンプリングし、評価した点を覚えておく
+
+    曲がり方の大きい所・定義されない所の境目・不連続な所だけ中点を足して細かくする。
+    パン・ズームでは、まだ評価していない区間と、細かさが足りない区間だけを評価する。
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.evaluations = 0
+
+    def _evaluate(self, xs):
+        self.evaluations += len(xs)
+        return self.f(xs)
+
+    def _merge(self, xs, ys):
+        x = np.concatenate([self.x, xs])
+        y = np.concatenate([self.y, ys])
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        keep = np.r_[True, np.diff(x) > 0]  # 同じ x は1つにする
+        self.x, self.y = x[keep], y[keep]
+
+    def _cover(self, lo, hi):
+        """[lo, hi] のうち、まだ点の無い区間だけを等間隔で評価する"""
+        step = (hi - lo) / INITIAL_POINTS
+        gaps = []
+        if self.x.size == 0:
+            gaps.append((lo, hi))
+        else:
+            if lo < self.x[0]:
+                gaps.append((lo, self.x[0]))
+            if hi > self.x[-1]:
+                gaps.append((self.x[-1], hi))
+            # 表示範囲内で間隔が粗すぎる所 (前に広く見ていた時の点) も埋める
+            inside = np.flatnonzero((self.x[1:] >= lo) & (self.x[:-1] <= hi) & (np.diff(self.x) > 2 * step))
+            gaps.extend((self.x[i], self.x[i + 1]) for i in inside)
+        # 表示範囲の外までは埋めない (拡大した時、周りの粗い区間全体を細かく評価しないように)。
+        # 端の線が途切れないよう、両側に少しだけはみ出して評価する
+        margin = COVER_MARGIN * step
+        gaps = [(max(a, lo - margin), min(b, hi + margin)) for a, b in gaps]
+        gaps = [(a, b) for a, b in gaps if b > a]
+        if gaps:
+            # 両端は評価済みの点と重なるが、_merge で1つにまとめられる
+            xs = np.concatenate([np.linspace(a, b, max(2, int(np.ceil((b - a) / step)) + 1)) for a, b in gaps])
+            self._merge(xs, self._evaluate(xs))
+
+    def _prune(self, lo, hi):
+        """点が増えすぎたら、表示範囲から遠い点を捨てる (またそこを見る時に評価し直す)"""
+        if len(self.x) <= 4 * MAX_POINTS:
+            return
+        span = hi - lo
+        keep = (self.x >= lo - 2 * span) & (self.x <= hi + 2 * span)
+        self.x, self.y = self.x[keep], self.y[keep]
+
+    def _refine(self, lo, hi, width_px, height_px, ylim):
+        min_dx = (hi - lo) / width_px / 2 ** 4  # これより細かくはしない (1ピクセルの 1/16)
+        sx = width_px / (hi - lo)
+        sy = height_px / max(ylim[1] - ylim[0], 1e-300)
+        budget = MAX_POINTS
+        for _ in range(MAX_ROUNDS):
+            i0, i1 = np.searchsorted(self.x, [lo, hi])
+            i0, i1 = max(i0 - 1, 0), min(i1 + 1, len(self.x))
+            x, y = self.x[i0:i1], self.y[i0:i1]
+            if len(x) < 3:
+                break
+            dx = np.diff(x)
+            finite = np.isfinite(y)
+            with np.errstate(invalid='ignore'):
+                # 3点の真ん中が両端を結ぶ線からどれだけ離れているか (ピクセル)
+                t = (x[1:-1] - x[:-2]) / (x[2:] - x[:-2])
+                dev = np.abs(y[:-2] + t * (y[2:] - y[:-2]) - y[1:-1]) * sy
+                bent = ~(dev <= TOLERANCE_PX) & finite[1:-1] & finite[:-2] & finite[2:]
+                # 1区間で高さの大半を動く (急な変化・不連続の候補)
+                steep = ~(np.abs(np.diff(y)) * sy <= height_px * 0.1) & finite[1:] & finite[:-1]
+            need = steep | (finite[1:] != finite[:-1])  # 定義されない所との境目も細かくする
+            need[:-1] |= bent
+            need[1:] |= bent
+            need &= (dx > min_dx) & (dx * sx > 1e-3)
+            idx = np.flatnonzero(need)
+            if idx.size == 0 or budget <= 0:
+                break
+            idx = idx[:budget]
+            budget -= idx.size
+            xm = (x[idx] + x[idx + 1]) / 2
+            self._merge(xm, self._evaluate(xm))
+
+    def sample(self, lo, hi, width_px=800, height_px=600, ylim=None):
+        """表示範囲 [lo, hi] を描くための (x, y) を返す。不連続な所には NaN を挟んで線を切る
+
+        ylim を省略すると評価した点から決める (返り値の3つ目)。不連続な所や定義されない所が
+        あれば両端 2% を除いた範囲、無ければ (連続な曲線なので) 値全体が入る範囲にする。
+        """
+        if not hi > lo:
+            hi = lo + 1.0
+        self._prune(lo, hi)
+        self._cover(lo, hi)
+        auto = ylim is None
+        if auto:
+            view = (self.x >= lo) & (self.x <= hi)
+            ylim = robust_ylim(self.y[view])
+        self._refine(lo, hi, width_px, height_px, ylim)
+
+        i0, i1 = np.searchsorted(self.x, [lo, hi])
+        i0, i1 = max(i0 - 1, 0), min(i1 + 1, len(self.x))
+        x, y = self.x[i0:i1], self.y[i0:i1]
+        # 細かくしても大きく飛ぶ所は不連続 (tan の漸近線など) なので縦線を引かない
+        with np.errstate(invalid='ignore'):
+            jump = np.abs(np.diff(y)) > JUMP_FRACTION * (ylim[1] - ylim[0])
+        if auto and not jump.any():
+            view = (x >= lo) & (x <= hi)
+            if np.isfinite(y[view]).all():
+                # 範囲を広げるだけなので、細かさは足りていて不連続な所も増えない
+                ylim = robust_ylim(y[view], clip=False)
+        breaks = np.flatnonzero(jump) + 1
+        if breaks.size:
+            x = np.insert(x, breaks, np.nan)
+            y = np.insert(y, breaks, np.nan)
+        return x, y, ylim
@@ -0,0 +1,88 @@
+# 起動を速くするための共通処理。calc/startup.py と graph/graphcore/startup.py は同じ内容に保つ
+# (calc は graph が無い所でも単独で動くので、共有せずに同じファイルを置いている。直す時は両方直す)
+import os
+import time
+import threading
+
+# この環境変数があると起動計測モード (bench_startup.py から使う)
+BENCH_ENV = "TOOLS_STARTUP_BENCH"
+
+
+class BackgroundImport:
+    """重い import (pandas / matplotlib など) を別スレッドで1回だけ実行する
+
+    ウィンドウを先に出しておき、読み込みが終わったら when_ready() で
+    登録した処理を Tk のスレッドで呼ぶ。func の中では Tk に触らないこと。
+    """
+
+    def __init__(self, func):
+        self._func = func
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="background-import", daemon=True)
+        self._started = False
+        self.error = None
+        self.seconds = None
+
+    def start(self):
+        """読み込みを開始する (2回目以降は何もしない)"""
+        if not self._started:
+            self._started = True
+            self._thread.start()
+        return self
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self):
+        """読み込みが終わるまで待つ (未開始ならここで開始。失敗していればその例外を投げる)"""
+        self.start()
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+
+    def when_ready(self, root, callback, poll_ms=20):
+        """読み込みが終わったら root.after で callback() を呼ぶ"""
+        def poll():
+            if self.done():
+                callback()
+            else:
+                root.after(poll_ms, poll)
+        poll()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._func()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._done.set()
+
+
+def bench_enabled():
+    return os.environ.get(BENCH_ENV) == "1"
+
+
+def bench_mark(name):
+    """計測モードの時だけ節目を標準出力に書く (時刻は計測側で記録する)"""
+    if bench_enabled():
+        print(f"[startup] {name}", flush=True)
+
+
+def bench_window(root):
+    """計測モードでは最初にウィンドウが表示された時点を記録する"""
+    if not bench_enabled():
+        return
+    def on_map(event):
+        if event.widget is root:
+            root.unbind("<Map>")
+            bench_mark("window")
+    root.bind("<Map>", on_map, add="+")
+
+
+def bench_finish(root):
+    """計測モードでは準備完了を記録してそのまま終了する"""
+    if bench_enabled():
+        bench_mark("ready")
+        root.after_idle(root.destroy)
@@ -0,0 +1,94 @@
+import csv
+import time
+
+import numpy as np
+import sympy as sp
+
+from plotengine import compile_function
+
+# 1回に評価する点数の上限 (メッシュグリッドはこの大きさずつ作るので、メモリはこれで抑えられる)
+CHUNK_ELEMENTS = 1 << 18
+# 1つの軸の点数の上限
+MAX_AXIS_POINTS = 5000
+
+
+class Sweep:
+    """式を1つか2つの記号について格子状に評価した結果
+
+    axes は [(記号, 値の配列)]。values は1次元なら (横軸の点数,)、
+    2次元なら (縦軸の点数, 横軸の点数) の配列 (実数にならない点は NaN)。
+    """
+
+    def __init__(self, expr, axes, fixed, values, elapsed):
+        self.expr = expr
+        self.axes = axes
+        self.fixed = fixed
+        self.values = values
+        self.elapsed = elapsed
+
+    def save_csv(self, path):
+        """1次元は (記号, 値) の2列、2次元は先頭行に横軸・先頭列に縦軸の値を置いた表で書き出す
+
+        掃引しなかった記号の値は先頭に「# 記号 = 値」の行として残す (numpy.loadtxt などは読み飛ばす)。
+        """
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for sym, value in self.fixed.items():
+                f.write(f"# {sym} = {value}\n")
+            writer = csv.writer(f, lineterminator='\n')
+            if len(self.axes) == 1:
+                (sym, xs), = self.axes
+                writer.writerow([str(sym), str(self.expr)])
+                np.savetxt(f, np.column_stack([xs, self.values]), fmt='%.10g', delimiter=',')
+            else:
+                (xsym, xs), (ysym, ys) = self.axes
+                writer.writerow([f"{ysym}\\{xsym}"] + [f"{v:.10g}" for v in xs])
+                np.savetxt(f, np.column_stack([ys, self.values]), fmt='%.10g', delimiter=',')
+
+def axis_values(lo, hi, points):
+    points = int(points)
+    if not 2 <= points <= MAX_AXIS_POINTS:
+        raise ValueError(f"点数は 2 から {MAX_AXIS_POINTS} までにしてください")
+    if not (np.isfinite(lo) and np.isfinite(hi)) or lo == hi:
+        raise ValueError("開始と終了には異なる有限の値を指定してください")
+    return np.linspace(lo, hi, points)
+
+
+def _scalar(value):
+    v = complex(sp.N(value))
+    return v.real if v.imag == 0 else v
+
+
+def run_sweep(expr, axes, fixed):
+    """expr を axes の格子上で評価する
+
+    axes は [(記号, 値の配列)] (1つか2つ)、fixed は掃引しない記号の値 {記号: 値}。
+    式は1度だけ数値関数にし、fixed はスカラーの引数として渡す (値を変えても作り直さない)。
+    """
+    swept = [sym for sym, _ in axes]
+    if not 1 <= len(axes) <= 2:
+        raise ValueError("掃引する記号は1つか2つです")
+    if len(set(swept)) != len(swept):
+        raise ValueError("横軸と縦軸に同じ記号は選べません")
+    missing = expr.free_symbols - set(swept) - set(fixed)
+    if missing:
+        raise ValueError("値が決まっていない記号: " + ", ".join(sorted(map(str, missing))))
+
+    fixed = {sym: value for sym, value in fixed.items() if sym in expr.free_symbols}
+    f = compile_function(expr, tuple(swept) + tuple(fixed))
+    constants = [_scalar(v) for v in fixed.values()]
+
+    started = time.perf_counter()
+    if len(axes) == 1:
+        xs = axes[0][1]
+        values = np.empty(len(xs))
+        for i in range(0, len(xs), CHUNK_ELEMENTS):
+            values[i:i + CHUNK_ELEMENTS] = f(xs[i:i + CHUNK_ELEMENTS], *constants)
+    else:
+        (_, xs), (_, ys) = axes
+        values = np.empty((len(ys), len(xs)))
+        rows = max(1, CHUNK_ELEMENTS // len(xs))
+        for r in range(0, len(ys), rows):
+            # sparse にすると片方の記号だけの部分式は 1 行 (1 列)分しか計算しない
+            X, Y = np.meshgrid(xs, ys[r:r + rows], sparse=True)
+            values[r:r + rows] = f(X, Y, *constants)
+    return Sweep(expr, axes, fixed, values, time.perf_counter() - started)
@@ -0,0 +1,152 @@
+import os
+import pickle
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+
+import sympy as sp
+
+# 保存ファイルの形式。中身の作り方を変えたら上げる (古いファイルは読まずに捨てる)
+FORMAT_VERSION = 1
+
+
+def _new_file_mode():
+    # umask は設定し直さないと読めないので、読み込み時に1度だけ読む
+    mask = os.umask(0)
+    os.umask(mask)
+    return 0o666 & ~mask
+
+
+# 保存ファイルが無い時に作るファイルの権限
+NEW_FILE_MODE = _new_file_mode()
+
+
+class SymCache:
+    """記号計算の結果を (操作, 式の srepr) ごとに覚えておく LRU キャッシュ
+
+    同じ式に同じ操作をもう一度行った時は計算せずに返す。max_entries を超えたら
+    最も長く使われていないものから捨てる。path を渡すと load() / save() で
+    セッションをまたいで持ち越す (sympy のバージョンが違うファイルは使わない)。
+    電卓を2つ開いていても互いの結果を消さないよう、save() はファイルの内容と合わせてから書く。
+    """
+
+    def __init__(self, max_entries=256, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._changes = 0 # put するたびに増やす (保存した時点の値と比べて変更の有無を見る)
+        self._saved_changes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(op, *args):
+        """操作名と引数 (式・行列など) からキーを作る。srepr は仮定 (real など) も含む"""
+        return (op,) + tuple(sp.srepr(arg) for arg in args)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._changes += 1
+
+    def compute(self, op, args, func):
+        """キャッシュにあればそれを、無ければ func() を計算して覚えてから返す"""
+        key = self.make_key(op, *args)
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """メモリ上の結果を捨てる (保存ファイルには触らない)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- ディスクへの保存 ---
+
+    def _read_file(self):
+        """保存ファイルの [(キー, 値)] (無い・壊れている・バージョン違いなら空)"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+            return []
+        if not isinstance(data, dict) or data.get('version') != (FORMAT_VERSION, sp.__version__):
+            return []
+        return data['entries']
+
+    def load(self):
+        """保存ファイルを読み込む (無い・壊れている・バージョン違いなら何もしない)"""
+        if not self.path:
+            return
+        entries = self._read_file()
+        with self._lock:
+            for key, value in entries:
+                self._entries.setdefault(key, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        """変更があれば保存ファイルに書き出す
+
+        他のプロセスが先に保存した結果を消さないよう、ファイルの内容に自分の結果を足してから
+        一時ファイル (プロセスごとに別名) に書き、置き換える。失敗したら次の save() でやり直す。
+        """
+        if not self.path:
+            return
+        with self._lock:
+            changes = self._changes
+            if changes == self._saved_changes:
+                return
+            entries = list(self._entries.items())
+
+        merged = OrderedDict(self._read_file())
+        for key, value in entries: # 自分の結果の方を新しいものとして後ろに置く
+            merged.pop(key, None)
+            merged[key] = value
+        while len(merged) > self.max_entries:
+            merged.popitem(last=False)
+
+        directory = os.path.dirname(self.path) or "."
+        tmp = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': (FORMAT_VERSION, sp.__version__), 'entries': list(merged.items())}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            # mkstemp は 0600 で作るので、置き換える前に元のファイルの権限に合わせる
+            try:
+                mode = stat.S_IMODE(os.stat(self.path).st_mode)
+            except FileNotFoundError:
+                mode = NEW_FILE_MODE
+            os.chmod(tmp, mode)
+            os.replace(tmp, self.path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # 保存できない結果が混ざっていても計算には影響させない
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            return
+        with self._lock:
+            self._saved_changes = max(self._saved_changes, changes)
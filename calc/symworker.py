@@ -0,0 +1,214 @@
+import time
+import multiprocessing
+
+import sympy as sp
+
+
+class NotApplicable(Exception):
+    """この段階では解けない (未評価のまま・対象外)。すぐ次の段階へ進む"""
+
+
+# --- 段階ごとの計算 (ワーカープロセスで実行する) ---
+
+def _evaluated(result):
+    if result.has(sp.Integral):
+        raise NotApplicable("未評価")
+    return result
+
+
+def _integrate_risch(expr, var, limits):
+    if limits:
+        raise NotApplicable("定積分は対象外")
+    return _evaluated(sp.integrate(expr, var, risch=True))
+
+
+def _integrate_default(expr, var, limits):
+    return _evaluated(sp.integrate(expr, (var,) + limits))
+
+
+def _integrate_meijerg(expr, var, limits):
+    return _evaluated(sp.integrate(expr, (var,) + limits, meijerg=True))
+
+
+def _integrate_quad(expr, var, limits):
+    import mpmath
+    if not limits:
+        raise NotApplicable("不定積分は数値計算できません")
+    if expr.free_symbols - {var}:
+        raise NotApplicable(f"{var} 以外の記号を含みます")
+    f = sp.lambdify(var, expr, 'mpmath')
+    lo, hi = (mpmath.mpf(sp.N(v)) if v.is_finite else (mpmath.inf if v > 0 else -mpmath.inf)
+              for v in map(sp.sympify, limits))
+    return sp.Float(mpmath.quad(f, [lo, hi]))
+
+
+def _limit_gruntz(expr, var, point):
+    result = sp.limit(expr, var, point)
+    if result.has(sp.Limit):
+        raise NotApplicable("未評価")
+    return result
+
+
+def _limit_numeric(expr, var, point):
+    import mpmath
+    if expr.free_symbols - {var}:
+        raise NotApplicable(f"{var} 以外の記号を含みます")
+    f = sp.lambdify(var, expr, 'mpmath')
+    return sp.Float(mpmath.limit(f, mpmath.mpf(sp.N(point))))
+
+
+def _diagonalize_exact(M):
+    return M.diagonalize()
+
+
+def _diagonalize_numeric(M):
+    import numlinalg
+    if M.free_symbols:
+        raise NotApplicable("記号を含みます")
+    P, w = numlinalg.diagonalize(numlinalg.to_array(M))
+    return sp.Matrix(P), sp.diag(*w.tolist())
+
+
+# 操作ごとの段階 (表示名, 関数)。前の段階が解けない・時間切れなら次へ進む
+STAGES = {
+    'integrate': [("risch", _integrate_risch), ("標準", _integrate_default),
+                  ("meijerg", _integrate_meijerg), ("数値 quad", _integrate_quad)],
+    'limit': [("gruntz", _limit_gruntz), ("数値", _limit_numeric)],
+    'diagonalize': [("厳密", _diagonalize_exact), ("数値", _diagonalize_numeric)],
+}
+# 厳密な結果を返す段階 (これ以外の段階の結果は近似値なので、覚えておかない)
+EXACT_STAGES = {"risch", "標準", "meijerg", "gruntz", "厳密"}
+
+
+def _serve(conn):
+    """ワーカープロセスの本体: (操作, 段階, 引数) を受け取って結果を返す"""
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        op, stage, args = request
+        conn.send(('begin', None))  # ここから制限時間を数える (プロセスの起動時間は含めない)
+        try:
+            conn.send(('ok', STAGES[op][stage][1](*args)))
+        except NotApplicable as e:
+            conn.send(('skip', str(e)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class SymbolicWorker:
+    """記号計算を行う別プロセス (時間切れ・キャンセルの時はプロセスごと止めて作り直す)"""
+
+    def __init__(self):
+        self._ctx = multiprocessing.get_context('spawn')
+        self._proc = None
+        self._conn = None
+
+    def start(self):
+        """プロセスを起動しておく (sympy の読み込みを先に済ませるため)"""
+        if self._proc is not None and self._proc.is_alive():
+            return
+        self._conn, child = self._ctx.Pipe()
+        self._proc = self._ctx.Process(target=_serve, args=(child,), name="symbolic-worker", daemon=True)
+        self._proc.start()
+        child.close()
+
+    def send(self, op, stage, args):
+        self.start()
+        self._conn.send((op, stage, args))
+
+    def poll(self):
+        """結果が届いていれば (種類, 値) を、まだなら None を返す"""
+        try:
+            if self._conn.poll():
+                return self._conn.recv()
+        except (EOFError, OSError):
+            self.kill()
+            return ('error', "計算プロセスが異常終了しました")
+        if not self._proc.is_alive():
+            self.kill()
+            return ('error', "計算プロセスが異常終了しました")
+        return None
+
+    def kill(self):
+        """計算中のプロセスを止める (次の send で作り直す)"""
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.join(1)
+            self._conn.close()
+        self._proc = None
+        self._conn = None
+
+    def close(self):
+        if self._proc is not None and self._proc.is_alive():
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+            self._proc.join(1)
+        self.kill()
+
+
+class StagedRun:
+    """1つの操作を段階ごとにワーカーで実行する (Tk から poll() を定期的に呼ぶ)
+
+    各段階に timeout 秒まで与え、解けない・時間切れ・エラーなら次の段階へ進む。
+    """
+
+    def __init__(self, worker, op, args, timeout):
+        self.worker = worker
+        self.op = op
+        self.args = args
+        self.timeout = timeout
+        self.stages = STAGES[op]
+        self.stage = 0
+        self.log = []  # 終わった段階の (名前, 結果の説明)
+        self.started = time.monotonic()
+        self._stage_started = None  # ワーカーが計算を始めた時刻 ('begin' を受け取るまで None)
+        self.worker.send(op, 0, args)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def poll(self):
+        """終わったら ('ok', 値, 段階の名前) か ('error', 説明, None) を、実行中なら None を返す"""
+        reply = self.worker.poll()
+        if reply is not None and reply[0] == 'begin':
+            self._stage_started = time.monotonic()
+            return None
+        if reply is None:
+            if self._stage_started is None or time.monotonic() - self._stage_started < self.timeout:
+                return None
+            self.worker.kill()
+            reply = ('timeout', f"時間切れ ({self.timeout:g} 秒)")
+        kind, value = reply
+        if kind == 'ok':
+            return ('ok', value, self.stages[self.stage][0])
+        self.log.append((self.stages[self.stage][0], value))
+        self.stage += 1
+        if self.stage >= len(self.stages):
+            return ('error', self.summary(), None)
+        self._stage_started = None
+        self.worker.send(self.op, self.stage, self.args)
+        return None
+
+    def status(self):
+        """途中経過: 実行中の段階・経過時間・これまでの段階の結果"""
+        name = self.stages[self.stage][0]
+        if self._stage_started is None:
+            text = f"計算プロセスを準備中... {name} ({self.stage + 1}/{len(self.stages)}) (合計 {self.elapsed():.1f} 秒)"
+        else:
+            text = (f"計算中... {name} ({self.stage + 1}/{len(self.stages)}) "
+                    f"{time.monotonic() - self._stage_started:.1f} / {self.timeout:g} 秒 (合計 {self.elapsed():.1f} 秒)")
+        if self.log:
+            text += "  [" + self.summary() + "]"
+        return text
+
+    def summary(self):
+        return " → ".join(f"{name}: {result}" for name, result in self.log)
+
+    def cancel(self):
+        self.worker.kill()
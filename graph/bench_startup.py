@@ -0,0 +1,120 @@
+"""起動時間の計測: 各ツールのウィンドウ (graphgen は最初のプロンプト) が出るまでの時間
+
+使い方:
+    python bench_startup.py [--runs 5] [--history startup_history.jsonl]
+
+各ツールを TOOLS_STARTUP_BENCH=1 と -X importtime 付きで起動し、
+  window: ウィンドウが表示されるまで
+  ready:  重いモジュール (pandas / matplotlib / sympy) の読み込みが終わるまで
+を計り、ready までに時間のかかった import の上位を表示する。
+--history を付けると結果を1行ずつ追記するので、変更前後の比較に使える。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+import statistics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOOLS = {
+    "graphpro": os.path.join(BASE_DIR, "graphpro", "graphpro.py"),
+    "graphgen": os.path.join(BASE_DIR, "graphgen", "graph.py"),
+    "calcpro": os.path.join(os.path.dirname(BASE_DIR), "calc", "calc.py"),
+}
+
+
+def parse_importtime(lines):
+    """-X importtime の出力から、トップレベルの import ごとの累積時間 (秒) を返す"""
+    totals = {}
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # 見出し行
+        if name.startswith("  "):
+            continue  # 他のモジュールから読まれたもの (親の累積に含まれる)
+        name = name.strip()
+        totals[name] = totals.get(name, 0) + cumulative / 1e6
+    return totals
+
+
+def run_once(script, timeout=60):
+    """1回起動して {'window': 秒, 'ready': 秒, 'imports': {...}} を返す"""
+    env = dict(os.environ, TOOLS_STARTUP_BENCH="1", PYTHONIOENCODING="utf-8")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-X", "importtime", script],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=env, cwd=os.path.dirname(script), text=True, encoding="utf-8")
+    stderr_lines = []
+    reader = threading.Thread(target=lambda: stderr_lines.extend(proc.stderr), daemon=True)
+    reader.start()
+
+    marks = {}
+    for line in proc.stdout:
+        if line.startswith("[startup] "):
+            marks[line.split()[1]] = time.perf_counter() - start
+    proc.wait(timeout=timeout)
+    reader.join(timeout=timeout)
+    if "window" not in marks:
+        errors = [l for l in stderr_lines if not l.startswith("import time:")]
+        raise RuntimeError("".join(errors[-5:]).strip() or f"終了コード {proc.returncode}")
+    return {'window': marks["window"], 'ready': marks.get("ready"),
+            'imports': parse_importtime(stderr_lines)}
+
+
+def bench(name, script, runs):
+    results = [run_once(script) for _ in range(runs)]
+    windows = [r['window'] for r in results]
+    readies = [r['ready'] for r in results if r['ready'] is not None]
+    imports = {}
+    for r in results:
+        for mod, sec in r['imports'].items():
+            imports.setdefault(mod, []).append(sec)
+    top = sorted(((statistics.median(v), m) for m, v in imports.items()), reverse=True)[:5]
+    return {
+        'tool': name,
+        'runs': runs,
+        'window_median': statistics.median(windows),
+        'window_min': min(windows),
+        'ready_median': statistics.median(readies) if readies else None,
+        'top_imports': [[m, round(sec, 4)] for sec, m in top],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="各ツールの起動時間を計測します")
+    parser.add_argument("--runs", type=int, default=5, help="ツールごとの起動回数")
+    parser.add_argument("--tools", nargs="*", default=list(TOOLS), choices=list(TOOLS))
+    parser.add_argument("--history", help="結果を追記する JSON Lines ファイル")
+    args = parser.parse_args(argv)
+
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    failed = False
+    for name in args.tools:
+        try:
+            result = bench(name, TOOLS[name], args.runs)
+        except Exception as e:
+            print(f"{name:10s} 失敗: {e}")
+            failed = True
+            continue
+        ready = result['ready_median']
+        ready_text = f"{ready:.2f} s" if ready is not None else "-"
+        print(f"{name:10s} window {result['window_median']:.2f} s (最速 {result['window_min']:.2f} s)"
+              f" / ready {ready_text}")
+        for mod, sec in result['top_imports']:
+            print(f"{'':12s}{sec:7.3f} s  {mod}")
+        if args.history:
+            with open(args.history, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(result, time=stamp), ensure_ascii=False) + "\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
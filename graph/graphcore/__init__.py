@@ -0,0 +1 @@
+# graphgen / graphpro 共通モジュール
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from graphcore import loader
+
+HEADER_FILE = "header.json"
+CHUNK_ROWS = 500_000
+# 変換済みストアの合計サイズの上限。超えたら最後に開いてから最も時間が経ったものから消す
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3
+
+
+def count_lines(path, block_size=16 * 1024 * 1024):
+    """改行の数を数える (行数の上限の見積もり用)"""
+    count = 0
+    last = b"\n"
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            count += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        count += 1
+    return count
+
+
+def convert_csv(csv_path, store_dir, dtype=np.float64, progress=None):
+    """CSV を1回だけ読み、列ごとの .npy (メモリマップ用) と header.json に変換する
+
+    チャンクごとに数値化して書き込むので、変換中も全体をメモリに載せない。
+    progress(読んだ行数, 行数の上限) が渡されればチャンクごとに呼ぶ (例外を投げれば中止)。
+    中止・失敗した時は書きかけのストアを消す。
+    """
+    try:
+        return _convert(csv_path, store_dir, dtype, progress)
+    except BaseException:
+        shutil.rmtree(store_dir, ignore_errors=True)
+        raise
+
+
+def _convert(csv_path, store_dir, dtype, progress):
+    dtype = np.dtype(dtype)
+    encoding = loader.sniff_encoding(csv_path)
+    if encoding is None:
+        raise ValueError("対応できない文字コードです")
+    max_rows = max(count_lines(csv_path) - 1, 0)  # ヘッダー行を除く
+
+    os.makedirs(store_dir, exist_ok=True)
+    header_path = os.path.join(store_dir, HEADER_FILE)
+    if os.path.exists(header_path):
+        os.remove(header_path)  # 変換途中のストアを使わないよう先に消す
+
+    columns = None
+    arrays = []
+    has_data = []
+    row = 0
+    for chunk in pd.read_csv(csv_path, encoding=encoding, chunksize=CHUNK_ROWS):
+        if columns is None:
+            columns = [str(c) for c in chunk.columns]
+            arrays = [np.lib.format.open_memmap(os.path.join(store_dir, f"{i}.npy"), mode='w+',
+                                                dtype=dtype, shape=(max_rows,))
+                      for i in range(len(columns))]
+            has_data = [False] * len(columns)
+        n = len(chunk)
+        for i, col in enumerate(chunk.columns):
+            values = pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+            arrays[i][row:row + n] = values
+            if not has_data[i]:
+                has_data[i] = bool(np.isfinite(values).any())
+        row += n
+        if progress:
+            progress(row, max_rows)
+
+    for arr in arrays:
+        arr.flush()
+    del arrays
+
+    st = os.stat(csv_path)
+    header = {
+        'version': 1,
+        'rows': row,
+        'dtype': dtype.name,
+        'encoding': encoding,
+        'source': {'path': os.path.abspath(csv_path), 'size': st.st_size, 'mtime': st.st_mtime_ns},
+        'columns': [{'name': name, 'file': f"{i}.npy", 'empty': not has_data[i]}
+                    for i, name in enumerate(columns or [])],
+    }
+    with open(header_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, ensure_ascii=False, indent=1)
+    return ColumnStore(store_dir)
+
+
+class ColumnStore:
+    """列ごとの .npy をメモリマップで開く読み取り専用の数値表
+
+    column() はファイルへのビューを返すだけなので、実際にメモリに載るのは
+    描画・近似で触れた列のページだけになる。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, HEADER_FILE), 'r', encoding='utf-8') as f:
+            self.header = json.load(f)
+        self.rows = self.header['rows']
+        self._files = {c['name']: c['file'] for c in self.header['columns'] if not c['empty']}
+        self._views = {}
+
+    @property
+    def columns(self):
+        return list(self._files)
+
+    def is_current(self, csv_path):
+        """元の CSV が変換後に変わっていないか"""
+        st = os.stat(csv_path)
+        src = self.header['source']
+        return src['size'] == st.st_size and src['mtime'] == st.st_mtime_ns
+
+    def column(self, name):
+        view = self._views.get(name)
+        if view is None:
+            mm = np.load(os.path.join(self.store_dir, self._files[name]), mmap_mode='r')
+            view = mm[:self.rows]
+            self._views[name] = view
+        return view
+
+    def frame(self):
+        """全列をコピーせずに並べた DataFrame (値が全て空の列は除く)"""
+        return pd.DataFrame({name: self.column(name) for name in self.columns}, copy=False)
+
+
+def store_bytes(store_dir):
+    total = 0
+    for entry in os.scandir(store_dir):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def evict(root_dir, max_bytes, keep=None):
+    """root_dir 内のストアの合計が max_bytes 以下になるまで、最後に開いてから古いものを消す
+
+    最後に開いた時刻は header.json の更新時刻 (open_store で更新する)。keep のストアは消さない。
+    """
+    stores = []
+    try:
+        entries = list(os.scandir(root_dir))
+    except OSError:
+        return
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        try:
+            used = os.stat(os.path.join(entry.path, HEADER_FILE)).st_mtime
+        except OSError:
+            continue  # 変換中 (header.json がまだ無い) のストアには触らない
+        stores.append((used, entry.path, store_bytes(entry.path)))
+    total = sum(size for _, _, size in stores)
+    for used, path, size in sorted(stores):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.samefile(path, keep):
+            continue
+        # メモリマップで開いたままのファイル (Windows) は消せないので、消せた分だけ数える
+        shutil.rmtree(path, ignore_errors=True)
+        if not os.path.exists(path):
+            total -= size
+
+
+def open_store(csv_path, root_dir, dtype=np.float64, progress=None, max_bytes=DEFAULT_MAX_BYTES):
+    """変換済みのストアがあれば開き、無いか古ければ変換する
+
+    変換したら、合計が max_bytes を超えた分の古いストアを消す。
+    """
+    dtype = np.dtype(dtype)
+    key = hashlib.sha1(f"{os.path.abspath(csv_path)}|{dtype.name}".encode('utf-8')).hexdigest()
+    store_dir = os.path.join(root_dir, key)
+    try:
+        store = ColumnStore(store_dir)
+        if store.is_current(csv_path):
+            os.utime(os.path.join(store_dir, HEADER_FILE))  # 最後に使った時刻 (LRU)
+            return store
+    except (OSError, ValueError, KeyError):
+        pass
+    store = convert_csv(csv_path, store_dir, dtype, progress)
+    evict(root_dir, max_bytes, keep=store_dir)
+    return store
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+
+def to_float_array(series):
+    """列を float 配列にする。もともと float の列 (メモリマップ含む) はコピーしない"""
+    if series.dtype.kind == 'f':
+        return series.to_numpy()
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+class NumericColumn:
+    """数値化した列と、その有限値マスク・最小・最大・絶対値の最大"""
+
+    __slots__ = ('values', 'finite', 'count', 'vmin', 'vmax', 'abs_max')
+
+    def __init__(self, values):
+        self.values = values
+        self.finite = np.isfinite(values)
+        self.count = int(np.count_nonzero(self.finite))
+        if self.count > 0:
+            valid = values[self.finite] if self.count < len(values) else values
+            self.vmin = float(valid.min())
+            self.vmax = float(valid.max())
+            self.abs_max = max(abs(self.vmin), abs(self.vmax))
+        else:
+            self.vmin = self.vmax = np.nan
+            self.abs_max = 0.0
+
+    @property
+    def all_finite(self):
+        return self.count == len(self.values)
+
+
+class NumericColumns:
+    """DataFrame の列ごとの数値化結果をまとめて保持するキャッシュ
+
+    データを読み込んだ時に1つ作り、描画・近似はすべてここから読む。
+    各列は最初に使われた時に1回だけ数値化する (触れない列のために
+    巨大なメモリマップ全体を読まないようにするため)。
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._columns = {}
+
+    def __getitem__(self, name):
+        col = self._columns.get(name)
+        if col is None:
+            col = NumericColumn(to_float_array(self.df[name]))
+            self._columns[name] = col
+        return col
+
+    def values(self, name):
+        return self[name].values
@@ -0,0 +1,517 @@
+import ast
+import threading
+
+import numpy as np
+
+# Levenberg-Marquardt の設定
+MAX_ITER = 200
+COST_TOL = 1e-9    # 残差二乗和の相対変化がこれ以下なら収束
+STEP_TOL = 1e-8    # パラメータの相対変化がこれ以下なら収束
+LAMBDA_INIT = 1e-3
+LAMBDA_MAX = 1e16
+FD_STEP = np.sqrt(np.finfo(float).eps)
+
+
+class Model:
+    """近似モデル y = func(x, *params)
+
+    func・jac・guess は全系列をまとめて扱う: x は (1, n)、各パラメータは (m, 1) で渡され、
+    (m, n) に広がる値を返す。guess(x, Y, W) は (m, パラメータ数) の初期値を返す。
+    jac が無いモデル (ユーザー定義式) は差分で微分する。
+    """
+
+    def __init__(self, key, params, func, guess=None, jac=None, tex="", positive=(), linear=False):
+        self.key = key
+        self.params = params          # パラメータ名 (凡例用の LaTeX)
+        self.func = func
+        self.guess = guess
+        self.jac = jac
+        self.tex = tex                # 凡例に出す式の形
+        self.positive = positive      # 符号に意味の無いパラメータ (幅など) の番号。解の後に絶対値を取る
+        self.linear = linear          # 線形最小二乗で解けるモデル (多項式)
+
+    def __call__(self, x, params):
+        """params: (パラメータ数,) または (m, パラメータ数)。x で評価する"""
+        params = np.asarray(params, dtype=float)
+        x = np.asarray(x, dtype=float)
+        if params.ndim == 1:
+            return _evaluate(self.func, x, params[None, :])[0]
+        return _evaluate(self.func, x, params)
+
+
+def _evaluate(func, x, P):
+    """func を (m, n) で評価する"""
+    f = func(x[None, :], *(P[:, j, None] for j in range(P.shape[1])))
+    return np.broadcast_to(f, (P.shape[0], x.shape[0]))
+
+
+# --- 初期値 ---
+
+def _line_guess(u, V, W):
+    """重み付き1次近似 V = s * u + t を行ごとに解く (初期値用)"""
+    w = W.astype(float)
+    n = w.sum(axis=1)
+    u = np.where(W, u, 0.0)
+    V = np.where(W, V, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu = (w * u).sum(axis=1) / n
+        mv = (w * V).sum(axis=1) / n
+        du = np.where(W, u - mu[:, None], 0.0)
+        s = (du * (V - mv[:, None])).sum(axis=1) / (du * du).sum(axis=1)
+    s = np.where(np.isfinite(s), s, 0.0)
+    t = np.where(np.isfinite(mv), mv - s * np.nan_to_num(mu), 0.0)
+    return s, t
+
+
+def _log_guess(u, Y, W):
+    """|y| の対数で1次近似し、y = a * exp(s * u) の (a, s) を返す"""
+    W = W & (Y != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s, t = _line_guess(u, np.log(np.abs(Y)), W)
+    sign = np.where(np.where(W, Y, 0.0).sum(axis=1) < 0, -1.0, 1.0)
+    return sign * np.exp(t), s
+
+
+def _guess_exp(x, Y, W):
+    a, b = _log_guess(np.broadcast_to(x, Y.shape), Y, W)
+    return np.column_stack([a, b])
+
+
+def _guess_power(x, Y, W):
+    xb = np.broadcast_to(x, Y.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = np.log(np.where(xb > 0, xb, np.nan))
+    a, b = _log_guess(u, Y, W & (xb > 0))
+    return np.column_stack([a, b])
+
+
+def _peak_guess(x, Y, W):
+    """ピーク (または谷) の高さ・位置・半値全幅・ベースラインを行ごとに見積もる"""
+    m = Y.shape[0]
+    Yn = np.where(W, Y, np.nan)
+    Yn[~W.any(axis=1)] = 0.0
+    y_max = np.nanmax(Yn, axis=1)
+    y_min = np.nanmin(Yn, axis=1)
+    med = np.nanmedian(Yn, axis=1)
+    up = (y_max - med) >= (med - y_min)
+    c = np.where(up, y_min, y_max)
+    a = np.where(up, y_max - y_min, y_min - y_max)
+    sign = np.where(up, 1.0, -1.0)[:, None]
+    peak = np.nanargmax(np.where(W, sign * Yn, -np.inf), axis=1)
+    x0 = x[peak]
+    # 高さの半分を超える点の広がりを半値全幅とする
+    half = W & (sign * (Y - c[:, None]) >= np.abs(a)[:, None] / 2)
+    xb = np.broadcast_to(x, Y.shape)
+    fwhm = (np.where(half, xb, -np.inf).max(axis=1) - np.where(half, xb, np.inf).min(axis=1))
+    span = (x.max() - x.min()) if x.size else 1.0
+    fwhm = np.where(np.isfinite(fwhm) & (fwhm > 0), fwhm, span / 10 or 1.0)
+    return a, x0, fwhm, c, m
+
+
+def _guess_gauss(x, Y, W):
+    a, x0, fwhm, c, _ = _peak_guess(x, Y, W)
+    return np.column_stack([a, x0, fwhm / (2 * np.sqrt(2 * np.log(2))), c])
+
+
+def _guess_lorentz(x, Y, W):
+    a, x0, fwhm, c, _ = _peak_guess(x, Y, W)
+    return np.column_stack([a, x0, fwhm / 2, c])
+
+
+# --- 組み込みモデル ---
+
+def _exp(x, a, b):
+    return a * np.exp(b * x)
+
+
+def _exp_jac(x, a, b):
+    e = np.exp(b * x)
+    return [e, a * x * e]
+
+
+def _power(x, a, b):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return a * np.power(x, b)
+
+
+def _power_jac(x, a, b):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = np.power(x, b)
+        return [p, a * p * np.log(x)]
+
+
+def _gauss(x, a, x0, s, c):
+    return a * np.exp(-(x - x0) ** 2 / (2 * s * s)) + c
+
+
+def _gauss_jac(x, a, x0, s, c):
+    d = x - x0
+    g = np.exp(-d * d / (2 * s * s))
+    return [g, a * g * d / (s * s), a * g * d * d / (s * s * s), np.ones_like(g)]
+
+
+def _lorentz(x, a, x0, w, c):
+    w2 = w * w
+    return a * w2 / ((x - x0) ** 2 + w2) + c
+
+
+def _lorentz_jac(x, a, x0, w, c):
+    d = x - x0
+    w2 = w * w
+    den = d * d + w2
+    lor = w2 / den
+    return [lor, a * 2 * w2 * d / (den * den), a * 2 * w * d * d / (den * den), np.ones_like(lor)]
+
+
+MODELS = {
+    'exp': Model('exp', ['a', 'b'], _exp, _guess_exp, _exp_jac, tex="y=ae^{bx}"),
+    'power': Model('power', ['a', 'b'], _power, _guess_power, _power_jac, tex="y=ax^{b}"),
+    'gauss': Model('gauss', ['a', 'x_0', '\\sigma', 'c'], _gauss, _guess_gauss, _gauss_jac,
+                   tex="y=ae^{-(x-x_0)^2/2\\sigma^2}+c", positive=(2,)),
+    'lorentz': Model('lorentz', ['a', 'x_0', '\\gamma', 'c'], _lorentz, _guess_lorentz, _lorentz_jac,
+                     tex="y=\\frac{a\\gamma^2}{(x-x_0)^2+\\gamma^2}+c", positive=(2,)),
+}
+
+
+def polynomial(degree):
+    """degree 次の多項式 (係数は低次から c_0, c_1, ...)"""
+    degree = int(degree)
+    if degree < 1:
+        raise ValueError("多項式の次数は1以上にしてください")
+
+    def func(x, *c):
+        y = c[-1]
+        for coef in reversed(c[:-1]):
+            y = y * x + coef
+        return y
+
+    return Model(f'poly{degree}', [f'c_{i}' for i in range(degree + 1)], func, linear=True)
+
+
+# --- ユーザー定義式 ---
+
+FORMULA_FUNCS = {
+    'exp': np.exp, 'log': np.log, 'ln': np.log, 'log10': np.log10, 'sqrt': np.sqrt,
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'arctan': np.arctan,
+    'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh, 'abs': np.abs,
+}
+FORMULA_CONSTS = {'pi': np.pi}
+_FORMULA_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Constant, ast.Load,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+
+def parse_formula(text):
+    """"a*exp(-x/b)+c" のような式からモデルを作る (x 以外の名前がパラメータ)
+
+    使える関数は FORMULA_FUNCS、定数は pi。"^" は累乗として扱う。
+    初期値は 1。"a*exp(-x/b)+c; b=20, c=0.5" のように ";" の後に書くと変えられる。
+    式として読めないときは ValueError。
+    """
+    expr, _, init_text = text.partition(';')
+    expr = expr.strip()
+    if '=' in expr:
+        expr = expr.split('=', 1)[1]  # "y = ..." の形も受け付ける
+    expr = expr.strip().replace('^', '**')
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except SyntaxError:
+        raise ValueError(f"式を読み取れません: {text}")
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _FORMULA_NODES):
+            raise ValueError(f"式に使えない要素があります: {text}")
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id in FORMULA_FUNCS) or node.keywords:
+                raise ValueError(f"使えない関数です: {ast.unparse(node.func)}")
+        elif isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Constant) and (not isinstance(node.value, (int, float))
+                                                 or not np.isfinite(node.value)):
+            raise ValueError(f"式に使えない値があります: {node.value!r}")
+    if 'x' not in names:
+        raise ValueError("式に x が含まれていません")
+    params = sorted(names - set(FORMULA_FUNCS) - set(FORMULA_CONSTS) - {'x'})
+    if not params:
+        raise ValueError("式にパラメータ (x 以外の文字) がありません")
+    code = compile(tree, '<formula>', 'eval')
+
+    initial = dict.fromkeys(params, 1.0)
+    for item in init_text.split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in initial:
+            raise ValueError(f"初期値の指定が式のパラメータにありません: {item.strip()}")
+        try:
+            initial[name] = float(value)
+        except ValueError:
+            raise ValueError(f"初期値を読み取れません: {item.strip()}")
+        if not np.isfinite(initial[name]):
+            # inf / nan から始めると最適化の途中で分かりにくい失敗になる
+            raise ValueError(f"初期値は有限の数にしてください: {item.strip()}")
+    p0 = np.array([initial[name] for name in params])
+
+    def func(x, *values):
+        env = dict(FORMULA_FUNCS, **FORMULA_CONSTS)
+        env['x'] = x
+        env.update(zip(params, values))
+        with np.errstate(all='ignore'):
+            return eval(code, {'__builtins__': {}}, env)
+
+    def guess(x, Y, W):
+        return np.tile(p0, (Y.shape[0], 1))
+
+    return Model('formula:' + expr + ';' + init_text.strip(), params, func, guess, tex="y=" + expr.replace('**', '^'))
+
+
+def make_model(kind, degree=2, formula=""):
+    """近似設定 (種類・次数・式) からモデルを作る"""
+    if kind == 'poly':
+        return polynomial(degree)
+    if kind == 'formula':
+        return parse_formula(formula)
+    return MODELS[kind]
+
+
+# --- 解法 ---
+
+def select_range(x, ys, x_range):
+    """範囲 [min, max] の点だけ取り出す。返り値 (x, Y, W): Y の無効値は 0、W が有効マスク
+
+    ys は (m, n) の配列か、長さ n の配列のリスト (列ごとに範囲内だけ写すので、全体は並べ直さない)。
+    """
+    x = np.asarray(x, dtype=float)
+    if isinstance(ys, np.ndarray) and ys.ndim == 1:
+        ys = [ys]
+    lo, hi = x_range
+    sel = np.isfinite(x) & (x >= lo) & (x <= hi)
+    xs = x[sel]
+    Y = np.array([np.asarray(y, dtype=float)[sel] for y in ys]).reshape(-1, xs.size)
+    W = np.isfinite(Y)
+    return xs, np.where(W, Y, 0.0), W
+
+
+def _cost(model, x, Y, W, P):
+    with np.errstate(all='ignore'):
+        r = np.where(W, Y - _evaluate(model.func, x, P), 0.0)
+        return np.einsum('mn,mn->m', r, r)
+
+
+def _jacobian_columns(model, x, P, f):
+    """ヤコビアンをパラメータごとの (m, n) 配列のリストで返す"""
+    with np.errstate(all='ignore'):
+        if model.jac is not None:
+            cols = model.jac(x[None, :], *(P[:, j, None] for j in range(P.shape[1])))
+            return [np.broadcast_to(c, f.shape) for c in cols]
+        cols = []
+        for j in range(P.shape[1]):
+            h = FD_STEP * np.maximum(np.abs(P[:, j]), 1.0)
+            Ph = P.copy()
+            Ph[:, j] += h
+            cols.append((_evaluate(model.func, x, Ph) - f) / h[:, None])
+        return cols
+
+
+def _normal_equations(model, x, Y, W, P):
+    """JᵀJ (m, k, k) と Jᵀr (m, k) を作る ((m, n, k) の配列は作らない)"""
+    k = P.shape[1]
+    with np.errstate(all='ignore'):
+        f = _evaluate(model.func, x, P)
+        r = np.where(W, Y - f, 0.0)
+        cols = [np.where(W & np.isfinite(c), c, 0.0) for c in _jacobian_columns(model, x, P, f)]
+        A = np.empty((P.shape[0], k, k))
+        g = np.empty((P.shape[0], k))
+        for i in range(k):
+            g[:, i] = np.einsum('an,an->a', cols[i], r)
+            for j in range(i, k):
+                A[:, i, j] = A[:, j, i] = np.einsum('an,an->a', cols[i], cols[j])
+    return A, g
+
+
+def _solve_batched(M, g):
+    """M @ step = g を行ごとに解く (特異な行は最小二乗で)"""
+    try:
+        return np.linalg.solve(M, g[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.stack([np.linalg.lstsq(Mi, gi, rcond=None)[0] for Mi, gi in zip(M, g)])
+
+
+def levenberg_marquardt(model, x, Y, W, P0, check=None, max_iter=MAX_ITER):
+    """全系列を同時に Levenberg-Marquardt で解く
+
+    収束した系列は計算から外し、残りだけを反復する。check() を反復ごとに呼ぶ
+    (キャンセルしたいときは例外を投げる)。
+    返り値 (params (m, k), cost (m,), converged (m,), 反復回数)
+    """
+    P = np.array(P0, dtype=float)
+    m, k = P.shape
+    cost = _cost(model, x, Y, W, P)
+    lam = np.full(m, LAMBDA_INIT)
+    converged = np.zeros(m, dtype=bool)
+    active = np.isfinite(cost) & (W.sum(axis=1) >= k)
+    # 正規方程式は解が動いた行だけ作り直す (ステップを棄却した行は λ だけ変えて解き直す)
+    A = np.zeros((m, k, k))
+    g = np.zeros((m, k))
+    stale = np.ones(m, dtype=bool)
+    eye = np.eye(k)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        if check:
+            check()
+        update = idx[stale[idx]]
+        if update.size:
+            A[update], g[update] = _normal_equations(model, x, Y[update], W[update], P[update])
+            stale[update] = False
+        Pa, Ya, Wa = P[idx], Y[idx], W[idx]
+        # Marquardt のスケーリング (diag(JᵀJ)) でパラメータの桁の違いを吸収する
+        d = np.diagonal(A[idx], axis1=1, axis2=2)
+        d = np.maximum(d, 1e-12 * d.max(axis=1, keepdims=True) + 1e-300)
+        step = _solve_batched(A[idx] + lam[idx, None, None] * eye * d[:, None, :], g[idx])
+        P_new = Pa + step
+        cost_new = _cost(model, x, Ya, Wa, P_new)
+
+        ok = np.isfinite(cost_new) & (cost_new <= cost[idx])
+        acc = idx[ok]
+        small_cost = (cost[acc] - cost_new[ok]) <= COST_TOL * np.maximum(cost[acc], 1e-300)
+        small_step = (np.abs(step[ok]) <= STEP_TOL * (np.abs(Pa[ok]) + STEP_TOL)).all(axis=1)
+        P[acc] = P_new[ok]
+        cost[acc] = cost_new[ok]
+        lam[acc] = np.maximum(lam[acc] / 3, 1e-12)
+        stale[acc] = True
+        done = acc[small_cost | small_step | (cost_new[ok] == 0)]
+
+        rej = idx[~ok]
+        lam[rej] *= 4
+        # これ以上減らせない (局所解) ものも収束とみなす
+        stuck = rej[lam[rej] > LAMBDA_MAX]
+
+        converged[done] = True
+        converged[stuck] = True
+        active[done] = False
+        active[stuck] = False
+
+    for j in model.positive:
+        P[:, j] = np.abs(P[:, j])
+    return P, cost, converged, iterations
+
+
+def solve_polynomial(model, x, Y, W):
+    """多項式を重み付き線形最小二乗で全系列まとめて解く (x を [-1, 1] に写して条件を良くする)"""
+    m = Y.shape[0]
+    k = len(model.params)
+    P = np.full((m, k), np.nan)
+    if x.size == 0:
+        return P
+    lo, hi = float(x.min()), float(x.max())
+    mid, half = (lo + hi) / 2, (hi - lo) / 2 or 1.0
+    V = np.vander((x - mid) / half, k, increasing=True)      # (n, k)
+    w = W.astype(float)
+    A = np.einsum('mn,ni,nj->mij', w, V, V)
+    b = np.einsum('mn,ni->mi', w * Y, V)
+    ok = W.sum(axis=1) >= k
+    if ok.any():
+        coef = _solve_batched(A[ok], b[ok])
+        # [-1, 1] 上の係数を元の x の係数に戻す
+        for row, c in zip(np.flatnonzero(ok), coef):
+            raw = np.polynomial.Polynomial(c, domain=[mid - half, mid + half]).convert().coef
+            P[row, :len(raw)] = raw
+            P[row, len(raw):] = 0.0
+    return P
+
+
+def summarize(model, x, Y, W, P):
+    """当てはめの評価: R^2・使った点の数・X の範囲 (各 (m,))"""
+    count = W.sum(axis=1)
+    with np.errstate(all='ignore'):
+        f = _evaluate(model.func, x, P)
+        ss_res = np.where(W, (Y - f) ** 2, 0.0).sum(axis=1)
+        mean = np.where(W, Y, 0.0).sum(axis=1) / count
+        ss_tot = np.where(W, (Y - mean[:, None]) ** 2, 0.0).sum(axis=1)
+        r2 = 1 - ss_res / ss_tot
+    xb = np.broadcast_to(x, Y.shape)
+    x_min = np.where(W, xb, np.inf).min(axis=1, initial=np.inf)
+    x_max = np.where(W, xb, -np.inf).max(axis=1, initial=-np.inf)
+    x_min[count == 0] = np.nan
+    x_max[count == 0] = np.nan
+    return {'r2': r2, 'count': count, 'x_min': x_min, 'x_max': x_max}
+
+
+def fit_curves(model, x, ys, x_range, p0=None, check=None):
+    """全系列 (ys: (m, n) か長さ n の配列のリスト) に model を当てはめる。x_range の点だけを使う
+
+    p0 に前回の解 ((m, k)、無い行は NaN) を渡すとそこから反復を始める (ウォームスタート)。
+    ウォームスタートで収束しなかった行は、データからの初期値でやり直して良い方を採る。
+    返り値: {'params', 'r2', 'count', 'x_min', 'x_max', 'converged', 'iterations'}
+    """
+    xs, Y, W = select_range(x, ys, x_range)
+    m, k = Y.shape[0], len(model.params)
+
+    if not (W.sum(axis=1) >= k).any():
+        P = np.full((m, k), np.nan)  # どの系列も点が足りない
+        converged = np.zeros(m, dtype=bool)
+        iterations = 0
+    elif model.linear:
+        P = solve_polynomial(model, xs, Y, W)
+        converged = np.isfinite(P).all(axis=1)
+        iterations = 0
+    else:
+        P0 = model.guess(xs, Y, W)
+        warm = np.zeros(m, dtype=bool)
+        if p0 is not None:
+            warm = np.isfinite(p0).all(axis=1)
+            P0[warm] = p0[warm]
+        P, cost, converged, iterations = levenberg_marquardt(model, xs, Y, W, P0, check)
+        retry = np.flatnonzero(warm & ~converged)
+        if retry.size:
+            P2, cost2, conv2, it2 = levenberg_marquardt(model, xs, Y[retry], W[retry],
+                                                        model.guess(xs, Y[retry], W[retry]), check)
+            better = ~(cost[retry] <= cost2)
+            P[retry[better]] = P2[better]
+            converged[retry[better]] = conv2[better]
+            iterations += it2
+        P[W.sum(axis=1) < k] = np.nan
+
+    result = summarize(model, xs, Y, W, P)
+    result.update(params=P, converged=converged, iterations=iterations)
+    return result
+
+
+class CurveFitCache:
+    """系列・近似設定ごとに前回の解を覚えておき、範囲を動かした時の初期値に使う
+
+    key (データ・X 列) が変わったら忘れる。fit() はロックで直列化する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._solutions = {}  # (tag, モデル, 列名) -> パラメータ
+
+    def invalidate(self):
+        self._key = None
+        self._solutions = {}
+
+    def fit(self, key, tag, model, x, columns, x_range, check=None):
+        """columns: [(列名, Y データ), ...]。tag は近似の組を区別する値。返り値は fit_curves() と同じ"""
+        with self._lock:
+            if key != self._key:
+                self.invalidate()
+                self._key = key
+            names = [name for name, _ in columns]
+            ys = [y for _, y in columns]
+            k = len(model.params)
+            p0 = np.full((len(names), k), np.nan)
+            for i, name in enumerate(names):
+                previous = self._solutions.get((tag, model.key, name))
+                if previous is not None:
+                    p0[i] = previous
+            result = fit_curves(model, x, ys, x_range, p0, check)
+            for i, name in enumerate(names):
+                params = result['params'][i]
+                if result['converged'][i] and np.isfinite(params).all():
+                    self._solutions[(tag, model.key, name)] = params.copy()
+        return result
@@ -0,0 +1,56 @@
+import os
+import time
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+
+class FileLock:
+    """プロセス間の排他ロック (with 文で使う)
+
+    ロック用のファイル path を開いてロックする。同じプロセスの別スレッドとの排他は
+    呼び出し側の threading.Lock で行うこと。
+    """
+
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.timeout = timeout
+        self._fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if msvcrt is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                # msvcrt.locking は待てる時間が短いので、取れるまで自分で待つ
+                deadline = time.monotonic() + self.timeout
+                while True:
+                    try:
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"ロックを取得できません: {self.path}")
+                        time.sleep(0.05)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            if msvcrt is None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
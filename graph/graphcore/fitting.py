@@ -0,0 +1,174 @@
+import threading
+
+import numpy as np
+
+
+def transform(values, log):
+    """対数モードなら log10 を取る (<= 0 は NaN)"""
+    values = np.asarray(values, dtype=float)
+    if not log:
+        return values
+    out = np.full(values.shape, np.nan)
+    np.log10(values, out=out, where=values > 0)
+    return out
+
+
+def sort_x(x, x_log=False):
+    """X を一度だけソートする (同じ X 列の系列で使い回せる)"""
+    x = np.asarray(x, dtype=float)
+    order = np.argsort(x, kind='stable')  # NaN は末尾に並ぶ
+    xs = x[order]
+    return {'order': order, 'xs': xs, 'u': transform(xs, x_log), 'x_log': x_log}
+
+
+def prepare(x, ys, x_log=False, y_log=False, x_sorted=None):
+    """X で一度だけソートし、範囲フィットに使う累積和 (十分統計量) を作る
+
+    x: (n,) の X データ、ys: (m, n) の Y データ (無効値は NaN)。
+    x_sorted に sort_x() の結果を渡すとソートを省略する。
+    返り値は fit_ranges() にそのまま渡す。
+    """
+    if x_sorted is None or x_sorted['x_log'] != x_log:
+        x_sorted = sort_x(x, x_log)
+    ys = np.atleast_2d(np.asarray(ys, dtype=float))
+
+    order = x_sorted['order']
+    xs = x_sorted['xs']
+    u = x_sorted['u']
+    v = transform(ys[:, order], y_log)
+
+    valid = np.isfinite(u)[None, :] & np.isfinite(v)
+    w = valid.astype(float)
+    # 桁落ちを防ぐため有効データの平均で中心化してから和を取る
+    n_valid = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cu = np.where(n_valid > 0, np.nansum(np.where(valid, u[None, :], 0.0), axis=1) / n_valid, 0.0)
+        cv = np.where(n_valid > 0, np.nansum(np.where(valid, v, 0.0), axis=1) / n_valid, 0.0)
+    uc = np.where(valid, u[None, :] - cu[:, None], 0.0)
+    vc = np.where(valid, v - cv[:, None], 0.0)
+
+    terms = np.stack([w, uc, vc, uc * uc, uc * vc, vc * vc])  # (6, m, n)
+    sums = np.zeros(terms.shape[:2] + (terms.shape[2] + 1,))
+    np.cumsum(terms, axis=2, out=sums[:, :, 1:])
+
+    return {
+        'xs': xs,
+        'valid_count': sums[0],
+        'sums': sums,
+        'center': (cu, cv),
+        'x_log': x_log,
+        'y_log': y_log,
+    }
+
+
+def fit_ranges(stats, ranges):
+    """全系列 × 全範囲の1次近似 (傾き・切片・R^2 と信頼区間用の統計量) をまとめて計算する
+
+    ranges: [(min, max), ...] (元の X の値で指定)。
+    返り値の各配列は (系列数, 範囲数)。点が2つ未満の組は count < 2 になる。
+    """
+    xs = stats['xs']
+    sums = stats['sums']
+    cu, cv = stats['center']
+
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    lo = np.searchsorted(xs, ranges[:, 0], side='left')
+    hi = np.searchsorted(xs, ranges[:, 1], side='right')
+
+    seg = sums[:, :, hi] - sums[:, :, lo]  # (6, m, k)
+    n, su, sv, suu, suv, svv = seg
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sxx = n * suu - su * su
+        sxy = n * suv - su * sv
+        syy = n * svv - sv * sv
+        slope = sxy / sxx
+        intercept = (sv - slope * su) / n + cv[:, None] - slope * cu[:, None]
+        r2 = sxy * sxy / (sxx * syy)
+        # 信頼区間用: 残差二乗和・u の平均・u の偏差平方和
+        ss_res = (syy - sxy * sxy / sxx) / n
+        u_mean = su / n + cu[:, None]
+        u_ss = sxx / n
+
+    count = np.rint(n).astype(int)
+    x_min, x_max = _fit_extent(stats['valid_count'], xs, lo, hi, count)
+
+    return {
+        'slope': slope,
+        'intercept': intercept,
+        'r2': r2,
+        'count': count,
+        'ss_res': np.maximum(ss_res, 0.0),
+        'u_mean': u_mean,
+        'u_ss': u_ss,
+        'x_min': x_min,
+        'x_max': x_max,
+    }
+
+
+def _fit_extent(valid_count, xs, lo, hi, count):
+    """各範囲で実際に使われた点の X の最小・最大 (近似直線の描画範囲)"""
+    m, k = count.shape
+    x_min = np.full((m, k), np.nan)
+    x_max = np.full((m, k), np.nan)
+    for i in range(m):
+        c = valid_count[i]
+        ok = count[i] > 0
+        # 累積個数が範囲の先頭から1つ増える位置 = 範囲内で最初の有効点
+        first = np.searchsorted(c, c[lo[ok]] + 1, side='left') - 1
+        last = np.searchsorted(c, c[hi[ok]], side='left') - 1
+        x_min[i, ok] = xs[first]
+        x_max[i, ok] = xs[last]
+    return x_min, x_max
+
+
+class FitCache:
+    """系列ごとの累積和を保持し、範囲を変えた時のフィットを O(log n) にする
+
+    X データ・X 列・対数フラグを表す key が変わった時だけ作り直す。
+    描画と書き出しのワーカースレッドから同時に呼ばれてもよいよう、fit() はロックで直列化する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._x_sorted = None
+        self._series = {}  # 列名 -> prepare() の結果
+
+    def invalidate(self):
+        self._key = None
+        self._x_sorted = None
+        self._series = {}
+
+    def clear(self):
+        """累積和を全て手放す (1次近似を使わなくなった時に呼ぶ)"""
+        with self._lock:
+            self.invalidate()
+
+    def fit(self, key, x, columns, ranges, x_log=False, y_log=False):
+        """columns: [(列名, Y データ), ...]。返り値は fit_ranges() と同じ形"""
+        with self._lock:
+            if key != self._key:
+                self.invalidate()
+                self._key = key
+            if self._x_sorted is None:
+                self._x_sorted = sort_x(x, x_log)
+
+            # 今回近似しない列 (表示から外した系列) の累積和は持ち続けない
+            names = {name for name, _ in columns}
+            self._series = {name: stats for name, stats in self._series.items() if name in names}
+            results = []
+            for name, y in columns:
+                stats = self._series.get(name)
+                if stats is None:
+                    stats = prepare(x, y, x_log, y_log, x_sorted=self._x_sorted)
+                    self._series[name] = stats
+                results.append(fit_ranges(stats, ranges))
+        return {k: np.vstack([r[k] for r in results]) for k in results[0]}
+
+
+def predict(slope, intercept, x, x_log=False, y_log=False):
+    """近似式を元のスケールで評価する"""
+    u = np.log10(x) if x_log else x
+    v = slope * u + intercept
+    return 10 ** v if y_log else v
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from graphcore.filelock import FileLock
+from graphcore.permissions import copy_permissions
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def coerce_numeric(df):
+    """全列を数値 (float64) に変換する。数値にできない値は NaN"""
+    return df.apply(pd.to_numeric, errors='coerce').astype(np.float64)
+
+
+class FrameCache:
+    """読み込み済みの表を (パス, サイズ, 更新時刻, シート) ごとに .npy で保存するキャッシュ
+
+    Excel の再パースを避けるためのもの。数値化した表を列ごとに連続した
+    float64 配列として保存し、合計サイズが max_bytes を超えたら
+    最後に使ってから最も時間が経ったものから消す (LRU)。
+
+    バッチ描画のワーカーなど複数のプロセスが同じ cache_dir を使ってもよいよう、
+    索引 (index.json) はファイルロックの中でディスクから読み直してから変更・保存する。
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock_path = os.path.join(cache_dir, "index.lock")
+        self._lock = threading.Lock()
+
+    # --- 公開API ---
+
+    def load(self, path, sheet, read_func):
+        """キャッシュにあればそれを、無ければ read_func() で読んで保存して返す"""
+        df = self.get(path, sheet)
+        if df is None:
+            df = self.put(path, sheet, read_func())
+        return df
+
+    def get(self, path, sheet):
+        key, _ = self._make_key(path, sheet)
+        entry = self._read_index().get(key)
+        if entry is None:
+            return None
+        try:
+            data = np.load(os.path.join(self.cache_dir, entry['file']))
+        except (OSError, ValueError):
+            # 壊れている・他のプロセスが追い出した直後
+            self._update_index(lambda index: index.pop(key, None))
+            return None
+
+        def touch(index):
+            if key in index:
+                index[key]['last_used'] = time.time()
+        self._update_index(touch)
+        return pd.DataFrame(data.T, columns=entry['columns'], copy=False)
+
+    def put(self, path, sheet, df):
+        """df を数値化して保存し、数値化した表を返す"""
+        df = coerce_numeric(df)
+        df.columns = [str(c) for c in df.columns]
+        key, source = self._make_key(path, sheet)
+        file_name = key + ".npy"
+        # 列ごとに連続したメモリになるよう (列, 行) で保存する
+        data = np.ascontiguousarray(df.to_numpy(dtype=np.float64).T)
+        if not self._write_atomic(file_name, lambda f: np.save(f, data)):
+            return df
+
+        def add(index):
+            # 同じファイル・シートの古い版は不要なので消す
+            for old_key in [k for k, e in index.items()
+                            if e['path'] == source['path'] and e['sheet'] == source['sheet'] and k != key]:
+                self._remove_entry(index, old_key)
+            index[key] = dict(source, file=file_name, bytes=int(data.nbytes),
+                              columns=list(df.columns), last_used=time.time())
+            self._evict(index, keep=key)
+        self._update_index(add)
+        return df
+
+    def sheet_names(self, path, read_func):
+        """シート名の一覧もキャッシュする (ブックを開かずに済ませる)"""
+        key, source = self._make_key(path, None)
+        key = "sheets-" + key
+        entry = self._read_index().get(key)
+        if entry is not None:
+            return entry['sheets']
+        sheets = list(read_func())
+
+        def add(index):
+            for old_key in [k for k, e in index.items()
+                            if e['path'] == source['path'] and e['sheet'] is None and k != key]:
+                self._remove_entry(index, old_key)
+            index[key] = dict(source, file=None, bytes=0, sheets=sheets, last_used=time.time())
+        self._update_index(add)
+        return sheets
+
+    def clear(self):
+        def remove_all(index):
+            for key in list(index):
+                self._remove_entry(index, key)
+        self._update_index(remove_all)
+
+    # --- 内部処理 ---
+
+    def _make_key(self, path, sheet):
+        abs_path = os.path.abspath(path)
+        st = os.stat(abs_path)
+        source = {
+            'path': abs_path,
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'sheet': sheet,
+        }
+        raw = json.dumps([abs_path, st.st_size, st.st_mtime_ns, sheet], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest(), source
+
+    def _read_index(self):
+        # 書き込みは os.replace で置き換えるので、ロック無しでも書きかけの索引は読まない
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update_index(self, func):
+        """ディスク上の索引を読み直し、func(index) で変更して書き戻す
+
+        他のプロセスが足した項目を消さないよう、読み直しから書き戻しまでファイルロックを持つ。
+        """
+        try:
+            with self._lock, FileLock(self.lock_path):
+                index = self._read_index()
+                func(index)
+                self._write_atomic("index.json", lambda f: f.write(
+                    json.dumps(index, ensure_ascii=False).encode('utf-8')))
+        except (OSError, TimeoutError) as e:
+            print(f"キャッシュ保存エラー: {e}")
+
+    def _write_atomic(self, file_name, write):
+        """一時ファイル (プロセスごとに別名) に書いてから file_name に置き換える。成功したら True"""
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=file_name + ".", suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            path = os.path.join(self.cache_dir, file_name)
+            copy_permissions(tmp_path, path)  # mkstemp は 0600 で作るので元の権限に戻す
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"キャッシュ保存エラー: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return False
+
+    def _remove_entry(self, index, key):
+        entry = index.pop(key)
+        if entry.get('file'):
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            except OSError:
+                pass
+
+    def _evict(self, index, keep=None):
+        """合計が max_bytes 以下になるまで古いものから消す (index はロック中に読み直したもの)"""
+        total = sum(e['bytes'] for e in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= index[key]['bytes']
+            self._remove_entry(index, key)
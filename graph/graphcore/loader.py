@@ -0,0 +1,87 @@
+import time
+import codecs
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+# 試す順番 (cp932 は shift_jis の拡張なので後ろに置く)
+ENCODINGS = ['utf-8-sig', 'shift_jis', 'cp932']
+SNIFF_BYTES = 64 * 1024
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def sniff_encoding(file_path, sample_size=SNIFF_BYTES):
+    """ファイル先頭だけを読んで文字コードを推定する"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+    for enc in ENCODINGS:
+        try:
+            # final=False: サンプル末尾で切れたマルチバイト文字はエラーにしない
+            codecs.getincrementaldecoder(enc)().decode(sample, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def downcast_floats(df):
+    """float64 の列を float32 にしてメモリを半分にする"""
+    float_cols = df.select_dtypes(include=['float64']).columns
+    if len(float_cols) > 0:
+        df[float_cols] = df[float_cols].astype(np.float32)
+    return df
+
+
+def load_csv(file_path, float32=False, dtype=None):
+    """CSV を1回だけパースして (DataFrame, 読み込み情報) を返す
+
+    文字コードは先頭サンプルから推定し、pyarrow があればそのエンジンで読む。
+    推定が外れた場合 (サンプルより後ろで文字コードエラー) だけ次の候補で読み直す。
+    """
+    start = time.perf_counter()
+    first = sniff_encoding(file_path)
+    if first is None:
+        raise ValueError("対応できない文字コードです")
+    candidates = [first] + [enc for enc in ENCODINGS if enc != first]
+
+    df = None
+    for enc in candidates:
+        try:
+            df, engine = _read_csv(file_path, enc, dtype)
+            break
+        except UnicodeDecodeError:
+            continue
+    if df is None:
+        raise ValueError("対応できない文字コードです")
+
+    if float32:
+        df = downcast_floats(df)
+
+    info = {
+        'encoding': enc,
+        'engine': engine,
+        'seconds': time.perf_counter() - start,
+        'memory_bytes': int(df.memory_usage(deep=True).sum()),
+        'rows': len(df),
+    }
+    return df, info
+
+
+def _read_csv(file_path, encoding, dtype):
+    if HAS_PYARROW:
+        try:
+            return pd.read_csv(file_path, encoding=encoding, dtype=dtype, engine='pyarrow'), 'pyarrow'
+        except UnicodeDecodeError:
+            raise
+        except Exception:
+            # pyarrow が扱えない形式 (不揃いな行など) は通常のエンジンで読む
+            pass
+    return pd.read_csv(file_path, encoding=encoding, dtype=dtype), 'c'
+
+
+def format_report(info):
+    """読み込み情報を1行の文字列にする"""
+    mb = info['memory_bytes'] / (1024 * 1024)
+    return f"{info['rows']} 行 / {mb:.1f} MB / {info['seconds'] * 1000:.0f} ms ({info['encoding']}, {info['engine']})"
@@ -0,0 +1,25 @@
+import os
+import stat
+
+
+def _new_file_mode():
+    # umask は設定し直さないと読めないので、起動時 (import 時) に1度だけ読む
+    mask = os.umask(0)
+    os.umask(mask)
+    return 0o666 & ~mask
+
+
+NEW_FILE_MODE = _new_file_mode()
+
+
+def copy_permissions(tmp_path, path):
+    """一時ファイルの権限を、置き換える先のファイルと同じにする
+
+    tempfile.mkstemp のファイルは 0600 で作られるので、そのまま os.replace すると
+    元のファイルの権限が失われる。元のファイルが無ければ umask に従った権限にする。
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    os.chmod(tmp_path, mode)
@@ -0,0 +1,188 @@
+import heapq
+import threading
+
+import numpy as np
+
+
+def sliding_median(y, window, start=0):
+    """窓幅 window の移動中央値 (2つのヒープ + 遅延削除で O(n log window))
+
+    i 番目の値は y[i - window + 1 : i + 1] の中央値。窓が埋まる i >= window - 1 から、
+    かつ i >= start の分だけを返す (追記分だけを計算するときに start を使う)。
+    """
+    n = len(y)
+    first = max(start, window - 1)
+    if first >= n:
+        return np.empty(0)
+    begin = first - window + 1
+    # low は下半分 (符号を反転した最大ヒープ)、high は上半分。要素は (値, 添字)
+    low, high = [], []
+    in_low = np.zeros(n - begin, dtype=bool)  # 各要素が今どちらのヒープにいるか
+    n_low = n_high = 0                        # 窓内 (期限切れを除く) の要素数
+    out = np.empty(n - first)
+    values = y.tolist()  # ループ内で numpy スカラーを作らない
+
+    for i in range(begin, n):
+        expire = i - window  # これ以下の添字は窓の外
+        if expire >= begin:
+            # 窓から出た要素は数だけ減らし、ヒープの先頭に来た時に捨てる
+            if in_low[expire - begin]:
+                n_low -= 1
+            else:
+                n_high -= 1
+        while low and low[0][1] <= expire:
+            heapq.heappop(low)
+        while high and high[0][1] <= expire:
+            heapq.heappop(high)
+
+        v = values[i]
+        if low and v > -low[0][0]:
+            heapq.heappush(high, (v, i))
+            n_high += 1
+        else:
+            heapq.heappush(low, (-v, i))
+            in_low[i - begin] = True
+            n_low += 1
+
+        # 個数を low = high または low = high + 1 に揃える
+        if n_low > n_high + 1:
+            nv, k = heapq.heappop(low)
+            heapq.heappush(high, (-nv, k))
+            in_low[k - begin] = False
+            n_low -= 1
+            n_high += 1
+        elif n_low < n_high:
+            hv, k = heapq.heappop(high)
+            heapq.heappush(low, (-hv, k))
+            in_low[k - begin] = True
+            n_low += 1
+            n_high -= 1
+        while low and low[0][1] <= expire:
+            heapq.heappop(low)
+        while high and high[0][1] <= expire:
+            heapq.heappop(high)
+
+        if i >= first:
+            if n_low > n_high:
+                out[i - first] = -low[0][0]
+            else:
+                out[i - first] = (high[0][0] - low[0][0]) / 2
+    return out
+
+
+def _cumsum0(values, offset=0.0):
+    """先頭に offset を置いた累積和 (長さ len(values) + 1)"""
+    out = np.empty(len(values) + 1)
+    out[0] = offset
+    np.cumsum(values, out=out[1:])
+    out[1:] += offset
+    return out
+
+
+class RollingSeries:
+    """1系列 (X でソート済み・有効な点のみ) の移動統計
+
+    平均・標準偏差は累積和から窓ごとに O(n) で求める (累積和は窓幅によらず使い回す)。
+    中央値は窓幅ごとに覚えておく。extend() で追記された分は末尾だけ計算し足す。
+    """
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        # 桁落ちを防ぐため先頭付近の平均で中心化して和を取る (追記しても変えない)
+        self.center = float(y[:1024].mean()) if len(y) else 0.0
+        d = y - self.center
+        self._s1 = _cumsum0(d)
+        self._s2 = _cumsum0(d * d)
+        self._medians = {}  # 窓幅 -> 移動中央値
+
+    def extend(self, x_new, y_new):
+        n_old = len(self.y)
+        self.x = np.concatenate([self.x, x_new])
+        self.y = np.concatenate([self.y, y_new])
+        d = y_new - self.center
+        self._s1 = np.concatenate([self._s1, _cumsum0(d, self._s1[-1])[1:]])
+        self._s2 = np.concatenate([self._s2, _cumsum0(d * d, self._s2[-1])[1:]])
+        for window, med in self._medians.items():
+            self._medians[window] = np.concatenate([med, sliding_median(self.y, window, start=n_old)])
+
+    def x_at(self, window):
+        """移動統計を置く X (窓の右端)"""
+        return self.x[window - 1:]
+
+    def _window_sums(self, window):
+        s1 = self._s1[window:] - self._s1[:-window]
+        s2 = self._s2[window:] - self._s2[:-window]
+        return s1, s2
+
+    def mean(self, window):
+        s1, _ = self._window_sums(window)
+        return s1 / window + self.center
+
+    def std(self, window):
+        """標本標準偏差 (window >= 2)"""
+        s1, s2 = self._window_sums(window)
+        var = (s2 - s1 * s1 / window) / (window - 1)
+        return np.sqrt(np.maximum(var, 0.0))
+
+    def median(self, window):
+        med = self._medians.get(window)
+        if med is None:
+            med = sliding_median(self.y, window)
+            self._medians[window] = med
+        return med
+
+
+class RollingCache:
+    """列ごとの RollingSeries を保持する
+
+    token (データの版) が変わった時は、新しいデータが前のデータの末尾に点を足しただけなら
+    extend() で追記分だけ計算し、そうでなければ作り直す。描画と書き出しのスレッドから
+    同時に呼ばれてもよいよう、compute() はロックで直列化する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted = {}  # X 列名 -> (token, ソート順, ソート済み X)
+        self._series = {}  # (X 列名, 列名) -> (token, RollingSeries)
+
+    def compute(self, token, x_name, x, name, y, kind, window):
+        """列 name の移動統計 kind ('mean' / 'median' / 'std') を返す: (X, 値)
+
+        X でソートした有効な点で計算する。点が窓幅より少なければ空の配列を返す。
+        """
+        with self._lock:
+            series = self._get(token, x_name, x, name, y)
+            if len(series.y) < window:
+                return np.empty(0), np.empty(0)
+            return series.x_at(window), getattr(series, kind)(window)
+
+    def _get(self, token, x_name, x, name, y):
+        cached = self._series.get((x_name, name))
+        if cached is not None and cached[0] == token:
+            return cached[1]
+
+        order, xs = self._sort(token, x_name, x)
+        ys = np.asarray(y, dtype=float)[order]
+        valid = np.isfinite(xs) & np.isfinite(ys)
+        xs, ys = xs[valid], ys[valid]
+
+        series = cached[1] if cached is not None else None
+        n_old = len(series.y) if series is not None else 0
+        if (series is not None and len(ys) >= n_old
+                and np.array_equal(xs[:n_old], series.x) and np.array_equal(ys[:n_old], series.y)):
+            if len(ys) > n_old:
+                series.extend(xs[n_old:], ys[n_old:])
+        else:
+            series = RollingSeries(xs, ys)
+        self._series[(x_name, name)] = (token, series)
+        return series
+
+    def _sort(self, token, x_name, x):
+        cached = self._sorted.get(x_name)
+        if cached is None or cached[0] != token:
+            x = np.asarray(x, dtype=float)
+            order = np.argsort(x, kind='stable')  # 同じ X は元の順 (追記分は後ろ) に並ぶ
+            cached = (token, order, x[order])
+            self._sorted[x_name] = cached
+        return cached[1], cached[2]
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import matplotlib.ticker as ticker
+
+
+def nan_abs_max(values, where=None):
+    """有限値の絶対値の最大 (NaN・inf は無視。有限値が無ければ 0)
+
+    where (bool 配列) を渡すと True の要素だけを見る (マスクを掛けた写しは作らない)。
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return 0.0
+    if where is None:
+        where = True
+    # abs() の一時配列を作らず、最小・最大の2回の走査で済ませる
+    with np.errstate(invalid='ignore'):
+        hi = np.fmax.reduce(values, axis=None, where=where, initial=-np.inf)
+        lo = np.fmin.reduce(values, axis=None, where=where, initial=np.inf)
+    if not (np.isfinite(hi) and np.isfinite(lo)):
+        # inf を含む (または全て NaN) ときだけ有限値を取り出してやり直す
+        finite = values[np.isfinite(values) & where]
+        if finite.size == 0:
+            return 0.0
+        hi, lo = finite.max(), finite.min()
+    return float(max(abs(lo), abs(hi)))
+
+
+def exponent_of(max_val):
+    """軸の指数表記に使う 10 の指数 (0 や非有限値なら 0)"""
+    if not max_val or not math.isfinite(max_val):
+        return 0
+    return int(math.floor(math.log10(abs(max_val))))
+
+
+def columns_exponent(num_cols, names):
+    """NumericColumns の列 names の絶対値の最大から指数を決める (列ごとの統計は再利用する)"""
+    max_val = max((num_cols[name].abs_max for name in names), default=0.0)
+    return exponent_of(max_val)
+
+
+class SciFormatter(ticker.Formatter):
+    """目盛りを「係数 × 10^指数」で表示するフォーマッタ (軸ごとに1つ作る)
+
+    10 ** exponent は作成時に1回だけ計算する。
+    """
+
+    def __init__(self, exponent, digits=1):
+        self.exponent = exponent
+        self.scale = 10.0 ** exponent
+        self._template = "${:.%df} \\times 10^{{%d}}$" % (digits, exponent)
+
+    def __call__(self, x, pos=None):
+        if x == 0:
+            return "0"
+        return self._template.format(x / self.scale)
@@ -0,0 +1,85 @@
+import os
+import json
+import atexit
+import tempfile
+import threading
+
+from graphcore.permissions import copy_permissions
+
+
+class SettingsStore:
+    """settings.json の読み書きをまとめる (変更がある時だけ、遅延・アトミックに書き込む)
+
+    save() は内容を JSON 文字列にして前回書き込んだ内容と比べるだけなので軽い。
+    実際の書き込みは delay 秒後にバックグラウンドで行い、終了時には flush() で書き出す。
+    """
+
+    def __init__(self, path, delay=1.0):
+        self.path = path
+        self.delay = delay
+        self._lock = threading.Lock()     # 状態の保護
+        self._io_lock = threading.Lock()  # 書き込みの順序を守る (save() は待たせない)
+        self._timer = None
+        self._written = None   # 最後にディスクと一致している内容
+        self._pending = None   # 書き込み待ちの内容
+        atexit.register(self.flush)
+
+    def load(self, defaults):
+        """defaults にファイルの内容を上書きして返す"""
+        settings = dict(defaults)
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                settings.update(json.loads(text))
+                self._written = text
+            except Exception:
+                pass
+        return settings
+
+    def is_dirty(self):
+        return self._pending is not None
+
+    def save(self, settings):
+        """変更があれば書き込みを予約する"""
+        text = json.dumps(settings, indent=4, ensure_ascii=False)
+        with self._lock:
+            if text == (self._pending if self._pending is not None else self._written):
+                return
+            self._pending = text
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """書き込み待ちの内容があれば今すぐ書き出す"""
+        with self._io_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                text = self._pending
+                self._pending = None
+            if text is None:
+                return
+            try:
+                self._write_atomic(text)
+                with self._lock:
+                    self._written = text
+            except Exception as e:
+                print(f"設定保存エラー: {e}")
+
+    def _write_atomic(self, text):
+        # 同じフォルダの一時ファイルに書いてから置き換える (書き込み途中で壊れない)
+        dir_name = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".settings-", suffix=".tmp", dir=dir_name)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            copy_permissions(tmp_path, self.path)  # mkstemp は 0600 で作るので元の権限に戻す
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,247 @@
+import os
+import math
+import threading
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from graphcore import curvefit
+
+LEVEL = 0.95
+# 1回にまとめて扱う (リサンプル数 × 点数) の上限 (インデックス行列のメモリを抑える)
+CHUNK_ELEMENTS = 2_000_000
+# (リサンプル数 × 点数) がこれ以下なら毎回 LM で解き直す。超えたら1段の線形化で近似する
+# (既定値。bootstrap_params の full_refit_elements で変えられる)
+FULL_REFIT_ELEMENTS = 2_000_000
+# これ以下はプロセスプールを使わずにその場で計算する (プロセス起動の方が高くつく)
+INPROCESS_ELEMENTS = 4_000_000
+REFIT_MAX_ITER = 30
+POLL_SECONDS = 0.1
+
+
+def t_quantile(p, dof):
+    """Student の t 分布の p 分位点 (scipy を使わない近似。dof >= 3 で誤差 1e-3 程度)"""
+    if dof == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if dof == 2:
+        return (2 * p - 1) * math.sqrt(2 / (4 * p * (1 - p)))
+    z = statistics.NormalDist().inv_cdf(p)
+    # Cornish-Fisher 展開
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3 + g4 / dof ** 4
+
+
+# --- 解析的な共分散 (1次・多項式) ---
+
+def linear_bands(slope, intercept, count, ss_res, u_mean, u_ss, u_eval, level=LEVEL):
+    """1次近似 v = slope * u + intercept の標準誤差と信頼区間・予測区間 (u, v は変換後の座標)
+
+    返り値: {'errors': [傾き, 切片の標準誤差], 'conf': (下限, 上限), 'pred': (下限, 上限)}
+    点が3つ未満なら None。
+    """
+    dof = int(count) - 2
+    if dof < 1 or not (u_ss > 0):
+        return None
+    s2 = ss_res / dof
+    t = t_quantile(0.5 + level / 2, dof)
+    d2 = (np.asarray(u_eval) - u_mean) ** 2
+    v = slope * u_eval + intercept
+    conf = t * np.sqrt(s2 * (1 / count + d2 / u_ss))
+    pred = t * np.sqrt(s2 * (1 + 1 / count + d2 / u_ss))
+    errors = [math.sqrt(s2 / u_ss), math.sqrt(s2 * (1 / count + u_mean ** 2 / u_ss))]
+    return {'errors': errors, 'conf': (v - conf, v + conf), 'pred': (v - pred, v + pred)}
+
+
+def polynomial_bands(model, x, y, x_eval, level=LEVEL):
+    """多項式近似の係数の標準誤差と信頼区間・予測区間 (x, y は範囲内の有効な点)"""
+    k = len(model.params)
+    n = len(x)
+    dof = n - k
+    if dof < 1:
+        return None
+    lo, hi = float(x.min()), float(x.max())
+    mid, half = (lo + hi) / 2, (hi - lo) / 2 or 1.0
+    V = np.vander((x - mid) / half, k, increasing=True)
+    G_inv = np.linalg.pinv(V.T @ V)
+    c = G_inv @ (V.T @ y)
+    resid = y - V @ c
+    s2 = float(resid @ resid) / dof
+    t = t_quantile(0.5 + level / 2, dof)
+
+    Ve = np.vander((np.asarray(x_eval) - mid) / half, k, increasing=True)
+    f = Ve @ c
+    var_f = s2 * np.einsum('ij,jk,ik->i', Ve, G_inv, Ve)
+    conf = t * np.sqrt(var_f)
+    pred = t * np.sqrt(var_f + s2)
+
+    # [-1, 1] 上の係数から元の x の係数への線形変換で共分散を移す
+    M = np.zeros((k, k))
+    for j in range(k):
+        raw = np.polynomial.Polynomial(np.eye(k)[j], domain=[mid - half, mid + half]).convert().coef
+        M[:len(raw), j] = raw
+    cov = s2 * M @ G_inv @ M.T
+    return {'errors': list(np.sqrt(np.maximum(np.diag(cov), 0.0))),
+            'conf': (f - conf, f + conf), 'pred': (f - pred, f + pred)}
+
+
+# --- ブートストラップ (非線形近似) ---
+
+def _bootstrap_task(model_args, x, fitted, resid, p_hat, count, seed, full_refit, check=None):
+    """残差ブートストラップを count 回行い、(count, パラメータ数) の解を返す (ワーカープロセスで実行)
+
+    リサンプルは (行数, 点数) のインデックス行列でまとめて作り、全行を同時に解く。
+    full_refit が偽なら LM で解き直さず、p_hat まわりの線形化 (Gauss-Newton 1段) で近似する。
+    """
+    model = curvefit.make_model(*model_args)
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    rows = max(1, CHUNK_ELEMENTS // n)
+    if not full_refit:
+        # J と (JᵀJ)⁻¹ は p_hat で1回だけ作る
+        P = p_hat[None, :]
+        f = curvefit._evaluate(model.func, x, P)
+        J = np.stack(curvefit._jacobian_columns(model, x, P, f), axis=2)[0]  # (n, k)
+        J = np.where(np.isfinite(J), J, 0.0)
+        solve_op = np.linalg.pinv(J.T @ J) @ J.T  # (k, n)
+    out = []
+    for start in range(0, count, rows):
+        if check:
+            check()
+        b = min(rows, count - start)
+        r_star = resid[rng.integers(0, n, size=(b, n))]
+        if full_refit:
+            Y = fitted + r_star
+            W = np.ones(Y.shape, dtype=bool)
+            P_b, _, converged, _ = curvefit.levenberg_marquardt(
+                model, x, Y, W, np.tile(p_hat, (b, 1)), max_iter=REFIT_MAX_ITER)
+            P_b[~converged] = np.nan
+        else:
+            P_b = p_hat + r_star @ solve_op.T
+        out.append(P_b)
+    return np.vstack(out)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """ブートストラップ用のプロセスプール (初回に作り、以降は使い回す)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            ctx = multiprocessing.get_context('spawn')  # Windows と同じ起動方法に揃える
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=ctx)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def is_linearized(n_resamples, n_points, full_refit_elements=FULL_REFIT_ELEMENTS):
+    """この大きさのブートストラップを解き直さずに線形化で近似するか
+
+    線形化は p_hat まわりの1次近似 (デルタ法に近い) で、非線形性の強いモデルでは
+    区間が本来のブートストラップとずれる。表示側で線形化したことを示すために使う。
+    """
+    return n_resamples * n_points > full_refit_elements
+
+
+def bootstrap_params(model_args, x, y, p_hat, n_resamples, check=None, progress=None, seed=None,
+                     full_refit_elements=FULL_REFIT_ELEMENTS):
+    """残差ブートストラップで得たパラメータの標本 (有効な行だけ, パラメータ数) と残差を返す
+
+    model_args は curvefit.make_model() の引数 (ワーカーへ渡すため関数ではなく設定で渡す)。
+    大きい問題はプロセスプールに分けて投げる。check() が例外を投げたら残りを取り消して止める。
+    progress(済んだ割合) を区切りごとに呼ぶ。(リサンプル数 × 点数) が full_refit_elements を
+    超えたら LM で解き直さず線形化で近似する (is_linearized)。
+    """
+    model = curvefit.make_model(*model_args)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n, k = len(x), len(p_hat)
+    fitted = model(x, p_hat)
+    # 残差は自由度で膨らませる (そのままだと散らばりを小さく見積もる)
+    resid = (y - fitted) * math.sqrt(n / max(n - k, 1))
+    seeds = np.random.SeedSequence(seed)
+    # 解き直すか線形化するかは全体の大きさで決める (タスクごとに変えると結果が混ざる)
+    full_refit = not is_linearized(n_resamples, n, full_refit_elements)
+
+    if n_resamples * n <= INPROCESS_ELEMENTS:
+        samples = _bootstrap_task(model_args, x, fitted, resid, p_hat, n_resamples,
+                                  seeds.spawn(1)[0], full_refit, check)
+    else:
+        pool = get_pool()
+        n_tasks = min(n_resamples, 4 * (os.cpu_count() or 1))
+        counts = [n_resamples // n_tasks + (i < n_resamples % n_tasks) for i in range(n_tasks)]
+        futures = [pool.submit(_bootstrap_task, model_args, x, fitted, resid, p_hat, c, s, full_refit)
+                   for c, s in zip(counts, seeds.spawn(n_tasks))]
+        try:
+            pending = set(futures)
+            while pending:
+                if check:
+                    check()
+                done, pending = wait(pending, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                if progress and done:
+                    progress(1 - len(pending) / len(futures))
+            samples = np.vstack([f.result() for f in futures])
+        except BrokenProcessPool:
+            shutdown_pool()  # ワーカーが落ちたプールは使えないので、次回作り直す
+            raise
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+    samples = samples[np.isfinite(samples).all(axis=1)]
+    return samples, resid
+
+
+def bootstrap_bands(model, samples, resid, p_hat, x_eval, level=LEVEL, seed=None):
+    """ブートストラップ標本から標準誤差と信頼区間・予測区間 (パーセンタイル) を作る"""
+    if len(samples) < 2:
+        return None
+    alpha = (1 - level) / 2 * 100
+    curves = model(x_eval, samples)                                   # (B, 評価点)
+    rng = np.random.default_rng(seed)
+    noisy = curves + resid[rng.integers(0, len(resid), size=curves.shape)]
+    with np.errstate(invalid='ignore'):
+        conf = np.nanpercentile(curves, [alpha, 100 - alpha], axis=0)
+        pred = np.nanpercentile(noisy, [alpha, 100 - alpha], axis=0)
+    errors = list(np.std(samples, axis=0, ddof=1))
+    for j in model.positive:
+        errors[j] = float(np.std(np.abs(samples[:, j]), ddof=1))
+    return {'errors': errors, 'conf': (conf[0], conf[1]), 'pred': (pred[0], pred[1])}
+
+
+class BandCache:
+    """計算済みの区間を覚えておく (ブートストラップは重いので、同じ条件なら再利用する)
+
+    key にはデータ・X 列・近似の設定・範囲・系列・リサンプル数を入れる。古いものから捨てる。
+    """
+
+    def __init__(self, max_entries=64):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
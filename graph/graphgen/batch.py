@@ -0,0 +1,252 @@
+"""graph.py のバッチモード: 複数ファイルを対話なしでまとめて描画する
+
+使い方:
+    python graph.py --batch <ディレクトリ or glob> --spec job.json [--workers N] [--make]
+
+--make を付けると、前回から入力データ・描画設定が変わったファイルだけを描き直す。
+
+job.json の例 (省略したキーは settings.json の値を使う):
+    {"x_label": "時間", "x_unit": "s", "y_label": "電流", "y_unit": "A",
+     "use_trendline": "y", "sheet": 0}
+"""
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")  # 画面を使わない (ワーカーでも同じ)
+
+import graph
+
+DATA_EXTS = ('.csv', '.xlsx', '.xls')
+MANIFEST_NAME = ".graphgen-manifest.json"
+
+# 出力画像に影響する設定 (これ以外の settings.json の変更では描き直さない)
+RENDER_KEYS = [
+    "x_label", "x_unit", "y_label", "y_unit", "use_trendline", "sheet",
+    "font_family", "font_size", "figure_size", "marker_size", "dpi", "grid", "float32",
+]
+# graph.py のほかに出力画像を左右するモジュール (読み込み・数値化・目盛り)
+RENDER_MODULES = ["graphcore.loader", "graphcore.columns", "graphcore.scale", "graphcore.frame_cache"]
+
+
+def find_inputs(target):
+    """ディレクトリなら中のデータファイル全部、それ以外は glob として展開する"""
+    if os.path.isdir(target):
+        pattern = os.path.join(target, "**", "*")
+        paths = glob.glob(pattern, recursive=True)
+    else:
+        paths = glob.glob(target, recursive=True)
+    return sorted(p for p in paths if os.path.splitext(p)[1].lower() in DATA_EXTS)
+
+
+def load_job(spec_path, settings):
+    """settings に job.json の内容を上書きした設定を返す"""
+    job = dict(settings)
+    if spec_path:
+        with open(spec_path, 'r', encoding='utf-8') as f:
+            job.update(json.load(f))
+    return job
+
+
+def settings_digest(job):
+    """描画に関係する設定と、graph.py・描画に使う共通モジュールのソースのハッシュ"""
+    h = hashlib.sha1()
+    h.update(json.dumps({k: job.get(k) for k in RENDER_KEYS}, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    sources = [graph.__file__] + [importlib.util.find_spec(name).origin for name in RENDER_MODULES]
+    for source in sources:
+        with open(source, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def file_digest(path, block_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def output_path_for(file_path):
+    """create_graph と同じ規則: <データと同じ場所>/<ベース名>.png"""
+    return os.path.splitext(os.path.abspath(file_path))[0] + ".png"
+
+
+def find_conflicts(inputs):
+    """同じ画像に描き出す入力の組 (data.csv と data.xlsx など) を {出力先: [入力, ...]} で返す"""
+    by_output = {}
+    for path in inputs:
+        by_output.setdefault(output_path_for(path), []).append(path)
+    return {output: paths for output, paths in by_output.items() if len(paths) > 1}
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def plan_build(inputs, job, manifest):
+    """描き直しが必要なファイルと、その入力の状態 (サイズ・更新時刻・ハッシュ) を返す
+
+    サイズと更新時刻が前回と同じなら中身は読まない (make と同じ考え方)。
+    時刻だけ変わった場合はハッシュを比べ、中身が同じなら描き直さない。
+    """
+    digest = settings_digest(job)
+    dirty = []
+    states = {}
+    for path in inputs:
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        entry = manifest.get(key)
+        state = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'settings': digest}
+        if entry and (entry['size'], entry['mtime']) == (st.st_size, st.st_mtime_ns):
+            state['hash'] = entry['hash']
+        else:
+            state['hash'] = file_digest(path)
+        states[key] = state
+
+        up_to_date = (
+            entry is not None
+            and entry['hash'] == state['hash']
+            and entry['settings'] == digest
+            and os.path.exists(output_path_for(path))
+        )
+        if not up_to_date:
+            dirty.append(path)
+    return dirty, states
+
+
+def init_worker():
+    """ワーカー起動時に1回だけ matplotlib を準備する"""
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+    plt.rcParams['mathtext.fontset'] = 'cm'
+    plt.rcParams['mathtext.default'] = 'it'
+
+
+def render_one(file_path, job):
+    """1ファイルを描画して (ファイル, 出力先, 秒数, エラー) を返す"""
+    start = time.perf_counter()
+    try:
+        x_label = graph.combine_label_and_unit(job.get("x_label", ""), job.get("x_unit", ""))
+        y_label = graph.combine_label_and_unit(job.get("y_label", ""), job.get("y_unit", ""))
+        use_trendline = str(job.get("use_trendline", "n")).lower() in ['y', 'yes', 'true']
+        output = graph.create_graph(file_path, x_label, y_label, job,
+                                    show_trendline=use_trendline, sheet=job.get("sheet", 0))
+        error = None if output else "描画できませんでした"
+    except Exception as e:
+        output, error = None, str(e)
+    return file_path, output, time.perf_counter() - start, error
+
+
+def run_batch(inputs, job, workers=None):
+    """inputs をプロセスプールで並列に描画し、結果のリストを返す"""
+    results = []
+    start = time.perf_counter()
+    if workers == 1:
+        init_worker()
+        for path in inputs:
+            results.append(render_one(path, job))
+            report(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = [pool.submit(render_one, path, job) for path in inputs]
+            for future in as_completed(futures):
+                results.append(future.result())
+                report(results[-1])
+    summarize(results, time.perf_counter() - start)
+    return results
+
+
+def report(result):
+    file_path, output, seconds, error = result
+    name = os.path.basename(file_path)
+    if error:
+        print(f"[失敗] {name} ({seconds:.2f} s): {error}")
+    else:
+        print(f"[完了] {name} -> {os.path.basename(output)} ({seconds:.2f} s)")
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if not r[3]]
+    failed = [r for r in results if r[3]]
+    total_work = sum(r[2] for r in results)
+    print("=" * 30)
+    print(f"成功 {len(ok)} / 失敗 {len(failed)} / 合計 {len(results)} ファイル")
+    print(f"経過時間 {elapsed:.2f} s (各ファイルの合計 {total_work:.2f} s)")
+    for r in failed:
+        print(f"  失敗: {r[0]}")
+    print("=" * 30)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="graph.py --batch", description="グラフを一括作成します")
+    parser.add_argument("target", help="データのあるディレクトリ、または glob パターン")
+    parser.add_argument("--spec", help="ラベル・単位・近似直線などを書いた JSON")
+    parser.add_argument("--workers", type=int, default=None, help="並列数 (既定: CPU数)")
+    parser.add_argument("--make", action="store_true", help="変更のあったファイルだけ描き直す")
+    parser.add_argument("--manifest", help=f"--make の記録ファイル (既定: 対象ディレクトリの {MANIFEST_NAME})")
+    args = parser.parse_args(argv)
+
+    inputs = find_inputs(args.target)
+    if not inputs:
+        print(f"エラー: データファイルが見つかりません: {args.target}")
+        return 1
+    conflicts = find_conflicts(inputs)
+    if conflicts:
+        # 並列に描くと同じ画像を取り合い、1枚しか残らないのに両方成功と数えてしまう
+        print("エラー: 同じ画像に出力されるファイルがあります (拡張子だけが違うファイルはどちらかを除いてください)")
+        for output, paths in sorted(conflicts.items()):
+            print(f"  {output} <- " + ", ".join(os.path.basename(p) for p in paths))
+        return 1
+    job = load_job(args.spec, graph.load_settings())
+
+    if not args.make:
+        print(f"{len(inputs)} ファイルを描画します")
+        results = run_batch(inputs, job, args.workers)
+        return 1 if any(r[3] for r in results) else 0
+
+    manifest_path = args.manifest or os.path.join(
+        args.target if os.path.isdir(args.target) else os.getcwd(), MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    dirty, states = plan_build(inputs, job, manifest)
+    print(f"{len(inputs)} ファイル中 {len(dirty)} ファイルを描き直します")
+    # 描き直さないファイルもサイズ・更新時刻を記録し直す (touch されただけのファイルを次回また読まない)
+    dirty_keys = {os.path.abspath(p) for p in dirty}
+    for key, state in states.items():
+        if key not in dirty_keys:
+            manifest[key] = state
+    if not dirty:
+        save_manifest(manifest_path, manifest)
+        return 0
+
+    results = run_batch(dirty, job, args.workers)
+    for file_path, output, seconds, error in results:
+        key = os.path.abspath(file_path)
+        if error:
+            manifest.pop(key, None)
+        else:
+            manifest[key] = states[key]
+    save_manifest(manifest_path, manifest)
+    return 1 if any(r[3] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,5 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import numpy as np
 import os
 import sys
-import math
-import json
 import platform
 
 # --- 重要: 必要なライブラリ ---
@@ -18,6 +12,35 @@ else:
     SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(SCRIPT_DIR, "settings.json")
 
+# 共通モジュール (graph/graphcore) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from graphcore.settings_store import SettingsStore
+from graphcore.startup import BackgroundImport, bench_enabled, bench_mark
+
+settings_store = SettingsStore(CONFIG_FILE)
+
+CACHE_DIR = os.path.join(SCRIPT_DIR, "cache")
+
+# 重いモジュール (pandas / matplotlib / numpy) はラベルなどを入力している間に
+# 別スレッドで読み込む。使う関数の先頭で heavy.wait() すること
+pd = plt = np = None
+loader = scale = NumericColumns = None
+frame_cache = None
+
+def import_heavy():
+    """pandas / matplotlib などを読み込む (バックグラウンドスレッドで実行)"""
+    global pd, plt, np, loader, scale, NumericColumns, frame_cache
+    import numpy as np
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    from graphcore import loader, scale
+    from graphcore.frame_cache import FrameCache
+    from graphcore.columns import NumericColumns
+    # 読み込んだ Excel シートのキャッシュ (数値化して .npy で保存)
+    frame_cache = FrameCache(CACHE_DIR)
+
+heavy = BackgroundImport(import_heavy)
+
 def get_system_font():
     """OSに合わせてデフォルトフォントを決定する"""
     system_name = platform.system()
@@ -45,26 +68,15 @@ def load_settings():
         "figure_size": [10, 6],
         "marker_size": 30,
         "dpi": 300,
-        "grid": False
+        "grid": False,
+        "float32": False # 大きなCSVは float32 で読み込んでメモリを節約
     }
     
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                user_settings = json.load(f)
-                default_settings.update(user_settings)
-                return default_settings
-        except:
-            return default_settings
-    return default_settings
+    return settings_store.load(default_settings)
 
 def save_settings(settings):
-    """設定を保存する"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print(f"設定の保存に失敗しました: {e}")
+    """設定を保存する (変更がある時だけ、終了時までに書き込まれる)"""
+    settings_store.save(settings)
 
 def get_input_with_memory(prompt, key, settings, required=True):
     """記憶機能付き入力"""
@@ -92,19 +104,29 @@ def float_to_latex_sci(val):
     if exp_int == 0: return mantissa
     return r"{} \times 10^{{{}}}".format(mantissa, exp_int)
 
-def load_data(file_path):
-    """ファイルを読み込み、DataFrameを返す"""
+def load_data(file_path, settings=None, sheet=None):
+    """ファイルを読み込み、DataFrameを返す (sheet を指定するとシートを質問しない)"""
+    heavy.wait()
     ext = os.path.splitext(file_path)[1].lower()
     basename = os.path.basename(file_path)
     
     try:
         if ext == '.csv':
-            return pd.read_csv(file_path)
+            float32 = bool(settings and settings.get("float32", False))
+            df, info = loader.load_csv(file_path, float32=float32)
+            print(f"読み込み完了: {loader.format_report(info)}")
+            return df
         elif ext in ['.xlsx', '.xls']:
-            excel_file = pd.ExcelFile(file_path)
-            sheet_names = excel_file.sheet_names
+            # シート名・シート内容はキャッシュにあればブックを開かずに済む
+            sheet_names = frame_cache.sheet_names(file_path, lambda: pd.ExcelFile(file_path).sheet_names)
             target_sheet = None
             
+            if sheet is not None:
+                # バッチモード: 番号 (0始まり) かシート名で指定
+                target_sheet = sheet_names[sheet] if isinstance(sheet, int) else sheet
+                return frame_cache.load(file_path, target_sheet,
+                                        lambda: pd.read_excel(file_path, sheet_name=target_sheet))
+
             print(f"\nファイル '{basename}' 内のシート一覧:")
             for i, name in enumerate(sheet_names):
                 print(f"  [{i + 1}] {name}")
@@ -126,7 +148,8 @@ def load_data(file_path):
                     else: print(f"エラー: 1～{len(sheet_names)}で入力してください")
                 except ValueError: print("エラー: 半角数字を入力してください")
             
-            return pd.read_excel(file_path, sheet_name=target_sheet)
+            return frame_cache.load(file_path, target_sheet,
+                                    lambda: pd.read_excel(file_path, sheet_name=target_sheet))
         else:
             print("エラー: 非対応形式です")
             return None
@@ -134,8 +157,9 @@ def load_data(file_path):
         print(f"読み込みエラー: {e}")
         return None
 
-def create_graph(file_path, x_label_text, y_label_text, settings, show_trendline=False):
-    """グラフ作成のメイン処理"""
+def create_graph(file_path, x_label_text, y_label_text, settings, show_trendline=False, sheet=None):
+    """グラフ作成のメイン処理。保存できたら出力先のパスを返す"""
+    heavy.wait()
     
     # 1. 設定反映
     plt.rcParams['font.family'] = settings.get("font_family", get_system_font())
@@ -144,7 +168,7 @@ def create_graph(file_path, x_label_text, y_label_text, settings, show_trendline
     plt.rcParams['mathtext.default'] = 'it' 
     
     # 2. データ読み込み
-    df = load_data(file_path)
+    df = load_data(file_path, settings, sheet)
     if df is None: return
     if df.shape[1] < 2:
         print("エラー: データは最低でも2列（X軸とY軸）必要です。")
@@ -160,41 +184,33 @@ def create_graph(file_path, x_label_text, y_label_text, settings, show_trendline
     fig_sz = settings.get("figure_size", [10, 6])
     fig, ax = plt.subplots(figsize=(fig_sz[0], fig_sz[1]))
     
-    x_data = df.iloc[:, 0]
+    # 列の数値化は1回だけ (X列をY列ごとに変換し直さない)
+    num_cols = NumericColumns(df)
+    x_info = num_cols[df.columns[0]]
+    x_num = x_info.values
     
-    # 最大値計算（エラーハンドリング強化）
+    # 指数表記の指数 (Y列ごとの絶対値の最大は num_cols が1回だけ計算して持つ)
     try:
-        # 数値データのみを抽出して最大値を探す
-        numeric_df = df.iloc[:, 1:].select_dtypes(include=['number'])
-        if not numeric_df.empty:
-            all_vals = numeric_df.values.flatten()
-            # NaNを除去
-            all_vals = all_vals[~np.isnan(all_vals)]
-            max_val = max([abs(y) for y in all_vals]) if len(all_vals) > 0 else 0
-        else:
-            max_val = 0
+        exponent = scale.columns_exponent(num_cols, df.columns[1:])
     except Exception as e:
         print(f"警告: 最大値計算中にエラー ({e})。指数表記を無効化します。")
-        max_val = 0
-        
-    exponent = int(math.floor(math.log10(max_val))) if max_val != 0 else 0
+        exponent = 0
     mk_sz = settings.get("marker_size", 30)
 
     # 4. プロットループ
     for i in range(1, len(df.columns)):
         col_name = df.columns[i]
-        y_data = df.iloc[:, i]
         
         # データチェック: 数値変換できないデータが含まれているか確認
         try:
-            x_num = pd.to_numeric(x_data, errors='coerce')
-            y_num = pd.to_numeric(y_data, errors='coerce')
+            y_info = num_cols[col_name]
         except:
             print(f"スキップ: 列 '{col_name}' は数値データとして読み込めませんでした。")
             continue
+        y_num = y_info.values
             
         # NaNを除去したマスクを作成
-        mask = np.isfinite(x_num) & np.isfinite(y_num)
+        mask = x_info.finite & y_info.finite
         
         if mask.sum() == 0:
             print(f"スキップ: 列 '{col_name}' に有効なデータ点がありません。")
@@ -239,12 +255,7 @@ def create_graph(file_path, x_label_text, y_label_text, settings, show_trendline
     ax.grid(settings.get("grid", False))
     ax.tick_params(axis='both', direction='in', which='both', top=True, right=True)
 
-    def scientific_formatter(x, pos):
-        if x == 0: return "0"
-        coeff = x / (10 ** exponent)
-        return r"${:.1f} \times 10^{{{}}}$".format(coeff, exponent)
-
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(scientific_formatter))
+    ax.yaxis.set_major_formatter(scale.SciFormatter(exponent))
 
     if len(df.columns) > 1 or show_trendline:
         # 凡例がある場合のみ表示
@@ -262,6 +273,7 @@ def create_graph(file_path, x_label_text, y_label_text, settings, show_trendline
         print("-" * 30)
         print(f"処理完了: 画像を保存しました -> {output_path}")
         print("-" * 30)
+        return output_path
     except Exception as e:
         print(f"保存エラー: {e}")
     finally:
@@ -274,7 +286,19 @@ def combine_label_and_unit(label, unit):
     return label
 
 if __name__ == "__main__":
+    # 対話なしの一括作成: python graph.py --batch <ディレクトリ or glob> --spec job.json
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+
+    heavy.start()
     print("\n=== グラフ作成ツール（Pro版） ===")
+    if bench_enabled():
+        # 起動計測: 最初のプロンプトが出るまでと、重いモジュールの読み込み完了まで
+        bench_mark("window")
+        heavy.wait()
+        bench_mark("ready")
+        sys.exit(0)
     
     settings = load_settings()
     
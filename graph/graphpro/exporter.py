@@ -0,0 +1,207 @@
+import io
+import os
+import time
+import zlib
+import struct
+from contextlib import contextmanager
+
+import numpy as np
+
+# これ以上の点を持つ散布図は、PDF/SVG でもその層だけ画像にする
+RASTERIZE_MIN_POINTS = 5000
+VECTOR_FORMATS = ('pdf', 'svg', 'eps', 'ps')
+PNG_ROWS_PER_CHUNK = 256
+
+
+def parse_targets(base_path, main_dpi, extra):
+    """保存先とその他の出力指定から [(パス, 形式, dpi), ...] を作る
+
+    extra は "pdf" や "png@600" のような文字列のリスト。
+    同じベース名で拡張子 (と dpi 違いの場合は接尾辞) を変えて保存する。
+    """
+    root, ext = os.path.splitext(base_path)
+    main_fmt = (ext[1:] or 'png').lower()
+    targets = [(base_path, main_fmt, main_dpi)]
+    for item in extra:
+        fmt, _, dpi = str(item).partition('@')
+        fmt = fmt.strip().lower().lstrip('.')
+        dpi = int(dpi) if dpi else main_dpi
+        if fmt == main_fmt and dpi == main_dpi:
+            continue
+        suffix = f"_{dpi}dpi" if dpi != main_dpi and fmt not in VECTOR_FORMATS else ""
+        targets.append((f"{root}{suffix}.{fmt}", fmt, dpi))
+    return targets
+
+
+def export_figure(fig, targets, raster_dpi=300, rasterize_min_points=RASTERIZE_MIN_POINTS, progress=None):
+    """fig を複数の形式・dpi で書き出し、ファイルごとの結果を返す
+
+    画像形式は最大 dpi で1回だけ Agg で描き、そのバッファを縮小して使い回す。
+    ベクター形式は点の多い散布図の層だけ raster_dpi の画像にして埋め込む。
+    progress(済んだ数, 全体, 次の説明) を区切りごとに呼ぶ。progress が例外を投げると
+    (キャンセルなど) そこで止め、この呼び出しで書いたファイルは消す。
+    戻り値: [{'path', 'format', 'dpi', 'seconds', 'bytes'}, ...]
+    """
+    results = []
+    written = []  # 書き始めたファイル (途中で止まったら消す)
+    try:
+        _export(fig, targets, raster_dpi, rasterize_min_points, progress, results, written)
+    except BaseException:
+        for path in written:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    return results
+
+
+def _export(fig, targets, raster_dpi, rasterize_min_points, progress, results, written):
+    raster = [t for t in targets if t[1] not in VECTOR_FORMATS]
+    vector = [t for t in targets if t[1] in VECTOR_FORMATS]
+    total = len(targets) + (1 if raster else 0)  # 画像形式はバッファの描画も1段階に数える
+
+    if raster:
+        if progress:
+            progress(0, total, "描画中")
+        start = time.perf_counter()
+        max_dpi = max(dpi for _, _, dpi in raster)
+        rgba = render_rgba(fig, max_dpi)
+        render_seconds = time.perf_counter() - start
+        for path, fmt, dpi in sorted(raster, key=lambda t: -t[2]):
+            if progress:
+                progress(1 + len(results), total, os.path.basename(path))
+            start = time.perf_counter()
+            image = rgba if dpi == max_dpi else resample(rgba, dpi / max_dpi)
+            written.append(path)
+            if fmt == 'png':
+                write_png(path, image, dpi)
+            else:
+                save_with_pil(path, fmt, image, dpi)
+            seconds = time.perf_counter() - start
+            if dpi == max_dpi:
+                seconds += render_seconds  # 描画時間は最大 dpi の出力に計上する
+                render_seconds = 0.0
+            results.append(_result(path, fmt, dpi, seconds))
+
+    if vector:
+        with rasterized_layers(fig, rasterize_min_points):
+            for path, fmt, dpi in vector:
+                if progress:
+                    progress(len(results) + (1 if raster else 0), total, os.path.basename(path))
+                start = time.perf_counter()
+                written.append(path)
+                fig.savefig(path, format=fmt, dpi=raster_dpi)
+                results.append(_result(path, fmt, raster_dpi, time.perf_counter() - start))
+    if progress:
+        progress(total, total, "完了")
+
+
+def format_export_report(results):
+    lines = []
+    for r in results:
+        lines.append(f"{os.path.basename(r['path'])}  {r['dpi']} dpi  "
+                     f"{format_bytes(r['bytes'])}  {r['seconds'] * 1000:.0f} ms")
+    total = sum(r['seconds'] for r in results)
+    lines.append(f"合計 {total:.2f} s")
+    return "\n".join(lines)
+
+
+def format_bytes(n):
+    if n >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.1f} MB"
+    return f"{n / 1024:.0f} KB"
+
+
+# --- 画像形式 ---
+
+def render_rgba(fig, dpi):
+    """fig を Agg で描いて (高さ, 幅, 4) の uint8 配列を返す"""
+    buf = io.BytesIO()
+    # rcParams の savefig.bbox='tight' で余白が切り詰められると大きさが変わるので、図全体を指定する
+    # (bbox_inches=None では rcParams の値が使われる)
+    fig.savefig(buf, format='rgba', dpi=dpi, bbox_inches=fig.bbox_inches)
+    data = np.frombuffer(buf.getbuffer(), dtype=np.uint8)
+    # Agg のキャンバスは int(インチ × dpi) ピクセル (丸め誤差で 1 ピクセルずれることがある)
+    width = int(fig.get_figwidth() * dpi)
+    height = int(fig.get_figheight() * dpi)
+    for w in (width, width + 1, width - 1):
+        for h in (height, height + 1, height - 1):
+            if w * h * 4 == data.size:
+                return data.reshape(h, w, 4)
+    raise ValueError(f"描画結果の大きさが図と合いません ({data.size} バイト, {width}x{height})")
+
+
+def resample(rgba, scale):
+    """バッファを縮小 (拡大) する"""
+    from PIL import Image
+    height, width = rgba.shape[:2]
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return np.asarray(Image.fromarray(rgba, 'RGBA').resize(size, Image.LANCZOS))
+
+
+def save_with_pil(path, fmt, rgba, dpi):
+    from PIL import Image
+    image = Image.fromarray(rgba, 'RGBA')
+    if fmt in ('jpg', 'jpeg', 'bmp'):
+        image = image.convert('RGB')  # 透過を持てない形式
+    image.save(path, dpi=(dpi, dpi))
+
+
+def write_png(path, rgba, dpi=None, compress_level=6):
+    """PNG を行のまとまりごとに圧縮しながら書き出す (全体の圧縮データをメモリに持たない)
+
+    背景が不透明なら RGB で書き、ファイルを小さくする。
+    """
+    height, width = rgba.shape[:2]
+    opaque = bool((rgba[..., 3] == 255).all())
+    channels = 3 if opaque else 4
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2 if opaque else 6, 0, 0, 0))
+        if dpi:
+            ppm = int(round(dpi / 0.0254))  # 1メートルあたりのピクセル数
+            _png_chunk(f, b'pHYs', struct.pack('>IIB', ppm, ppm, 1))
+        compressor = zlib.compressobj(compress_level)
+        for start in range(0, height, PNG_ROWS_PER_CHUNK):
+            rows = rgba[start:start + PNG_ROWS_PER_CHUNK, :, :channels]
+            # 各行の先頭にフィルタ番号 0 (なし) を付ける
+            raw = np.zeros((len(rows), width * channels + 1), dtype=np.uint8)
+            raw[:, 1:] = rows.reshape(len(rows), -1)
+            data = compressor.compress(raw.tobytes())
+            if data:
+                _png_chunk(f, b'IDAT', data)
+        _png_chunk(f, b'IDAT', compressor.flush())
+        _png_chunk(f, b'IEND', b'')
+
+
+def _png_chunk(f, tag, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+# --- ベクター形式 ---
+
+@contextmanager
+def rasterized_layers(fig, min_points):
+    """点の多い散布図だけ一時的に rasterized にする (軸・文字・近似直線はベクターのまま)"""
+    from matplotlib.collections import PathCollection
+    changed = []
+    for ax in fig.axes:
+        for coll in ax.collections:
+            if (isinstance(coll, PathCollection) and not coll.get_rasterized()
+                    and len(coll.get_offsets()) >= min_points):
+                coll.set_rasterized(True)
+                changed.append(coll)
+    try:
+        yield
+    finally:
+        for coll in changed:
+            coll.set_rasterized(False)
+
+
+def _result(path, fmt, dpi, seconds):
+    return {'path': path, 'format': fmt, 'dpi': dpi, 'seconds': seconds,
+            'bytes': os.path.getsize(path)}
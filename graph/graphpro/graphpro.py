@@ -1,16 +1,15 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import numpy as np
 import os
 import sys
-import math
-import json
 import platform
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 
+from scheduler import RedrawScheduler
+from jobs import JobRunner
+from render_worker import RenderProcess
+from prefetch import SheetPrefetcher
+
 # --- 重要: 必要なライブラリ ---
 # pip install openpyxl numpy
 
@@ -21,6 +20,39 @@ else:
     SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(SCRIPT_DIR, "settings.json")
 
+# 共通モジュール (graph/graphcore) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from graphcore.settings_store import SettingsStore
+from graphcore.startup import BackgroundImport, bench_window, bench_finish
+
+settings_store = SettingsStore(CONFIG_FILE)
+
+CACHE_DIR = os.path.join(SCRIPT_DIR, "cache")
+
+# 重いモジュール (pandas / matplotlib / numpy) は起動を速くするため、
+# ウィンドウを出した後に別スレッドの import_heavy() で読み込む
+pd = plt = ticker = np = None
+FigureCanvasTkAgg = NavigationToolbar2Tk = None
+PlotRenderer = exporter = fitting = curvefit = uncertainty = rolling = loader = scale = column_store = NumericColumns = None
+frame_cache = None
+
+def import_heavy():
+    """pandas / matplotlib などを読み込む (バックグラウンドスレッドで実行。Tk には触らない)"""
+    global pd, plt, ticker, np, FigureCanvasTkAgg, NavigationToolbar2Tk
+    global PlotRenderer, exporter, fitting, curvefit, uncertainty, rolling, loader, scale, column_store, NumericColumns, frame_cache
+    import numpy as np
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    from renderer import PlotRenderer
+    import exporter
+    from graphcore import fitting, curvefit, uncertainty, rolling, loader, scale, column_store
+    from graphcore.frame_cache import FrameCache
+    from graphcore.columns import NumericColumns
+    # 読み込んだ Excel シートのキャッシュ (数値化して .npy で保存)
+    frame_cache = FrameCache(CACHE_DIR)
+
 def get_system_font():
     """OSに合わせてデフォルトフォントを決定する"""
     system_name = platform.system()
@@ -45,25 +77,30 @@ def load_settings():
         "dpi": 100,
         "show_r2": True,
         "x_log": False,
-        "y_log": False
+        "y_log": False,
+        "float32": False, # 大きなCSVは float32 で読み込んでメモリを節約
+        "mmap_threshold_mb": 512, # これ以上のCSVはメモリマップの列ストアで開く
+        "column_cache_max_mb": 8192, # 列ストア (cache/columns) の合計の上限。超えたら古いものから消す
+        "export_dpi": 300,
+        "export_raster_dpi": 300, # PDF/SVG に埋め込む散布図 (点の多い層) の解像度
+        "export_extra": [], # 保存時に一緒に書き出す形式 (例: ["pdf", "png@600"])
+        "fit_model": "linear", # 新しく追加する近似の種類 (FIT_MODELS のキー)
+        "fit_degree": 2,
+        "fit_formula": "",
+        "fit_bands": False, # 新しく追加する組に 95% 信頼区間・予測区間を付けるか
+        "bootstrap_resamples": 2000, # 非線形近似の区間を求めるブートストラップの回数
+        # (回数 × 点数) がこれを超えたら LM で解き直さず線形化で近似する (凡例に「線形化」と出す)
+        "bootstrap_full_refit_elements": 2_000_000,
+        "rolling_mean": False, # 移動統計の重ね描き (X でソートした点の数で窓を取る)
+        "rolling_median": False,
+        "rolling_std": False,
+        "rolling_window": 50
     }
-    
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                user_settings = json.load(f)
-                default_settings.update(user_settings)
-        except:
-            pass
-    return default_settings
+    return settings_store.load(default_settings)
 
 def save_settings(settings):
-    """設定を保存する"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print(f"設定保存エラー: {e}")
+    """設定を保存する (変更がある時だけ、バックグラウンドで書き込まれる)"""
+    settings_store.save(settings)
 
 def float_to_latex_sci(val):
     """数値をLaTeX形式の科学的表記に変換"""
@@ -77,6 +114,74 @@ def float_to_latex_sci(val):
     except:
         return str(val)
 
+def format_trend_label(A, B, x_log, y_log):
+    """近似式の凡例ラベル (lin/log の4モード)"""
+    s_A = float_to_latex_sci(A)
+    s_B = float_to_latex_sci(abs(B))
+    sign = "+" if B >= 0 else "-"
+    # 1. Log-Log (両対数): log(y) = A * log(x) + B
+    if x_log and y_log:
+        return f"$\\log(y)={s_A} \\log(x) {sign} {s_B}$"
+    # 2. Semi-Log X (片対数X): y = A * log(x) + B
+    if x_log:
+        return f"$y={s_A} \\log(x) {sign} {s_B}$"
+    # 3. Semi-Log Y (片対数Y): log(y) = A * x + B
+    if y_log:
+        return f"$\\log(y)={s_A} x {sign} {s_B}$"
+    # 4. Linear (通常): y = ax + b
+    return f"$y={s_A}x {sign} {s_B}$"
+
+def format_model_label(model, params):
+    """多項式・非線形近似の凡例ラベル"""
+    if model.linear:
+        # 多項式は係数を式に埋め込む (高次から)
+        terms = ""
+        for power in range(len(params) - 1, -1, -1):
+            c = params[power]
+            if c == 0 and power > 0: continue
+            sign = "-" if c < 0 else ("+" if terms else "")
+            x_part = "x" if power == 1 else (f"x^{{{power}}}" if power > 1 else "")
+            terms += f" {sign} {float_to_latex_sci(abs(c))}{x_part}"
+        return f"$y={terms.strip()}$"
+    values = ", ".join(f"{name}={float_to_latex_sci(v)}" for name, v in zip(model.params, params))
+    return f"${model.tex}$ (${values}$)"
+
+def format_error_label(names, errors):
+    """パラメータの標準誤差を凡例の2行目にする"""
+    values = ", ".join(f"\\sigma_{{{name}}}={float_to_latex_sci(e)}" for name, e in zip(names, errors))
+    return f"\n${values}$"
+
+def fit_line_x(x_min, x_max, x_log, n=100):
+    """近似曲線を描く X 座標 (使った点の範囲から少し延長する)"""
+    if x_log:
+        # 対数軸の場合、少しマージンを取る計算
+        log_min = np.log10(x_min)
+        log_max = np.log10(x_max)
+        diff = log_max - log_min
+        if diff == 0: diff = 0.1
+        m = diff * 0.1
+        return np.logspace(log_min - m, log_max + m, n)
+    x_range = x_max - x_min
+    if x_range == 0: x_range = 1
+    m = x_range * 0.1
+    return np.linspace(x_min - m, x_max + m, n)
+
+# 近似の種類 (キー, 表示名)。linear は対数軸に合わせた1次近似 (累積和で高速に計算)
+FIT_MODELS = [
+    ('linear', "1次 (対数軸に対応)"),
+    ('poly', "多項式"),
+    ('exp', "指数 y=a·exp(bx)"),
+    ('power', "べき y=a·x^b"),
+    ('gauss', "ガウス (ピーク)"),
+    ('lorentz', "ローレンツ (ピーク)"),
+    ('formula', "任意の式"),
+]
+FIT_MODEL_KEYS = [key for key, _ in FIT_MODELS]
+# 移動統計 (キー, 表示名, 線種)。std は移動平均 ± 標準偏差の2本で描く
+ROLLING_KINDS = [('mean', "移動平均", '-'), ('median', "移動中央値", '-.'), ('std', "±σ", ':')]
+FIT_SHORT_NAMES = {'linear': "1次", 'poly': "多項式", 'exp': "指数", 'power': "べき",
+                   'gauss': "ガウス", 'lorentz': "ローレンツ", 'formula': "式"}
+
 class GraphApp:
     def __init__(self, root):
         self.root = root
@@ -86,7 +191,17 @@ class GraphApp:
         self.settings = load_settings()
         self.df_raw = None
         self.filepath = ""
+        self.prefetcher = None
+        self.column_store = None
+        self.num_cols = None # 数値化済みの列キャッシュ (init_columns で作る)
         self.trendline_sets = [] 
+        self.next_trend_id = 1 # 近似の組の通し番号 (前回の解を覚えておく目印)
+        self.data_version = 0 # df_raw が差し替わるたびに増やす
+        self.fit_cache = None # 近似直線用の累積和キャッシュ (on_heavy_ready で作る)
+        self.curve_cache = None # 非線形近似の前回の解 (スライダー操作時の初期値)
+        self.band_cache = None # ブートストラップで求めた信頼区間・予測区間
+        self.rolling_cache = None # 列ごとの移動統計 (累積和・移動中央値)
+        self.renderer = None # グラフ欄は重いモジュールの読み込み後に作る
         
         # 配色設定：標準的なライトテーマ（白・グレー基調）
         self.colors = {
@@ -105,18 +220,39 @@ class GraphApp:
         
         self.apply_theme()
         
-        # Matplotlibスタイル（標準）
-        self.setup_matplotlib_style()
-        
         self.setup_ui()
 
-        # 起動引数チェック
+        # 起動引数チェック (読み込みは on_heavy_ready で)
         if len(sys.argv) > 1:
             potential_file = sys.argv[1]
             if os.path.exists(potential_file):
                 self.filepath = potential_file
                 self.lbl_filename.config(text=os.path.basename(self.filepath))
-                self.root.after(100, self.load_initial_data)
+
+        # ウィンドウを先に出し、pandas / matplotlib は裏で読み込む
+        bench_window(self.root)
+        self.importer = BackgroundImport(import_heavy).start()
+        self.importer.when_ready(self.root, self.on_heavy_ready)
+
+    def on_heavy_ready(self):
+        """重いモジュールの読み込み完了後 (Tk スレッド): グラフ欄を作り、引数のファイルを開く"""
+        try:
+            self.importer.wait()
+        except Exception as e:
+            self.lbl_loading.config(text=f"ライブラリの読み込みに失敗しました:\n{e}")
+            return
+        self.fit_cache = fitting.FitCache()
+        self.curve_cache = curvefit.CurveFitCache()
+        self.band_cache = uncertainty.BandCache()
+        self.rolling_cache = rolling.RollingCache()
+        # Matplotlibスタイル（標準）
+        self.setup_matplotlib_style()
+        self.setup_plot_area()
+        self.btn_load.config(state=tk.NORMAL)
+        self.btn_save.config(state=tk.NORMAL)
+        if self.filepath:
+            self.load_initial_data()
+        bench_finish(self.root)
 
     def setup_matplotlib_style(self):
         """Matplotlibのスタイル設定（標準ライトモード）"""
@@ -239,7 +375,7 @@ class GraphApp:
         src_frame = ttk.LabelFrame(left_panel, text="📁 データソース", padding=10)
         src_frame.pack(fill=tk.X, pady=(0, 10))
         
-        self.btn_load = ttk.Button(src_frame, text="ファイルを開く...", command=self.select_file)
+        self.btn_load = ttk.Button(src_frame, text="ファイルを開く...", command=self.select_file, state=tk.DISABLED)
         self.btn_load.pack(fill=tk.X, pady=5)
         
         self.lbl_filename = ttk.Label(src_frame, text="ファイル未選択", font=("", 9, "italic"), wraplength=280)
@@ -250,6 +386,9 @@ class GraphApp:
         self.combo_sheet.pack(fill=tk.X)
         self.combo_sheet.bind("<<ComboboxSelected>>", self.on_sheet_selected)
 
+        self.lbl_prefetch = ttk.Label(src_frame, text="", font=("", 8))
+        self.lbl_prefetch.pack(anchor=tk.W)
+
         # 2. 列設定
         col_conf_frame = ttk.LabelFrame(left_panel, text="📊 列設定", padding=10)
         col_conf_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
@@ -333,6 +472,47 @@ class GraphApp:
         self.chk_r2 = ttk.Checkbutton(opt_frame, text="$R^2$値を表示", variable=self.var_show_r2, command=self.draw_graph)
         self.chk_r2.pack(side=tk.LEFT)
 
+        # 近似の種類 (選択中の組に反映。新しく追加する組にも使う)
+        model_frame = ttk.Frame(trend_frame)
+        model_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(model_frame, text="種類:").pack(side=tk.LEFT)
+        self.combo_model = ttk.Combobox(model_frame, state="readonly", width=18,
+                                        values=[name for _, name in FIT_MODELS])
+        model_key = self.settings.get("fit_model", "linear")
+        self.combo_model.current(FIT_MODEL_KEYS.index(model_key) if model_key in FIT_MODEL_KEYS else 0)
+        self.combo_model.pack(side=tk.LEFT, padx=(5, 5))
+        self.combo_model.bind("<<ComboboxSelected>>", self.on_model_change)
+        ttk.Label(model_frame, text="次数:").pack(side=tk.LEFT)
+        self.var_degree = tk.StringVar(value=str(self.settings.get("fit_degree", 2)))
+        self.spin_degree = ttk.Spinbox(model_frame, from_=1, to=9, width=3, textvariable=self.var_degree,
+                                       command=self.on_model_change)
+        self.spin_degree.pack(side=tk.LEFT, padx=(5, 0))
+        self.spin_degree.bind('<Return>', self.on_model_change)
+
+        formula_frame = ttk.Frame(trend_frame)
+        formula_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(formula_frame, text="式 y=").pack(side=tk.LEFT)
+        self.entry_formula = ttk.Entry(formula_frame)
+        self.entry_formula.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        self.entry_formula.insert(0, self.settings.get("fit_formula", ""))
+        self.entry_formula.bind('<Return>', self.on_model_change)
+        self.entry_formula.bind('<FocusOut>', self.on_model_change)
+        # 95% 信頼区間・予測区間 (1次・多項式は解析的に、それ以外はブートストラップで求める)
+        band_frame = ttk.Frame(trend_frame)
+        band_frame.pack(fill=tk.X, pady=(0, 5))
+        self.var_bands = tk.BooleanVar(value=self.settings.get("fit_bands", False))
+        ttk.Checkbutton(band_frame, text="95%信頼・予測区間", variable=self.var_bands,
+                        command=self.on_model_change).pack(side=tk.LEFT)
+        ttk.Label(band_frame, text="ブートストラップ回数:").pack(side=tk.LEFT, padx=(10, 0))
+        self.var_resamples = tk.StringVar(value=str(self.settings.get("bootstrap_resamples", 2000)))
+        self.spin_resamples = ttk.Spinbox(band_frame, from_=100, to=100000, increment=500, width=7,
+                                          textvariable=self.var_resamples, command=self.on_resamples_change)
+        self.spin_resamples.pack(side=tk.LEFT, padx=(5, 0))
+        self.spin_resamples.bind('<Return>', self.on_resamples_change)
+        self.spin_resamples.bind('<FocusOut>', self.on_resamples_change)
+        self.lbl_fit_error = ttk.Label(trend_frame, text="", foreground="#c00000", font=("", 8))
+        self.lbl_fit_error.pack(fill=tk.X)
+
         self.list_trends = tk.Listbox(trend_frame, height=3,
                                       bg=self.colors['input'], fg=self.colors['fg'],
                                       selectbackground=self.colors['accent'], 
@@ -346,29 +526,34 @@ class GraphApp:
         ttk.Button(btn_tr_f, text="+ 追加", command=self.add_trendline).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0,2))
         ttk.Button(btn_tr_f, text="- 削除", command=self.remove_trendline).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2,0))
 
-        # 5. 保存ボタン
-        self.btn_save = ttk.Button(left_panel, text="💾 画像を保存 (Export)", command=self.save_image, style='Action.TButton')
+        # 5. 移動統計
+        rolling_frame = ttk.LabelFrame(left_panel, text="〰 移動統計", padding=10)
+        rolling_frame.pack(fill=tk.X, pady=(0, 10))
+        self.var_rolling = {}
+        for key, name, _ in ROLLING_KINDS:
+            self.var_rolling[key] = tk.BooleanVar(value=self.settings.get(f"rolling_{key}", False))
+            ttk.Checkbutton(rolling_frame, text="移動標準偏差" if key == 'std' else name,
+                            variable=self.var_rolling[key], command=self.draw_graph).pack(side=tk.LEFT)
+        self.var_rolling_window = tk.StringVar(value=str(self.settings.get("rolling_window", 50)))
+        self.spin_rolling_window = ttk.Spinbox(rolling_frame, from_=2, to=100000, width=6,
+                                               textvariable=self.var_rolling_window, command=self.draw_graph)
+        self.spin_rolling_window.pack(side=tk.RIGHT)
+        self.spin_rolling_window.bind('<Return>', lambda e: self.draw_graph())
+        self.spin_rolling_window.bind('<FocusOut>', lambda e: self.draw_graph())
+        ttk.Label(rolling_frame, text="窓幅(点):").pack(side=tk.RIGHT, padx=(5, 2))
+
+        # 6. 保存ボタン
+        self.btn_save = ttk.Button(left_panel, text="💾 画像を保存 (Export)", command=self.save_image, style='Action.TButton', state=tk.DISABLED)
         self.btn_save.pack(fill=tk.X, pady=10)
 
 
         # === 右パネル ===
         
-        # グラフ
-        self.fig, self.ax = plt.subplots(figsize=(6, 4))
-        # 初期描画はsetup_matplotlib_styleで設定した通り
-        
-        self.canvas = FigureCanvasTkAgg(self.fig, master=right_panel)
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-        
-        toolbar_frame = ttk.Frame(right_panel)
-        toolbar_frame.pack(fill=tk.X)
-        toolbar = NavigationToolbar2Tk(self.canvas, toolbar_frame)
-        toolbar.update()
-        toolbar.config(background=self.colors['bg'])
-        for button in toolbar.winfo_children():
-            try:
-                button.config(background=self.colors['bg'])
-            except: pass
+        # グラフ (matplotlib の読み込みが終わるまでは仮の表示。setup_plot_area で差し替える)
+        self.plot_frame = ttk.Frame(right_panel)
+        self.plot_frame.pack(fill=tk.BOTH, expand=True)
+        self.lbl_loading = ttk.Label(self.plot_frame, text="ライブラリを読み込み中...", anchor=tk.CENTER)
+        self.lbl_loading.pack(fill=tk.BOTH, expand=True)
         
         # スライダー
         slider_frame = ttk.LabelFrame(right_panel, text="近似範囲セレクター (選択中の範囲)", padding=10)
@@ -399,6 +584,43 @@ class GraphApp:
                                   command=self.on_slider_change)
         self.scale_max.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        # 描画統計 (フレームの統合・欠落) と、バックグラウンド処理の進捗
+        status_frame = ttk.Frame(right_panel)
+        status_frame.pack(fill=tk.X)
+        self.lbl_stats = ttk.Label(status_frame, text="", font=("", 8))
+        self.lbl_stats.pack(side=tk.RIGHT)
+        self.lbl_job = ttk.Label(status_frame, text="", font=("", 8))
+        self.lbl_job.pack(side=tk.LEFT)
+        self.progress_job = ttk.Progressbar(status_frame, length=160, maximum=1.0)
+        self.btn_cancel = ttk.Button(status_frame, text="キャンセル", command=self.cancel_jobs)
+
+        # 再描画スケジューラ: イベントの連打を1フレーム1回の描画にまとめる
+        self.scheduler = RedrawScheduler(self.root, on_stats=self.update_stats)
+        # 描画仕様の計算と書き出しはワーカースレッドで行い、結果だけ Tk に戻す
+        self.jobs = JobRunner(self.root, on_status=self.update_job_status)
+        self.export_worker = RenderProcess() # 書き出しの描画は別プロセス (Agg は GIL を離さないため)
+
+    def setup_plot_area(self):
+        """グラフ欄 (Figure・キャンバス・ツールバー) を作る"""
+        self.lbl_loading.destroy()
+
+        self.fig, self.ax = plt.subplots(figsize=(6, 4))
+        # 初期描画はsetup_matplotlib_styleで設定した通り
+        
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.plot_frame)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.renderer = PlotRenderer(self.fig, self.ax, self.canvas)
+        
+        toolbar_frame = ttk.Frame(self.plot_frame)
+        toolbar_frame.pack(fill=tk.X)
+        toolbar = NavigationToolbar2Tk(self.canvas, toolbar_frame)
+        toolbar.update()
+        toolbar.config(background=self.colors['bg'])
+        for button in toolbar.winfo_children():
+            try:
+                button.config(background=self.colors['bg'])
+            except: pass
+
     def select_file(self):
         ftypes = [("Data Files", "*.csv *.xlsx *.xls"), ("All Files", "*.*")]
         path = filedialog.askopenfilename(filetypes=ftypes)
@@ -409,32 +631,36 @@ class GraphApp:
 
     def load_initial_data(self):
         ext = os.path.splitext(self.filepath)[1].lower()
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        self.column_store = None
+        self.jobs.cancel('columns')
+        self.lbl_prefetch.config(text="")
         try:
             if ext == '.csv':
-                encodings = ['utf-8', 'shift_jis', 'cp932']
-                success = False
-                for enc in encodings:
-                    try:
-                        self.df_raw = pd.read_csv(self.filepath, encoding=enc)
-                        success = True
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                if not success:
-                    raise ValueError("対応できない文字コードです")
-                
-                self.sheet_map = {'Default': self.df_raw}
-                self.combo_sheet['values'] = ['Default']
-                self.combo_sheet.current(0)
-                self.init_columns()
+                size_mb = os.path.getsize(self.filepath) / (1024 * 1024)
+                if size_mb >= self.settings.get("mmap_threshold_mb", 512):
+                    # 巨大なCSVは列ごとの .npy に1回だけ変換し、メモリマップで開く (変換はワーカーで行う)
+                    self.open_column_store()
+                    return
+                # 文字コードは先頭だけで判定し、パースは1回で済ませる
+                self.df_raw, info = loader.load_csv(self.filepath, float32=self.settings.get("float32", False))
+                self.lbl_filename.config(text=f"{os.path.basename(self.filepath)}\n{loader.format_report(info)}")
+                self.show_csv_frame()
                 
             elif ext in ['.xlsx', '.xls']:
-                self.excel_file = pd.ExcelFile(self.filepath)
-                sheets = self.excel_file.sheet_names
+                # シート名・シート内容はキャッシュにあればブックを開かずに済む
+                read_sheet, read_sheet_names = self.make_sheet_reader(self.filepath)
+                sheets = frame_cache.sheet_names(self.filepath, read_sheet_names)
                 self.combo_sheet['values'] = sheets
+                self.prefetcher = SheetPrefetcher(read_sheet)
                 if sheets:
+                    # 最初のシートをすぐ表示し、残りはバックグラウンドで先読み
                     self.combo_sheet.current(0)
                     self.on_sheet_selected(None)
+                    self.prefetcher.start(sheets)
+                    self.poll_prefetch()
         except Exception as e:
             messagebox.showerror("Error", f"ファイル読み込み失敗:\n{e}")
 
@@ -442,18 +668,99 @@ class GraphApp:
         sheet_name = self.combo_sheet.get()
         if not sheet_name: return
         try:
-            if hasattr(self, 'excel_file'):
-                self.df_raw = pd.read_excel(self.filepath, sheet_name=sheet_name)
+            if self.prefetcher is not None:
+                if self.prefetcher.get(sheet_name) is None and self.prefetcher.is_running(sheet_name):
+                    # 先読み中のシートは完了を待ってから表示 (UIは止めない)
+                    self.lbl_prefetch.config(text=f"'{sheet_name}' を読み込み中...")
+                    self.root.after(50, lambda: self.on_sheet_selected(None))
+                    return
+                self.df_raw = self.prefetcher.load_now(sheet_name)
             self.init_columns()
         except Exception as e:
             messagebox.showerror("Error", f"シート読み込み失敗:\n{e}")
 
+    def show_csv_frame(self):
+        """CSV (1シート) を読み込んだ後の表示"""
+        self.sheet_map = {'Default': self.df_raw}
+        self.combo_sheet['values'] = ['Default']
+        self.combo_sheet.current(0)
+        self.init_columns()
+
+    def open_column_store(self):
+        """列ストアを開く。初回の変換はワーカーで行い、進捗はジョブ欄に出す (キャンセル可)"""
+        path = self.filepath
+        name = os.path.basename(path)
+        dtype = np.float32 if self.settings.get("float32", False) else np.float64
+        max_bytes = int(self.settings.get("column_cache_max_mb", 8192)) * 1024 * 1024
+
+        def convert(job):
+            def progress(rows, max_rows):
+                job.check()
+                job.report(rows / max_rows if max_rows else None, f"{name} を変換中... {rows}/{max_rows} 行")
+            return column_store.open_store(path, os.path.join(CACHE_DIR, "columns"), dtype, progress, max_bytes)
+
+        def done(store):
+            if self.filepath != path: return # 変換中に別のファイルが選ばれた
+            self.column_store = store
+            self.df_raw = store.frame()
+            self.lbl_filename.config(text=f"{name}\n{store.rows} 行 / メモリマップ ({store.header['dtype']})")
+            self.show_csv_frame()
+
+        def failed(error):
+            if self.filepath != path: return
+            self.lbl_filename.config(text=name)
+            messagebox.showerror("Error", f"ファイル読み込み失敗:\n{error}")
+
+        self.df_raw = None # 変換が終わるまで前のファイルのデータで描かない
+        self.lbl_filename.config(text=f"{name}\n変換中...")
+        self.jobs.submit('columns', convert, done, failed)
+
+    def make_sheet_reader(self, path):
+        """path 専用の読み込み関数を作る (ブックは必要になった時に1回だけ開く)
+
+        先読みスレッドからも呼ばれるので、別のファイルを開き直しても混ざらないようにする。
+        """
+        book = {}
+        lock = threading.Lock() # openpyxl はスレッド安全でないので読み込みを直列化
+
+        def open_book():
+            if 'file' not in book:
+                book['file'] = pd.ExcelFile(path)
+            return book['file']
+
+        def read_sheet_names():
+            with lock:
+                return open_book().sheet_names
+
+        def read_sheet(sheet_name):
+            def parse():
+                with lock:
+                    return pd.read_excel(open_book(), sheet_name=sheet_name)
+            return frame_cache.load(path, sheet_name, parse)
+
+        return read_sheet, read_sheet_names
+
+    def poll_prefetch(self):
+        """先読みの進捗を表示する"""
+        if self.prefetcher is None: return
+        loaded, total, freed, errors = self.prefetcher.progress()
+        text = f"先読み: {loaded}/{total} シート"
+        if freed: text += f" (メモリ解放 {freed})"
+        if errors: text += f" (失敗 {errors})"
+        self.lbl_prefetch.config(text=text)
+        if loaded + errors < total:
+            self.root.after(200, self.poll_prefetch)
+
     def init_columns(self):
         """データ読み込み後の列初期化処理"""
         if self.df_raw is None: return
         
-        self.df_raw = self.df_raw.dropna(axis=1, how='all')
+        if self.column_store is None: # メモリマップの列は変換時に空の列を除いてある
+            self.df_raw = self.df_raw.dropna(axis=1, how='all')
         self.df_raw = self.df_raw.loc[:, ~self.df_raw.columns.str.contains('^Unnamed')]
+        self.data_version += 1
+        # 列の数値化・有限値マスク・最小最大はここで1回だけ (描画のたびに pd.to_numeric しない)
+        self.num_cols = NumericColumns(self.df_raw)
         
         columns = self.df_raw.columns.tolist()
         
@@ -476,9 +783,9 @@ class GraphApp:
             self.list_cols.insert(tk.END, col)
         
         try:
-            x_data = pd.to_numeric(self.df_raw[x_col_name], errors='coerce')
-            min_val = np.nanmin(x_data)
-            max_val = np.nanmax(x_data)
+            x_info = self.num_cols[x_col_name]
+            min_val = x_info.vmin
+            max_val = x_info.vmax
         except:
             min_val, max_val = 0, 100
         
@@ -498,9 +805,11 @@ class GraphApp:
         idx = len(self.trendline_sets) + 1
         c_min = self.var_min.get()
         c_max = self.var_max.get()
-        new_set = {'name': f"Range {idx}", 'min': c_min, 'max': c_max}
+        new_set = {'name': f"Range {idx}", 'min': c_min, 'max': c_max, 'id': self.next_trend_id}
+        new_set.update(self.read_model_options())
+        self.next_trend_id += 1
         self.trendline_sets.append(new_set)
-        self.list_trends.insert(tk.END, new_set['name'])
+        self.list_trends.insert(tk.END, self.trend_list_label(new_set))
         self.list_trends.selection_clear(0, tk.END)
         self.list_trends.selection_set(tk.END)
         self.draw_graph()
@@ -527,26 +836,91 @@ class GraphApp:
         self.var_max.set(data['max'])
         self.scale_min.config(command=cmd_min)
         self.scale_max.config(command=cmd_max)
+
+        # 近似の種類も選択した組のものを表示する
+        self.combo_model.current(FIT_MODEL_KEYS.index(data['model']))
+        self.var_degree.set(str(data['degree']))
+        self.entry_formula.delete(0, tk.END)
+        self.entry_formula.insert(0, data['formula'])
+        self.var_bands.set(data['bands'])
+        self.lbl_fit_error.config(text="")
         
         self.draw_graph()
 
-    def on_slider_change(self, val):
+    def read_model_options(self):
+        """近似の種類・次数・式の入力を読む"""
+        try:
+            degree = max(1, min(9, int(self.var_degree.get())))
+        except ValueError:
+            degree = 2
+        return {'model': FIT_MODEL_KEYS[self.combo_model.current()], 'degree': degree,
+                'formula': self.entry_formula.get().strip(), 'bands': self.var_bands.get()}
+
+    def trend_list_label(self, t_set):
+        kind = FIT_SHORT_NAMES[t_set['model']]
+        if t_set['model'] == 'poly': kind += f" {t_set['degree']}次"
+        if t_set['bands']: kind += ", 区間"
+        return f"{t_set['name']} ({kind})"
+
+    def on_model_change(self, event=None):
+        """近似の種類・次数・式の変更を選択中の組に反映する"""
+        options = self.read_model_options()
+        self.lbl_fit_error.config(text="")
+        if options['model'] == 'formula' and options['formula'] and curvefit is not None:
+            try:
+                curvefit.parse_formula(options['formula'])
+            except ValueError as e:
+                self.lbl_fit_error.config(text=str(e))
+                return
+        self.settings.update({"fit_model": options['model'], "fit_degree": options['degree'],
+                              "fit_formula": options['formula'], "fit_bands": options['bands']})
         sel = self.list_trends.curselection()
         if not sel: return
         idx = sel[0]
-        self.trendline_sets[idx]['min'] = self.var_min.get()
-        self.trendline_sets[idx]['max'] = self.var_max.get()
+        t_set = self.trendline_sets[idx]
+        if all(t_set[k] == v for k, v in options.items()): return
+        t_set.update(options)
+        self.list_trends.delete(idx)
+        self.list_trends.insert(idx, self.trend_list_label(t_set))
+        self.list_trends.selection_set(idx)
         self.draw_graph()
 
+    def on_resamples_change(self, event=None):
+        """ブートストラップ回数の変更 (区間を表示している組があれば描き直す)"""
+        try:
+            n = max(100, min(100000, int(self.var_resamples.get())))
+        except ValueError:
+            return
+        if n == self.settings.get("bootstrap_resamples"): return
+        self.settings["bootstrap_resamples"] = n
+        if any(t_set['bands'] for t_set in self.trendline_sets):
+            self.draw_graph()
+
+    def on_slider_change(self, val):
+        sel = self.list_trends.curselection()
+        if not sel: return
+        idx = sel[0]
+        r_min = self.var_min.get()
+        r_max = self.var_max.get()
+        self.trendline_sets[idx]['min'] = r_min
+        self.trendline_sets[idx]['max'] = r_max
+        if self.renderer is None: return
+        # 範囲マーカーは毎フレーム、近似の再計算は操作が落ち着いてから
+        self.scheduler.invalidate('range', lambda: self.renderer.show_range(r_min, r_max))
+        self.scheduler.invalidate('graph', self.render_graph, heavy=True)
+
     def combine_label(self, label, unit):
         if unit:
             if "^" in unit: return f"{label} [$\\mathrm{{{unit}}}$]"
             else: return f"{label} [{unit}]"
         return label
 
-    def render_plot(self, ax):
-        """描画ロジック（ライトモード前提）"""
-        if self.df_raw is None: return
+    def snapshot_plot_state(self):
+        """描画に必要な状態 (列・設定・近似範囲) を写し取る (Tk スレッドで呼ぶ)
+
+        ウィジェットを読むのはここだけにして、重い計算は compute_plot_spec に任せる。
+        """
+        if self.df_raw is None: return None
 
         # 設定反映
         settings = self.settings
@@ -559,16 +933,39 @@ class GraphApp:
             "x_log": self.var_x_log.get(),
             "y_log": self.var_y_log.get()
         })
+        settings.update({f"rolling_{key}": var.get() for key, var in self.var_rolling.items()})
+        try:
+            settings["rolling_window"] = max(2, int(self.var_rolling_window.get()))
+        except ValueError:
+            pass # 入力途中の値は無視して前回の窓幅を使う
 
         x_col_idx = self.combo_x_col.current()
-        if x_col_idx < 0: return
-        x_col_name = self.combo_x_col.get()
+        if x_col_idx < 0: return None
         
         y_indices = self.list_cols.curselection()
-        if not y_indices: return
+        if not y_indices: return None
+
+        return {
+            'x_col': self.combo_x_col.get(),
+            'y_cols': [self.df_raw.columns[idx] for idx in y_indices],
+            'settings': dict(settings),
+            'trends': [dict(t_set) for t_set in self.trendline_sets],
+            'num_cols': self.num_cols,
+            'fit_cache': self.fit_cache,
+            'curve_cache': self.curve_cache,
+            'band_cache': self.band_cache,
+            'rolling_cache': self.rolling_cache,
+            'data_version': self.data_version,
+        }
+
+    def compute_plot_spec(self, state, job=None):
+        """写し取った状態から描画仕様を組み立てて返す (ワーカースレッドから呼んでよい)"""
+        settings = state['settings']
+        x_col_name = state['x_col']
+        num_cols = state['num_cols']
 
-        x_data_raw = self.df_raw[x_col_name]
-        x_num_all = pd.to_numeric(x_data_raw, errors='coerce')
+        x_info = num_cols[x_col_name]
+        x_num_all = x_info.values
         
         max_val = 0
         
@@ -578,206 +975,266 @@ class GraphApp:
         # 近似直線用: 暖色・強調色系 (赤, オレンジ, ピンク, オリーブ, 黒)
         trend_colors = ['#d62728', '#ff7f0e', '#e377c2', '#bcbd22', '#000000']
 
-        # 凡例収集用のリスト
-        plot_handles = []
-        plot_labels = []
-        fit_handles = []
-        fit_labels = []
+        # 描画対象の収集用リスト
+        series = []
+        fits = []
 
         # --- データプロット ---
-        for i, idx in enumerate(y_indices):
-            col_name = self.df_raw.columns[idx]
-            y_data_raw = self.df_raw[col_name]
-            y_num = pd.to_numeric(y_data_raw, errors='coerce')
+        fit_inputs = []
+        for i, col_name in enumerate(state['y_cols']):
+            if job: job.check()
+            y_info = num_cols[col_name]
+            y_num = y_info.values
             
-            mask = np.isfinite(x_num_all) & np.isfinite(y_num)
-            if mask.sum() == 0: continue
+            # X が全て有効なら Y の有効マスクをそのまま使える (列ごとにマスクを作らない)
+            mask = y_info.finite if x_info.all_finite else x_info.finite & y_info.finite
+            if y_info.count == 0 or not mask.any(): continue
             
-            current_max = np.max(np.abs(y_num[mask]))
+            # X が全て有効なら列の統計をそのまま使える
+            current_max = y_info.abs_max if x_info.all_finite else scale.nan_abs_max(y_num, where=mask)
             if current_max > max_val: max_val = current_max
 
             series_color = plot_colors[i % len(plot_colors)]
             
-            sc = ax.scatter(x_num_all[mask], y_num[mask], label=col_name, s=settings["marker_size"], color=series_color, alpha=0.8, zorder=3)
-            plot_handles.append(sc)
-            plot_labels.append(col_name)
-
-            # --- 近似直線 ---
-            for t_idx, t_set in enumerate(self.trendline_sets):
-                r_min = t_set['min']
-                r_max = t_set['max']
-                
-                # 計算には「指定された範囲」のデータのみを使用
-                range_mask = mask & (x_num_all >= r_min) & (x_num_all <= r_max)
-                
-                if range_mask.sum() > 1:
-                    try:
-                        x_fit = x_num_all[range_mask].values.astype(float)
-                        y_fit = y_num[range_mask].values.astype(float)
-                        
-                        # ログスケールの場合は <= 0 のデータを除外
-                        valid_mask = np.full(x_fit.shape, True)
-                        if settings["x_log"]:
-                            valid_mask &= (x_fit > 0)
-                        if settings["y_log"]:
-                            valid_mask &= (y_fit > 0)
-                            
-                        x_fit = x_fit[valid_mask]
-                        y_fit = y_fit[valid_mask]
-
-                        if len(x_fit) < 2: continue
-
-                        # フィッティングモードの決定と計算
-                        # 1. Log-Log (両対数): log(y) = A * log(x) + B
-                        if settings["x_log"] and settings["y_log"]:
-                            log_x = np.log10(x_fit)
-                            log_y = np.log10(y_fit)
-                            z = np.polyfit(log_x, log_y, 1)
-                            A = z[0] # Slope
-                            B = z[1] # Intercept
-                            
-                            corr = np.corrcoef(log_x, log_y)
-                            r2 = corr[0, 1]**2
-                            
-                            s_A = float_to_latex_sci(A)
-                            s_B = float_to_latex_sci(abs(B))
-                            sign = "+" if B >= 0 else "-"
-                            trend_label = f"$\log(y)={s_A} \log(x) {sign} {s_B}$"
-                            
-                            func = lambda x: 10**(A * np.log10(x) + B)
-                            
-                        # 2. Semi-Log X (片対数X): y = A * log(x) + B
-                        elif settings["x_log"] and not settings["y_log"]:
-                            log_x = np.log10(x_fit)
-                            z = np.polyfit(log_x, y_fit, 1)
-                            A = z[0]
-                            B = z[1]
-                            
-                            corr = np.corrcoef(log_x, y_fit)
-                            r2 = corr[0, 1]**2
-                            
-                            s_A = float_to_latex_sci(A)
-                            s_B = float_to_latex_sci(abs(B))
-                            sign = "+" if B >= 0 else "-"
-                            trend_label = f"$y={s_A} \log(x) {sign} {s_B}$"
-                            
-                            func = lambda x: A * np.log10(x) + B
-
-                        # 3. Semi-Log Y (片対数Y): log(y) = A * x + B
-                        elif not settings["x_log"] and settings["y_log"]:
-                            log_y = np.log10(y_fit)
-                            z = np.polyfit(x_fit, log_y, 1)
-                            A = z[0]
-                            B = z[1]
-                            
-                            corr = np.corrcoef(x_fit, log_y)
-                            r2 = corr[0, 1]**2
-                            
-                            s_A = float_to_latex_sci(A)
-                            s_B = float_to_latex_sci(abs(B))
-                            sign = "+" if B >= 0 else "-"
-                            trend_label = f"$\log(y)={s_A} x {sign} {s_B}$"
-                            
-                            func = lambda x: 10**(A * x + B)
-
-                        # 4. Linear (通常): y = ax + b
-                        else:
-                            z = np.polyfit(x_fit, y_fit, 1)
-                            p = np.poly1d(z)
-                            
-                            corr = np.corrcoef(x_fit, y_fit)
-                            r2 = corr[0, 1]**2
-                            
-                            slope = float_to_latex_sci(z[0])
-                            intercept = float_to_latex_sci(abs(z[1]))
-                            sign = "+" if z[1] >= 0 else "-"
-                            
-                            trend_label = f"$y={slope}x {sign} {intercept}$"
-                            func = p
-
-                        if settings.get("show_r2", True):
+            # 列 (メモリマップ) をそのまま渡し、有効な点はマスクで示す (マスクを掛けた写しは作らない)
+            series.append({
+                'name': col_name,
+                'x': x_num_all,
+                'y': y_num,
+                'valid': mask,
+                'color': series_color,
+            })
+            # 移動統計・近似は X か Y が有効でない点を自分で除くので、列をそのまま渡す
+            fit_inputs.append((col_name, y_num))
+
+        # --- 移動統計 (X でソートした有効な点で計算。列・窓幅ごとにキャッシュし、追記分だけ足す) ---
+        rolling_lines = []
+        window = settings["rolling_window"]
+        kinds = [key for key, _, _ in ROLLING_KINDS if settings[f"rolling_{key}"]]
+        for s, (col_name, y_masked) in zip(series, fit_inputs):
+            for key, name, linestyle in ROLLING_KINDS:
+                if key not in kinds: continue
+                if job: job.check()
+                label = f"{col_name} {name} ({window}点)"
+                x_r, y_r = state['rolling_cache'].compute(
+                    state['data_version'], x_col_name, x_num_all, col_name, y_masked, key, window)
+                if len(x_r) == 0: continue
+                if key == 'std':
+                    _, mean = state['rolling_cache'].compute(
+                        state['data_version'], x_col_name, x_num_all, col_name, y_masked, 'mean', window)
+                    curves = [(mean - y_r, label), (mean + y_r, None)]
+                else:
+                    curves = [(y_r, label)]
+                for y_line, line_label in curves:
+                    rolling_lines.append({'x': x_r, 'y': y_line, 'label': line_label,
+                                          'color': s['color'], 'linestyle': linestyle})
+
+        # --- 近似直線・近似曲線 ---
+        # 計算には「指定された範囲」のデータのみを使用。全系列をまとめて計算する
+        trends = state['trends']
+        fit_lines = {} # (系列, 組) -> 描画する線 (凡例を系列ごとに並べるため後で整列する)
+        pending_bands = [] # まだ計算していないブートストラップ区間 (resolve_bands で求める)
+        if not any(t_set['model'] == 'linear' for t_set in trends):
+            state['fit_cache'].clear() # 1次近似が無くなったら累積和を手放す
+        if fit_inputs and trends:
+            if job: job.check()
+            x_log, y_log = settings["x_log"], settings["y_log"]
+            show_r2 = settings.get("show_r2", True)
+
+            # 1次近似: 全系列×全範囲を累積和から一括で計算する
+            linear = [t_idx for t_idx, t_set in enumerate(trends) if t_set['model'] == 'linear']
+            if linear:
+                ranges = [(trends[t_idx]['min'], trends[t_idx]['max']) for t_idx in linear]
+                # 累積和はデータ・X列・対数フラグが変わった時だけ作り直す (スライダー操作では再利用)
+                cache_key = (state['data_version'], x_col_name, x_log, y_log)
+                result = state['fit_cache'].fit(cache_key, x_num_all, fit_inputs,
+                                                ranges, x_log, y_log)
+
+                for i in range(len(fit_inputs)):
+                    for j, t_idx in enumerate(linear):
+                        # ログスケールの場合は <= 0 のデータを除外済み
+                        if result['count'][i, j] < 2: continue
+                        A = result['slope'][i, j]
+                        B = result['intercept'][i, j]
+                        r2 = result['r2'][i, j]
+                        if not (np.isfinite(A) and np.isfinite(B)): continue
+
+                        trend_label = format_trend_label(A, B, x_log, y_log)
+                        if show_r2:
                             trend_label += f", $R^2={r2:.3f}$"
-                        
-                        # 描画用x座標の生成
-                        x_min_fit, x_max_fit = x_fit.min(), x_fit.max()
-                        
-                        # 範囲外への少しの延長
-                        if settings["x_log"]:
-                            # 対数軸の場合、少しマージンを取る計算
-                            log_min = np.log10(x_min_fit)
-                            log_max = np.log10(x_max_fit)
-                            diff = log_max - log_min
-                            if diff == 0: diff = 0.1
-                            m = diff * 0.1
-                            x_l = np.logspace(log_min - m, log_max + m, 100)
-                        else:
-                            x_range = x_max_fit - x_min_fit
-                            if x_range == 0: x_range = 1
-                            m = x_range * 0.1
-                            x_l = np.linspace(x_min_fit - m, x_max_fit + m, 100)
-                        
-                        t_color = trend_colors[t_idx % len(trend_colors)]
-                        
-                        line, = ax.plot(x_l, func(x_l), color=t_color, linestyle='--', linewidth=2.0, alpha=0.9, label=trend_label, zorder=2)
-                        
-                        # 重複しないようにラベルを追加
-                        if trend_label not in fit_labels:
-                            fit_handles.append(line)
-                            fit_labels.append(trend_label)
-                        
-                    except Exception as e:
-                        # print(f"Trendline error: {e}") 
-                        pass
-
-        # x=0, y=0 のラインを強調 (ログスケールの場合は無視)
-        if not settings["x_log"] and not settings["y_log"]:
-            ax.axhline(0, color='gray', linewidth=1.0, zorder=1)
-            ax.axvline(0, color='gray', linewidth=1.0, zorder=1)
-        
-        # 軸のスケール設定
-        if settings["x_log"]:
-            ax.set_xscale('log')
-        if settings["y_log"]:
-            ax.set_yscale('log')
-        
-        # 通常のグリッド線は設定に従う（視認性を上げるため明示的にスタイル指定）
-        if settings["grid"]:
-            ax.grid(True, which='major', linestyle='-', linewidth=0.5, color='#bfbfbf', alpha=1.0, zorder=0)
-            ax.set_axisbelow(True)
-        else:
-            ax.grid(False)
 
-        # 軸ラベル
-        xlabel = self.combine_label(settings["x_label"], settings["x_unit"])
-        ylabel = self.combine_label(settings["y_label"], settings["y_unit"])
-        ax.set_xlabel(xlabel, fontsize=settings["font_size"]*1.5)
-        ax.set_ylabel(ylabel, fontsize=settings["font_size"]*1.5)
-        
+                        x_l = fit_line_x(result['x_min'][i, j], result['x_max'][i, j], x_log)
+                        y_l = fitting.predict(A, B, x_l, x_log, y_log)
+                        line = {'x': x_l, 'y': y_l, 'label': trend_label}
+                        if trends[t_idx]['bands']:
+                            # 変換後の座標 (u, v) で求め、v を元の Y に戻す
+                            band = uncertainty.linear_bands(
+                                A, B, result['count'][i, j], result['ss_res'][i, j],
+                                result['u_mean'][i, j], result['u_ss'][i, j],
+                                fitting.transform(x_l, x_log))
+                            if band is not None:
+                                if y_log:
+                                    band['conf'] = tuple(10 ** v for v in band['conf'])
+                                    band['pred'] = tuple(10 ** v for v in band['pred'])
+                                self.attach_band(line, ("A", "B"), band)
+                        fit_lines[(i, t_idx)] = line
+
+            # 多項式・非線形近似: 組ごとに全系列をまとめて解く (前回の解から反復を始める)
+            for t_idx, t_set in enumerate(trends):
+                if t_set['model'] == 'linear': continue
+                try:
+                    model = curvefit.make_model(t_set['model'], t_set['degree'], t_set['formula'])
+                except ValueError:
+                    continue # 式が未入力・不正 (入力欄でエラーを表示済み)
+                x_range = (t_set['min'], t_set['max'])
+                result = state['curve_cache'].fit(
+                    (state['data_version'], x_col_name), t_set['id'], model, x_num_all, fit_inputs,
+                    x_range, check=job.check if job else None)
+                if t_set['bands']:
+                    xs, Y, W = curvefit.select_range(x_num_all, [y for _, y in fit_inputs], x_range)
+
+                for i in range(len(fit_inputs)):
+                    params = result['params'][i]
+                    if not np.isfinite(params).all(): continue
+                    trend_label = format_model_label(model, params)
+                    if show_r2:
+                        trend_label += f", $R^2={result['r2'][i]:.3f}$"
+                    x_l = fit_line_x(result['x_min'][i], result['x_max'][i], x_log, n=200)
+                    line = {'x': x_l, 'y': model(x_l, params), 'label': trend_label}
+                    fit_lines[(i, t_idx)] = line
+                    if not t_set['bands']: continue
+
+                    x_i, y_i = xs[W[i]], Y[i][W[i]]
+                    if model.linear:
+                        band = uncertainty.polynomial_bands(model, x_i, y_i, x_l)
+                        if band is not None:
+                            self.attach_band(line, model.params, band)
+                        continue
+                    # 非線形はブートストラップ。計算済みなら使い、無ければ裏で求めてから描き直す
+                    band_key = (state['data_version'], x_col_name, fit_inputs[i][0], t_set['model'],
+                                t_set['degree'], t_set['formula'], x_range, settings['bootstrap_resamples'],
+                                settings['bootstrap_full_refit_elements'])
+                    band = state['band_cache'].get(band_key)
+                    if band is None:
+                        pending_bands.append({
+                            'key': band_key, 'model_args': (t_set['model'], t_set['degree'], t_set['formula']),
+                            'x': x_i, 'y': y_i, 'params': params, 'x_eval': x_l,
+                            'resamples': settings['bootstrap_resamples'],
+                            'full_refit_elements': settings['bootstrap_full_refit_elements'],
+                        })
+                    elif band:
+                        self.attach_band(line, model.params, band)
+
+        for (i, t_idx), line in sorted(fit_lines.items()):
+            line['color'] = trend_colors[t_idx % len(trend_colors)]
+            fits.append(line)
+
         # 指数表記 (ログスケールでない場合のみ適用)
+        exponent = None
         if not settings["y_log"]:
-            exponent = int(math.floor(math.log10(max_val))) if max_val != 0 else 0
-            def sci_fmt(x, pos):
-                if x==0: return "0"
-                return r"${:.1f} \times 10^{{{}}}$".format(x / 10**exponent, exponent)
-            ax.yaxis.set_major_formatter(ticker.FuncFormatter(sci_fmt))
-
-        # --- 凡例の配置 (2箇所に分離) ---
-        
-        # 1. プロット凡例 (右上) - データが2つ以上ある場合のみ
-        if len(plot_handles) > 1:
-            l1 = ax.legend(plot_handles, plot_labels, loc='upper right', fontsize=settings["font_size"]*1.2, frameon=True)
-            ax.add_artist(l1) # 2つ目の凡例を追加するために必要
-            
-        # 2. 近似直線凡例 (右下) - 近似直線がある場合のみ
-        if fit_handles:
-            ax.legend(fit_handles, fit_labels, loc='lower right', fontsize=settings["font_size"]*1.2, frameon=True)
+            exponent = scale.exponent_of(max_val)
+
+        return {
+            'data_token': (state['data_version'], x_col_name),
+            'series': series,
+            'rolling': rolling_lines,
+            'rolling_key': (window, tuple(kinds)),
+            'fits': fits,
+            'pending_bands': pending_bands,
+            'x_log': settings["x_log"],
+            'y_log': settings["y_log"],
+            'grid': settings["grid"],
+            'marker_size': settings["marker_size"],
+            'font_size': settings["font_size"],
+            'xlabel': self.combine_label(settings["x_label"], settings["x_unit"]),
+            'ylabel': self.combine_label(settings["y_label"], settings["y_unit"]),
+            'exponent': exponent,
+        }
+
+    def attach_band(self, line, names, band):
+        """近似線に区間を付け、パラメータの標準誤差を凡例に足す"""
+        line['band'] = {'conf': band['conf'], 'pred': band['pred']}
+        line['label'] += format_error_label(names, band['errors'])
+        if band.get('linearized'):
+            line['label'] += " (線形化)" # LM で解き直していない近似の区間
+
+    def resolve_bands(self, pending, band_cache, job):
+        """ブートストラップで区間を求めて band_cache に入れる (ワーカースレッドで実行)"""
+        for n, item in enumerate(pending):
+            job.check()
+            linearized = uncertainty.is_linearized(item['resamples'], len(item['x']), item['full_refit_elements'])
+            method = "線形化" if linearized else "解き直し"
+            def progress(fraction, n=n, method=method):
+                job.report((n + fraction) / len(pending),
+                           f"ブートストラップ中 ({n + 1}/{len(pending)}, {item['resamples']} 回, {method})...")
+            progress(0.0)
+            model = curvefit.make_model(*item['model_args'])
+            samples, resid = uncertainty.bootstrap_params(
+                item['model_args'], item['x'], item['y'], item['params'], item['resamples'],
+                check=job.check, progress=progress, full_refit_elements=item['full_refit_elements'])
+            band = uncertainty.bootstrap_bands(model, samples, resid, item['params'], item['x_eval'])
+            if band:
+                band['linearized'] = linearized
+            band_cache.put(item['key'], band or {}) # 求まらなかった組も覚えておき、何度も計算しない
 
     def draw_graph(self):
-        self.ax.clear()
-        self.render_plot(self.ax)
+        """再描画を予約する (実際の描画は render_graph)"""
+        if self.renderer is None: return # グラフ欄がまだ無い (起動直後)
+        self.scheduler.invalidate('graph', self.render_graph)
+
+    def update_stats(self, stats):
+        self.lbl_stats.config(text="描画 {rendered} 回 / 統合 {coalesced} / 欠落 {dropped} ({last_ms:.0f} ms)".format(**stats))
+
+    def render_graph(self):
+        """状態を写し取り、描画仕様の計算をワーカーに任せる (画面への反映は apply_plot_spec)"""
+        state = self.snapshot_plot_state()
         save_settings(self.settings)
-        self.fig.tight_layout()
-        self.canvas.draw()
+        if state is None:
+            self.jobs.cancel('render')
+            self.renderer.clear()
+            return
+        self.jobs.submit('render', lambda job: self.compute_plot_spec(state, job),
+                         self.apply_plot_spec, self.on_job_error)
+
+    def apply_plot_spec(self, spec):
+        if spec['data_token'][0] != self.data_version: return # 計算中に別のデータが開かれた
+        self.renderer.render(spec)
+        if not spec['pending_bands']:
+            self.jobs.cancel('bands')
+            return
+        # 区間は近似線を先に出してから裏で求め、終わったら描き直す (キャッシュから描かれる)
+        pending, band_cache = spec['pending_bands'], self.band_cache
+        self.jobs.submit('bands', lambda job: self.resolve_bands(pending, band_cache, job),
+                         lambda _: self.draw_graph(), self.on_job_error)
+
+    def update_job_status(self, active):
+        """実行中のジョブの進捗バーとキャンセルボタンを出し入れする"""
+        if not active:
+            self.lbl_job.config(text="")
+            self.progress_job.pack_forget()
+            self.btn_cancel.pack_forget()
+            return
+        # 書き出しがあればそちらを優先して表示する
+        name, fraction, text = sorted(active, key=lambda a: a[0] != 'export')[0]
+        self.lbl_job.config(text=text or {'render': "描画計算中...", 'bands': "区間を計算中...",
+                                          'columns': "列ストアに変換中..."}.get(name, "処理中..."))
+        if not self.progress_job.winfo_ismapped():
+            self.btn_cancel.pack(side=tk.LEFT, padx=5)
+            self.progress_job.pack(side=tk.LEFT, padx=5)
+        if fraction is None:
+            self.progress_job.config(mode='indeterminate')
+            self.progress_job.step(0.05)
+        else:
+            self.progress_job.config(mode='determinate', value=fraction)
+
+    def cancel_jobs(self):
+        if self.jobs.is_running('columns'):
+            self.lbl_filename.config(text=f"{os.path.basename(self.filepath)}\n変換を中止しました")
+        self.jobs.cancel()
+        self.update_job_status([])
+
+    def on_job_error(self, error):
+        messagebox.showerror("Error", f"処理に失敗しました:\n{error}")
 
     def save_image(self):
         if self.filepath:
@@ -787,14 +1244,42 @@ class GraphApp:
             
         path = filedialog.asksaveasfilename(
             initialfile=default_name,
-            filetypes=[("PNG Image", "*.png"), ("PDF", "*.pdf")]
+            filetypes=[("PNG Image", "*.png"), ("PDF", "*.pdf"), ("SVG", "*.svg")]
         )
-        if path:
-            # 保存時も現在と同じ設定（標準配色）で保存
-            self.fig.savefig(path, dpi=300)
-            messagebox.showinfo("Saved", f"保存しました:\n{path}")
+        if not path: return
+        state = self.snapshot_plot_state()
+        if state is None:
+            messagebox.showwarning("Warning", "保存するグラフがありません")
+            return
+        # 保存先に加えて export_extra の形式・dpi もまとめて書き出す (例: ["pdf", "png@600"])
+        targets = exporter.parse_targets(path, self.settings.get("export_dpi", 300),
+                                         self.settings.get("export_extra", []))
+        raster_dpi = self.settings.get("export_raster_dpi", 300)
+        figsize = tuple(self.fig.get_size_inches())
+        view = self.renderer.view()
+
+        def export(job):
+            # 画面の Figure には触らず、写し取った状態から別プロセスで全点を描いて書き出す
+            job.report(None, "書き出し準備中...")
+            spec = self.compute_plot_spec(state, job)
+            if spec['pending_bands']:
+                # 保存する図には区間を必ず入れる (まだなら求めてから組み立て直す)
+                self.resolve_bands(spec['pending_bands'], state['band_cache'], job)
+                spec = self.compute_plot_spec(state, job)
+            spec.pop('pending_bands')
+            return self.export_worker.export(spec, figsize, view, targets, raster_dpi, job)
+
+        def done(results):
+            messagebox.showinfo("Saved", f"保存しました:\n{exporter.format_export_report(results)}")
+
+        self.jobs.submit('export', export, done, self.on_job_error)
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = GraphApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.jobs.shutdown()
+    app.export_worker.close()
+    if uncertainty is not None:
+        uncertainty.shutdown_pool()
+    settings_store.flush()
\ No newline at end of file
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    """ジョブがキャンセルされた"""
+
+
+class Job:
+    """実行中のジョブ1つ分の状態 (キャンセル要求と進捗)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.future = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = (None, "")  # (0〜1 または None (不明), 説明)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        """キャンセルされていれば Cancelled を投げる (ジョブ側で区切りごとに呼ぶ)"""
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def report(self, fraction, text=""):
+        """進捗を記録する (ワーカースレッドから呼ぶ。表示は Tk スレッドで行う)"""
+        with self._lock:
+            self._progress = (fraction, text)
+
+    def progress(self):
+        with self._lock:
+            return self._progress
+
+
+class JobRunner:
+    """描画・書き出しなどの重い処理をワーカースレッドで実行し、結果を root.after で Tk に戻す
+
+    同じ名前のジョブは1本のスレッドで順に実行し、新しく投入すると前のジョブはキャンセルする
+    (最後の要求だけが結果を返す)。ジョブ関数には Job が渡されるので、
+    区切りごとに job.check() でキャンセルを確認し、job.report() で進捗を知らせる。
+    """
+
+    def __init__(self, root, poll_ms=30, on_status=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_status = on_status  # 実行中のジョブ一覧が変わるたび・進捗ごとに呼ぶ
+        self._executors = {}
+        self._active = {}  # 名前 -> (Job, on_done, on_error)
+        self._polling = False
+
+    def submit(self, name, func, on_done, on_error=None):
+        """func(job) をワーカーで実行し、終わったら on_done(結果) を Tk スレッドで呼ぶ"""
+        previous = self._active.get(name)
+        if previous is not None:
+            previous[0].cancel()
+        executor = self._executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"job-{name}")
+            self._executors[name] = executor
+        job = Job(name)
+        job.future = executor.submit(func, job)
+        self._active[name] = (job, on_done, on_error)
+        self._start_polling()
+        return job
+
+    def cancel(self, name=None):
+        """指定したジョブ (省略時は全て) をキャンセルする"""
+        for job_name, (job, _, _) in list(self._active.items()):
+            if name is None or job_name == name:
+                job.cancel()
+
+    def active(self):
+        """実行中のジョブ [(名前, 進捗, 説明), ...]"""
+        return [(name, *job.progress()) for name, (job, _, _) in self._active.items()]
+
+    def is_running(self, name):
+        return name in self._active
+
+    def shutdown(self):
+        self.cancel()
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        for name, (job, on_done, on_error) in list(self._active.items()):
+            if not job.future.done():
+                continue
+            del self._active[name]
+            if job.cancelled:
+                continue  # 新しいジョブに置き換えられたか、ユーザーが止めた
+            error = job.future.exception()
+            if error is None:
+                on_done(job.future.result())
+            elif not isinstance(error, Cancelled) and on_error is not None:
+                on_error(error)
+        if self.on_status:
+            self.on_status(self.active())
+        if self._active:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class SheetPrefetcher:
+    """ブックの残りのシートをスレッドプールで先読みしておく
+
+    読み込んだシートはメモリ上に保持し、合計が max_bytes を超えたら
+    最後に使ってから最も時間が経ったもの (表示中のシートは除く) から手放す。
+    手放したシートは次に選ばれた時に read_sheet() で読み直す。
+    """
+
+    def __init__(self, read_sheet, max_workers=2, max_bytes=DEFAULT_MAX_BYTES):
+        self._read_sheet = read_sheet
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheet-prefetch")
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()  # シート名 -> DataFrame (LRU順)
+        self._sizes = {}
+        self._futures = {}  # 先読み中のシート -> Future (終わったら消す。結果は _frames だけに持つ)
+        self._errors = {}
+        self._done = set()  # 一度でも読み込みが終わったシート
+        self.current = None
+        self.total = 0
+
+    def load_now(self, sheet):
+        """表示するシートを今すぐ読む (先読み済みならそれを返す)
+
+        手放したシートや先読みに失敗したシートは読み直す。
+        """
+        self.current = sheet
+        df = self.get(sheet)
+        if df is not None:
+            return df
+        with self._lock:
+            future = self._futures.get(sheet)
+        if future is not None and not future.cancel():
+            # 先読み中ならその完了を待つ
+            try:
+                future.result()
+            except Exception:
+                pass  # 失敗していたら下で読み直す
+            df = self.get(sheet)
+            if df is not None:
+                return df
+        return self._load(sheet)
+
+    def start(self, sheets):
+        """sheets をバックグラウンドで順に読み込む"""
+        self.total = len(sheets)
+        for sheet in sheets:
+            with self._lock:
+                if sheet in self._frames or sheet in self._futures:
+                    continue
+                future = self._executor.submit(self._load, sheet)
+                self._futures[sheet] = future
+            future.add_done_callback(lambda f, sheet=sheet: self._forget(sheet, f))
+
+    def get(self, sheet):
+        """読み込み済みなら DataFrame、まだなら None"""
+        with self._lock:
+            df = self._frames.get(sheet)
+            if df is not None:
+                self._frames.move_to_end(sheet)
+            return df
+
+    def is_running(self, sheet):
+        """そのシートを別スレッドで読み込んでいる最中か"""
+        with self._lock:
+            future = self._futures.get(sheet)
+        return future is not None and future.running()
+
+    def progress(self):
+        """(読み込み済み, 全体, メモリから手放した数, エラー数)"""
+        with self._lock:
+            freed = len(self._done) - len(self._frames)
+            return len(self._done), self.total, freed, len(self._errors)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget(self, sheet, future):
+        # 終わった Future は DataFrame を持ち続けるので、手放した後もメモリに残らないよう消す
+        with self._lock:
+            if self._futures.get(sheet) is future:
+                del self._futures[sheet]
+
+    def _load(self, sheet):
+        try:
+            df = self._read_sheet(sheet)
+        except Exception as e:
+            with self._lock:
+                self._errors[sheet] = e
+            raise
+        with self._lock:
+            self._errors.pop(sheet, None)
+            self._done.add(sheet)
+            self._frames[sheet] = df
+            self._sizes[sheet] = int(df.memory_usage(index=True).sum())
+            self._evict()
+        return df
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        for sheet in list(self._frames):
+            if total <= self.max_bytes:
+                break
+            if sheet == self.current:
+                continue
+            del self._frames[sheet]
+            total -= self._sizes.pop(sheet)
@@ -0,0 +1,115 @@
+import os
+import threading
+import traceback
+import multiprocessing
+
+from jobs import Cancelled
+
+# 書き出し側へ引き継ぐ rcParams (フォント・線・軸などの見た目に関わるもの)
+RC_GROUPS = ('font', 'mathtext', 'axes', 'grid', 'figure', 'xtick', 'ytick',
+             'legend', 'lines', 'patch', 'text', 'savefig', 'scatter')
+POLL_SECONDS = 0.05
+
+
+def _snapshot_rc():
+    import matplotlib
+    return {k: v for k, v in matplotlib.rcParams.items() if k.split('.')[0] in RC_GROUPS}
+
+
+def _worker_main(conn):
+    """ワーカープロセス本体: 書き出し要求を1つずつ受けて処理する"""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    from renderer import draw_static
+    import exporter
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        try:
+            matplotlib.rcParams.update(request['rc'])
+            fig = draw_static(Figure(figsize=request['figsize']), request['spec'], request['view'])
+            def progress(done, total, text):
+                conn.send(('progress', done / total, text))
+            results = exporter.export_figure(fig, request['targets'], raster_dpi=request['raster_dpi'],
+                                             progress=progress)
+            conn.send(('done', results))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class RenderProcess:
+    """書き出し用の常駐ワーカープロセス
+
+    Agg の描画は GIL を離さないので、スレッドで描くと Tk の画面が固まる。
+    別プロセスで描き、進捗はパイプで受け取る。キャンセル時はプロセスごと止め、
+    次の書き出しで作り直す。最初の1回だけプロセス起動 (matplotlib の読み込み) の時間がかかる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # 同時に使うのは1つの書き出しだけ
+        self._proc = None
+        self._conn = None
+
+    def export(self, spec, figsize, view, targets, raster_dpi, job):
+        """ワーカーで描いて書き出し、exporter.export_figure と同じ結果を返す (ジョブのスレッドから呼ぶ)"""
+        before = {path: _mtime(path) for path, _, _ in targets}
+        with self._lock:
+            self._ensure_started()
+            self._conn.send({'spec': spec, 'figsize': figsize, 'view': view, 'targets': targets,
+                             'raster_dpi': raster_dpi, 'rc': _snapshot_rc()})
+            while True:
+                if job.cancelled:
+                    self._terminate()
+                    # 今回書いた (書きかけの) ファイルを消す
+                    for path, mtime in before.items():
+                        if _mtime(path) != mtime:
+                            os.remove(path)
+                    raise Cancelled()
+                if not self._conn.poll(POLL_SECONDS):
+                    if not self._proc.is_alive():
+                        self._terminate()
+                        raise RuntimeError("書き出し用のプロセスが異常終了しました")
+                    continue
+                kind, *payload = self._conn.recv()
+                if kind == 'progress':
+                    job.report(*payload)
+                elif kind == 'done':
+                    return payload[0]
+                else:
+                    raise RuntimeError(payload[0])
+
+    def close(self):
+        with self._lock:
+            self._terminate()
+
+    def _ensure_started(self):
+        if self._proc is not None and self._proc.is_alive():
+            return
+        ctx = multiprocessing.get_context('spawn')  # Windows と同じ起動方法に揃える
+        parent_conn, child_conn = ctx.Pipe()
+        self._proc = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True,
+                                 name="graphpro-export")
+        self._proc.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def _terminate(self):
+        if self._proc is not None:
+            if self._proc.is_alive():
+                self._proc.terminate()
+            self._proc.join(timeout=1)
+        if self._conn is not None:
+            self._conn.close()
+        self._proc = None
+        self._conn = None
@@ -0,0 +1,349 @@
+import numpy as np
+
+from graphcore.scale import SciFormatter
+
+# 1ピクセル列あたりの点数がこれを超える系列だけ間引く
+LOD_POINTS_PER_PIXEL = 4
+
+
+def decimate_minmax(x, y, n_bins, x_range=None, log_x=False, valid=None):
+    """ピクセル列ごとにyの最小点・最大点だけを残すインデックスを返す (LOD)
+
+    valid (bool 配列) を渡すと True の点だけを対象にする。
+    """
+    n = len(x)
+    if n == 0 or n_bins <= 0:
+        return np.arange(n) if valid is None else np.flatnonzero(valid)
+
+    if log_x:
+        # 対数軸では x <= 0 の点はもともと表示されない
+        bx = np.full(n, np.nan)
+        np.log10(x, out=bx, where=x > 0)
+    else:
+        bx = x
+    if x_range is not None:
+        lo, hi = x_range
+        if log_x:
+            lo, hi = np.log10(lo), np.log10(hi)
+        sel = (bx >= lo) & (bx <= hi)
+        visible = np.flatnonzero(sel if valid is None else sel & valid)
+    else:
+        if log_x:
+            sel = np.isfinite(bx)
+            visible = np.flatnonzero(sel if valid is None else sel & valid)
+        else:
+            visible = np.arange(n) if valid is None else np.flatnonzero(valid)
+        if len(visible) == 0:
+            return visible
+        lo, hi = bx[visible].min(), bx[visible].max()
+
+    if len(visible) <= n_bins * LOD_POINTS_PER_PIXEL or hi <= lo:
+        return visible
+
+    bins = ((bx[visible] - lo) / (hi - lo) * n_bins).astype(np.int64)
+    np.clip(bins, 0, n_bins - 1, out=bins)
+
+    # ビン番号 → y の順に並べ、各ビンの先頭(最小)と末尾(最大)を拾う
+    order = np.lexsort((y[visible], bins))
+    sorted_bins = bins[order]
+    first = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    keep = visible[order[np.r_[first, last]]]
+
+    # 自動スケールが変わらないようにxの両端も残す
+    keep = np.r_[keep, visible[np.argmin(bx[visible])], visible[np.argmax(bx[visible])]]
+    return np.unique(keep)
+
+
+def draw_base(ax, spec, n_bins=None):
+    """散布図・移動統計・軸・書式・プロット凡例を描く (近似直線は除く)
+
+    n_bins を渡すと表示用に間引く。系列の x, y は列全体で、描くのは s['valid'] の点だけ。
+    ([(列名, scatter, x全体, y全体, 有効マスク), ...], [(移動統計の線, x全体, y全体), ...]) を返す。
+    """
+    drawn = []
+    plot_handles = []
+    plot_labels = []
+    for s in spec['series']:
+        if n_bins is None:
+            idx = s['valid']
+        else:
+            idx = decimate_minmax(s['x'], s['y'], n_bins, log_x=spec['x_log'], valid=s['valid'])
+        sc = ax.scatter(s['x'][idx], s['y'][idx], label=s['name'], s=spec['marker_size'],
+                        color=s['color'], alpha=0.8, zorder=3)
+        drawn.append((s['name'], sc, s['x'], s['y'], s['valid']))
+        plot_handles.append(sc)
+        plot_labels.append(s['name'])
+
+    # 移動統計 (X でソート済みなので、間引いても線の順序は崩れない)
+    rolling = []
+    for r in spec['rolling']:
+        idx = slice(None) if n_bins is None else decimate_minmax(r['x'], r['y'], n_bins, log_x=spec['x_log'])
+        line, = ax.plot(r['x'][idx], r['y'][idx], color=r['color'], linestyle=r['linestyle'],
+                        linewidth=1.5, zorder=4)
+        rolling.append((line, r['x'], r['y']))
+        if r['label'] is not None:
+            plot_handles.append(line)
+            plot_labels.append(r['label'])
+
+    # x=0, y=0 のラインを強調 (ログスケールの場合は無視)
+    if not spec['x_log'] and not spec['y_log']:
+        ax.axhline(0, color='gray', linewidth=1.0, zorder=1)
+        ax.axvline(0, color='gray', linewidth=1.0, zorder=1)
+
+    if spec['x_log']:
+        ax.set_xscale('log')
+    if spec['y_log']:
+        ax.set_yscale('log')
+
+    if spec['grid']:
+        ax.grid(True, which='major', linestyle='-', linewidth=0.5, color='#bfbfbf', alpha=1.0, zorder=0)
+        ax.set_axisbelow(True)
+    else:
+        ax.grid(False)
+
+    ax.set_xlabel(spec['xlabel'], fontsize=spec['font_size'] * 1.5)
+    ax.set_ylabel(spec['ylabel'], fontsize=spec['font_size'] * 1.5)
+
+    # 指数表記 (ログスケールでない場合のみ適用)
+    if spec['exponent'] is not None:
+        ax.yaxis.set_major_formatter(SciFormatter(spec['exponent']))
+
+    # プロット凡例 (右上) - データが2つ以上ある場合のみ
+    if len(plot_handles) > 1:
+        l1 = ax.legend(plot_handles, plot_labels, loc='upper right', fontsize=spec['font_size']*1.2, frameon=True)
+        ax.add_artist(l1)
+        ax.legend_ = None
+    return drawn, rolling
+
+
+def add_fit_legend(ax, lines, font_size):
+    """近似直線凡例 (右下) - 重複しないようにラベルを追加"""
+    fit_handles = []
+    fit_labels = []
+    for line in lines:
+        label = line.get_label()
+        if label not in fit_labels:
+            fit_handles.append(line)
+            fit_labels.append(label)
+    if not fit_handles:
+        return None
+    return ax.legend(fit_handles, fit_labels, loc='lower right', fontsize=font_size*1.2, frameon=True)
+
+
+def draw_fit_band(ax, fit, animated=False):
+    """近似曲線の信頼区間 (塗りつぶし) と予測区間 (点線) を描き、アーティストのリストを返す"""
+    band = fit.get('band')
+    if band is None:
+        return []
+    artists = [ax.fill_between(fit['x'], *band['conf'], color=fit['color'], alpha=0.15,
+                               linewidth=0, zorder=1.5, animated=animated)]
+    for y in band['pred']:
+        line, = ax.plot(fit['x'], y, color=fit['color'], linestyle=':', linewidth=1.0,
+                        alpha=0.7, zorder=1.5, animated=animated)
+        artists.append(line)
+    return artists
+
+
+def draw_static(fig, spec, view=None):
+    """画面とは別の Figure に spec を全点で描く (書き出し用。別スレッドから呼んでよい)
+
+    view は画面の表示範囲 ((xmin, xmax), (ymin, ymax))。ズーム中の見た目をそのまま保存する。
+    """
+    ax = fig.add_subplot()
+    draw_base(ax, spec)
+    lines = []
+    for fit in spec['fits']:
+        draw_fit_band(ax, fit)
+        line, = ax.plot(fit['x'], fit['y'], color=fit['color'], linestyle='--', linewidth=2.0,
+                        alpha=0.9, label=fit['label'], zorder=2)
+        lines.append(line)
+    add_fit_legend(ax, lines, spec['font_size'])
+    if view is not None:
+        ax.set_xlim(view[0])
+        ax.set_ylim(view[1])
+    fig.tight_layout()
+    return fig
+
+
+class PlotRenderer:
+    """散布図・近似直線のアーティストを保持し、差分だけ更新する描画エンジン
+
+    構造 (列・対数軸・書式) が変わった時だけ Axes を作り直し、
+    近似直線とその凡例は animated アーティストとしてブリットで重ね描きする。
+    信頼区間・予測区間は本数が少ないので、更新のたびに作り直す。
+    """
+
+    def __init__(self, fig, ax, canvas):
+        self.fig = fig
+        self.ax = ax
+        self.canvas = canvas
+
+        self._key = None
+        self._spec = None
+        self._series = {}      # 列名 -> (scatter, x全体, y全体, 有効マスク)
+        self._rolling = []     # 移動統計 [(線, x全体, y全体), ...]
+        self._fit_lines = []   # 近似直線 (animated)
+        self._fit_bands = []   # 信頼区間・予測区間 (animated)
+        self._fit_legend = None
+        self._range_lines = []  # 近似範囲マーカー (animated)
+        self._background = None
+
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    # --- 公開API ---
+
+    def render(self, spec):
+        """描画仕様 spec を反映する。構造が同じならブリットのみで済ませる"""
+        key = self._structure_key(spec)
+        if key != self._key:
+            self._rebuild(spec)
+            self._key = key
+            self._spec = spec
+            self.fig.tight_layout()
+            self.canvas.draw()
+            return
+
+        labels_changed = (spec['xlabel'], spec['ylabel']) != (self._spec['xlabel'], self._spec['ylabel'])
+        self._spec = spec
+        self._update_fits(spec['fits'], spec['font_size'])
+
+        if labels_changed:
+            self.ax.set_xlabel(spec['xlabel'], fontsize=spec['font_size'] * 1.5)
+            self.ax.set_ylabel(spec['ylabel'], fontsize=spec['font_size'] * 1.5)
+            self.fig.tight_layout()
+            self.canvas.draw()
+        else:
+            self.blit_overlays()
+
+    def clear(self):
+        """データが無い状態に戻す"""
+        self.ax.clear()
+        self._key = None
+        self._spec = None
+        self._series = {}
+        self._rolling = []
+        self._fit_lines = []
+        self._fit_bands = []
+        self._fit_legend = None
+        self._range_lines = []
+        self.canvas.draw()
+
+    def show_range(self, r_min, r_max):
+        """スライダーで選択中の範囲を縦線で示す (近似計算を待たずにブリット)"""
+        if self._spec is None:
+            return
+        if not self._range_lines:
+            self._range_lines = [
+                self.ax.axvline(v, color='#0078d7', linestyle=':', linewidth=1.5, zorder=4, animated=True)
+                for v in (r_min, r_max)
+            ]
+        else:
+            for line, v in zip(self._range_lines, (r_min, r_max)):
+                line.set_xdata([v, v])
+        self.blit_overlays()
+
+    def blit_overlays(self):
+        """背景を復元して近似直線・凡例だけを描き直す"""
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_overlays()
+        self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+    def view(self):
+        """現在の表示範囲 ((xmin, xmax), (ymin, ymax))"""
+        return tuple(self.ax.get_xlim()), tuple(self.ax.get_ylim())
+
+    # --- 内部処理 ---
+
+    def _structure_key(self, spec):
+        return (
+            spec['data_token'],
+            tuple(s['name'] for s in spec['series']),
+            spec['x_log'], spec['y_log'], spec['grid'],
+            spec['marker_size'], spec['font_size'], spec['exponent'],
+            spec['rolling_key'],
+        )
+
+    def _rebuild(self, spec):
+        ax = self.ax
+        ax.clear()
+        self._series = {}
+        self._rolling = []
+        self._fit_lines = []
+        self._fit_bands = []
+        self._fit_legend = None
+        self._range_lines = []
+
+        # ax.clear() でコールバックも消えるので毎回つなぎ直す
+        ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+        drawn, self._rolling = draw_base(ax, spec, n_bins=max(int(ax.bbox.width), 1))
+        for name, sc, x, y, valid in drawn:
+            self._series[name] = (sc, x, y, valid)
+        self._update_fits(spec['fits'], spec['font_size'])
+
+    def _update_fits(self, fits, font_size):
+        """近似直線を set_data で更新し、本数の増減だけアーティストを作り直す"""
+        ax = self.ax
+        for artist in self._fit_bands:
+            artist.remove()
+        self._fit_bands = []
+        for fit in fits:
+            self._fit_bands.extend(draw_fit_band(ax, fit, animated=True))
+        while len(self._fit_lines) > len(fits):
+            self._fit_lines.pop().remove()
+        for i, fit in enumerate(fits):
+            if i < len(self._fit_lines):
+                line = self._fit_lines[i]
+                line.set_data(fit['x'], fit['y'])
+                line.set_color(fit['color'])
+                line.set_label(fit['label'])
+            else:
+                line, = ax.plot(fit['x'], fit['y'], color=fit['color'], linestyle='--', linewidth=2.0,
+                                alpha=0.9, label=fit['label'], zorder=2, animated=True)
+                self._fit_lines.append(line)
+
+        if self._fit_legend is not None:
+            self._fit_legend.remove()
+            self._fit_legend = None
+        self._fit_legend = add_fit_legend(ax, self._fit_lines, font_size)
+        if self._fit_legend is not None:
+            self._fit_legend.set_animated(True)
+
+    def _draw_overlays(self):
+        for artist in self._fit_bands:
+            self.ax.draw_artist(artist)
+        for line in self._fit_lines:
+            self.ax.draw_artist(line)
+        if self._fit_legend is not None:
+            self.ax.draw_artist(self._fit_legend)
+        for line in self._range_lines:
+            self.ax.draw_artist(line)
+
+    def _on_draw(self, event):
+        # フル描画のたびに背景を取り直し、animated なアーティストを重ねる
+        # (savefig 中は解像度が違うので取り直さない)
+        if self.canvas.is_saving():
+            return
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_overlays()
+
+    def _on_xlim_changed(self, ax):
+        # ズーム・パン時は表示範囲だけを間引き直す
+        if self._spec is None:
+            return
+        n_bins = max(int(ax.bbox.width), 1)
+        x_range = tuple(sorted(ax.get_xlim()))
+        x_log = self._spec['x_log']
+        if x_log and x_range[0] <= 0:
+            x_range = None
+        for sc, x, y, valid in self._series.values():
+            idx = decimate_minmax(x, y, n_bins, x_range=x_range, log_x=x_log, valid=valid)
+            sc.set_offsets(np.column_stack((x[idx], y[idx])))
+        for line, x, y in self._rolling:
+            idx = decimate_minmax(x, y, n_bins, x_range=x_range, log_x=x_log)
+            line.set_data(x[idx], y[idx])
@@ -0,0 +1,103 @@
+import time
+
+
+class RedrawScheduler:
+    """root.after を使って再描画要求をまとめるスケジューラ
+
+    軽い要求は次のフレーム (frame_ms) に1回だけ、重い要求 (近似計算など) は
+    最後の要求から idle_ms 経って操作が落ち着いてから実行する。
+    同じキーの要求は1回にまとめられ、その回数を coalesced として数える。
+    """
+
+    def __init__(self, root, frame_ms=16, idle_ms=120, on_stats=None):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.idle_ms = idle_ms
+        self.on_stats = on_stats
+
+        self._frame_tasks = {}  # キー -> 関数 (軽い処理)
+        self._idle_tasks = {}   # キー -> 関数 (重い処理)
+        self._frame_job = None
+        self._idle_job = None
+        self._last_frame = 0.0
+
+        # 統計
+        self.rendered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.last_ms = 0.0
+
+    def invalidate(self, key, func, heavy=False):
+        """key の再描画を予約する"""
+        if heavy:
+            if key in self._idle_tasks:
+                self.coalesced += 1
+            self._idle_tasks[key] = func
+            # 要求が来るたびに待ち時間をリセット (デバウンス)
+            if self._idle_job is not None:
+                self.root.after_cancel(self._idle_job)
+            self._idle_job = self.root.after(self.idle_ms, self._run_idle)
+        else:
+            if key in self._frame_tasks:
+                self.coalesced += 1
+            self._frame_tasks[key] = func
+            if self._frame_job is None:
+                wait = self.frame_ms - (time.perf_counter() - self._last_frame) * 1000
+                self._frame_job = self.root.after(max(int(wait), 0), self._run_frame)
+
+    def flush(self):
+        """予約済みの処理をすべて今すぐ実行する (保存前など)"""
+        if self._frame_job is not None:
+            self.root.after_cancel(self._frame_job)
+            self._frame_job = None
+        if self._idle_job is not None:
+            self.root.after_cancel(self._idle_job)
+            self._idle_job = None
+        tasks = dict(self._frame_tasks)
+        tasks.update(self._idle_tasks)
+        self._frame_tasks = {}
+        self._idle_tasks = {}
+        if tasks:
+            self._execute(tasks)
+
+    def stats(self):
+        return {
+            'rendered': self.rendered,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'last_ms': self.last_ms,
+        }
+
+    def _run_frame(self):
+        self._frame_job = None
+        tasks = self._frame_tasks
+        self._frame_tasks = {}
+        # 同じキーの重い処理が待っていれば、このフレームで済ませる
+        for key in tasks:
+            self._idle_tasks.pop(key, None)
+        if not self._idle_tasks and self._idle_job is not None:
+            self.root.after_cancel(self._idle_job)
+            self._idle_job = None
+        self._execute(tasks)
+
+    def _run_idle(self):
+        self._idle_job = None
+        tasks = self._idle_tasks
+        self._idle_tasks = {}
+        self._execute(tasks)
+
+    def _execute(self, tasks):
+        start = time.perf_counter()
+        for func in tasks.values():
+            func()
+        end = time.perf_counter()
+
+        self.last_ms = (end - start) * 1000
+        self.rendered += 1
+        # フレーム予算を超えた分だけ、描けなかったフレームとして数える
+        if self.last_ms > self.frame_ms:
+            self.dropped += int(self.last_ms // self.frame_ms)
+        self._last_frame = end
+
+        if self.on_stats:
+            self.on_stats(self.stats())
@@ -0,0 +1,315 @@
+"""常駐ツールサーバー: pandas / matplotlib / sympy を読み込み済みの Python を使い回す
+
+.bat から毎回新しい Python を起動すると、重いモジュールの読み込みだけで数秒かかる。
+サーバーはツールごとに「読み込みを済ませて待機している予備プロセス」を1つずつ用意しておき、
+起動要求が来たらそのプロセスに引数を渡して実行させ、すぐ次の予備を作る。
+ウィンドウはツールごとに別プロセスなので、Tk やスタイルの設定が混ざることはない。
+
+使い方:
+    python toolserver.py serve                  サーバーを起動 (前面で動く)
+    python toolserver.py run graphpro data.csv  ツールを起動 (サーバーが無ければ直接起動)
+    python toolserver.py run graphgen --batch data --spec job.json
+    python toolserver.py status / stop
+
+run はツールが終わるまで待ち、その出力を表示する (.bat の pause がそのまま使える)。
+graphgen の対話モードは入力が必要なので、サーバーを使わずに直接起動する。
+"""
+import os
+import sys
+import json
+import time
+import socket
+import secrets
+import argparse
+import threading
+import subprocess
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOOLS = {
+    "graphpro": os.path.join(BASE_DIR, "graphpro", "graphpro.py"),
+    "graphgen": os.path.join(BASE_DIR, "graphgen", "graph.py"),
+    "calcpro": os.path.join(os.path.dirname(BASE_DIR), "calc", "calc.py"),
+}
+
+# 予備プロセスで先に読み込んでおくモジュール
+WARM_MODULES = {
+    "graphpro": ["numpy", "pandas", "matplotlib.pyplot", "matplotlib.ticker",
+                 "matplotlib.backends.backend_tkagg", "openpyxl",
+                 "renderer", "graphcore.fitting", "graphcore.loader", "graphcore.frame_cache",
+                 "graphcore.column_store", "graphcore.columns"],
+    "graphgen": ["numpy", "pandas", "matplotlib.pyplot", "matplotlib.ticker", "openpyxl",
+                 "batch", "graphcore.loader", "graphcore.frame_cache", "graphcore.columns"],
+    "calcpro": ["sympy", "numpy", "matplotlib.pyplot", "matplotlib.backends.backend_tkagg"],
+}
+
+HOST = "127.0.0.1"
+PORT = int(os.environ.get("TOOLS_SERVER_PORT", "47615"))
+KEY_FILE = os.path.join(os.path.expanduser("~"), ".tools_server_key")
+CONNECT_TIMEOUT = 1.0
+
+
+# --- 予備プロセス ---
+
+def warm_up(tool):
+    """ツールで使うモジュールを読み込み、matplotlib のフォントなども一度使っておく"""
+    import importlib
+    for name in WARM_MODULES[tool]:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass  # 無いものはツール側で必要になった時にエラーになる
+    if "matplotlib.pyplot" in WARM_MODULES[tool]:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=(2, 2))
+        ax = fig.add_subplot()
+        ax.plot([0, 1], [0, 1], label="$x^2$")
+        ax.legend()
+        FigureCanvasAgg(fig).draw()
+    if tool == "calcpro":
+        import sympy
+        sympy.latex(sympy.sympify("sin(x)**2 + 1"))
+
+
+def run_spare(tool):
+    """読み込みを済ませてから標準入力の起動要求を1つ待ち、ツールを __main__ として実行する"""
+    import runpy
+    script = TOOLS[tool]
+    sys.path.insert(0, os.path.dirname(script))
+    warm_up(tool)
+
+    line = sys.stdin.readline()
+    if not line:
+        return 0  # 使われずに終了
+    request = json.loads(line)
+    os.chdir(request['cwd'])
+    sys.argv = [script] + request['argv']
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    return 0
+
+
+# --- サーバー ---
+
+def load_key(create=False):
+    """接続用の鍵 (ほかのユーザーのプロセスから操作されないように)"""
+    try:
+        with open(KEY_FILE, 'rb') as f:
+            return f.read()
+    except OSError:
+        if not create:
+            return None
+    key = secrets.token_bytes(32)
+    fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+class ToolServer:
+    """ツールごとに予備プロセスを1つ保ち、起動要求ごとに1つ渡す"""
+
+    def __init__(self, tools):
+        self.tools = tools
+        self._lock = threading.Lock()
+        self._spares = {}
+        self._running = True
+        for tool in tools:
+            self._spares[tool] = self._spawn(tool)
+
+    def _spawn(self, tool):
+        env = dict(os.environ, PYTHONIOENCODING="utf-8")
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "spare", tool],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            env=env, text=True, encoding="utf-8", errors="replace",
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+
+    def take(self, tool):
+        """予備プロセスを1つ取り出し、代わりを作る"""
+        with self._lock:
+            proc = self._spares[tool]
+            if proc.poll() is not None:  # 読み込みに失敗して終了していた
+                proc = self._spawn(tool)
+            self._spares[tool] = self._spawn(tool)
+        return proc
+
+    def handle(self, conn):
+        try:
+            request = conn.recv()
+            command = request.get('command')
+            if command == 'status':
+                conn.send({'tools': list(self.tools), 'pid': os.getpid()})
+            elif command == 'stop':
+                conn.send({'stopped': True})
+                self.stop()
+            elif command == 'run':
+                self.run_tool(conn, request)
+            else:
+                conn.send({'error': f"不明な要求: {command}"})
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def run_tool(self, conn, request):
+        tool = request['tool']
+        if tool not in self.tools:
+            conn.send({'error': f"このサーバーでは {tool} を起動できません"})
+            return
+        start = time.perf_counter()
+        proc = self.take(tool)
+        try:
+            proc.stdin.write(json.dumps({'argv': request['argv'], 'cwd': request['cwd']}) + "\n")
+            proc.stdin.close()
+        except OSError as e:
+            conn.send({'error': f"予備プロセスに渡せませんでした: {e}"})
+            return
+        conn.send({'started': True, 'pid': proc.pid, 'seconds': time.perf_counter() - start})
+
+        # 出力を依頼元へ流す。依頼元が閉じても最後まで読み捨てる (パイプを詰まらせない)
+        client_alive = True
+        for line in proc.stdout:
+            if client_alive:
+                try:
+                    conn.send({'output': line})
+                except OSError:
+                    client_alive = False
+        code = proc.wait()
+        if client_alive:
+            try:
+                conn.send({'done': True, 'code': code})
+            except OSError:
+                pass
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            for proc in self._spares.values():
+                if proc.poll() is None:
+                    proc.stdin.close()  # 要求なしで閉じると予備プロセスはそのまま終わる
+        # accept() で待っている serve() を起こす
+        try:
+            socket.create_connection((HOST, PORT), timeout=CONNECT_TIMEOUT).close()
+        except OSError:
+            pass
+
+    def serve(self, listener):
+        while self._running:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # 認証できない接続 (stop() の起こし用を含む) は無視する
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+def serve(tools):
+    key = load_key(create=True)
+    server = ToolServer(tools)
+    with Listener((HOST, PORT), authkey=key) as listener:
+        print(f"ツールサーバー起動: {HOST}:{PORT} ({', '.join(tools)})", flush=True)
+        server.serve(listener)
+    return 0
+
+
+# --- クライアント ---
+
+def connect():
+    """サーバーにつなぐ (動いていなければ None)"""
+    key = load_key()
+    if key is None:
+        return None
+    # Client() には待ち時間の指定が無いので、先にポートが開いているかだけ確かめる
+    try:
+        socket.create_connection((HOST, PORT), timeout=CONNECT_TIMEOUT).close()
+        return Client((HOST, PORT), authkey=key)
+    except OSError:
+        return None
+
+
+def start_server_background():
+    """次回のためにサーバーを裏で起動しておく"""
+    python = sys.executable
+    if os.name == 'nt':
+        pythonw = os.path.join(os.path.dirname(python), "pythonw.exe")
+        if os.path.exists(pythonw):
+            python = pythonw
+    flags = getattr(subprocess, "DETACHED_PROCESS", 0) | getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+    kwargs = {'creationflags': flags} if os.name == 'nt' else {'start_new_session': True}
+    subprocess.Popen([python, os.path.abspath(__file__), "serve"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+
+
+def run_local(tool, argv):
+    return subprocess.call([sys.executable, TOOLS[tool]] + argv)
+
+
+def run(tool, argv, autostart=True):
+    # 対話モードの graphgen はこのコンソールで入力を受けるので直接起動する
+    interactive = tool == "graphgen" and not (argv and argv[0] == "--batch")
+    conn = None if interactive else connect()
+    if conn is None:
+        if autostart and not interactive and os.environ.get("TOOLS_SERVER") != "0":
+            start_server_background()
+        return run_local(tool, argv)
+
+    with conn:
+        conn.send({'command': 'run', 'tool': tool, 'argv': argv, 'cwd': os.getcwd()})
+        reply = conn.recv()
+        if 'error' in reply:
+            print(f"ツールサーバー: {reply['error']} (直接起動します)")
+            return run_local(tool, argv)
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return 1
+            if 'output' in message:
+                sys.stdout.write(message['output'])
+                sys.stdout.flush()
+            elif message.get('done'):
+                return message['code']
+
+
+def request(command):
+    conn = connect()
+    if conn is None:
+        print("ツールサーバーは動いていません")
+        return 1
+    with conn:
+        conn.send({'command': command})
+        print(conn.recv())
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="常駐ツールサーバー")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="サーバーを起動する")
+    p_serve.add_argument("--tools", nargs="*", default=list(TOOLS), choices=list(TOOLS))
+    p_run = sub.add_parser("run", help="ツールを起動する")
+    p_run.add_argument("tool", choices=list(TOOLS))
+    p_run.add_argument("--no-autostart", action="store_true", help="サーバーが無い時に裏で起動しない")
+    p_run.add_argument("args", nargs=argparse.REMAINDER)
+    sub.add_parser("status", help="サーバーの状態を表示する")
+    sub.add_parser("stop", help="サーバーを止める")
+    p_spare = sub.add_parser("spare", help=argparse.SUPPRESS)
+    p_spare.add_argument("tool", choices=list(TOOLS))
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve(args.tools)
+    if args.command == "run":
+        return run(args.tool, args.args, autostart=not args.no_autostart)
+    if args.command == "spare":
+        return run_spare(args.tool)
+    return request(args.command)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
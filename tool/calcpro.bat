@@ -1 +1 @@
-@python "C:\tools\calc\calc.py" %*
\ No newline at end of file
+@if exist "C:\tools\graph\toolserver.py" (python "C:\tools\graph\toolserver.py" run calcpro %*) else (python "C:\tools\calc\calc.py" %*)
\ No newline at end of file
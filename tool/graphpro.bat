@@ -7,6 +7,8 @@ rem  重要: 下のパスを実際のPythonファイルの場所に書き換え
 rem  例: C:\tools\graph\interactive_graph.py
 rem ========================================================
 set PYTHON_SCRIPT="C:\tools\graph\graphpro\graphpro.py"
+rem 常駐ツールサーバー (読み込み済みの Python を使い回して起動を速くする)
+set TOOL_SERVER="C:\tools\graph\toolserver.py"
 
 rem スクリプトが存在するか確認
 if not exist %PYTHON_SCRIPT% (
@@ -17,8 +19,12 @@ if not exist %PYTHON_SCRIPT% (
     exit /b
 )
 
-rem Pythonを実行
-python %PYTHON_SCRIPT% %*
+rem Pythonを実行 (ツールサーバーがあればそれ経由。動いていなければ直接起動される)
+if exist %TOOL_SERVER% (
+    python %TOOL_SERVER% run graphpro %*
+) else (
+    python %PYTHON_SCRIPT% %*
+)
 
 rem 実行後に一時停止（エラー確認用）
 pause
\ No newline at end of file